@@ -8,8 +8,8 @@ from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_login import LoginManager
 
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging (DEBUG logs every VK call and cache hit; opt in with LOG_LEVEL=DEBUG)
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
 class Base(DeclarativeBase):
@@ -20,7 +20,13 @@ db = SQLAlchemy(model_class=Base)
 # create the app
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "default_secret_key_for_development")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)  # needed for url_for to generate with https
+# Trust X-Forwarded-* (https in url_for, client address for the reader
+# limiter) only from the given number of reverse proxies in front of the app;
+# without one, clients could spoof the headers
+app.config["TRUSTED_PROXY_COUNT"] = int(os.environ.get("TRUSTED_PROXY_COUNT", "0"))
+if app.config["TRUSTED_PROXY_COUNT"] > 0:
+    proxies = app.config["TRUSTED_PROXY_COUNT"]
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies, x_host=proxies)
 
 # Configure the PostgreSQL database
 database_url = os.environ.get("DATABASE_URL", "sqlite:///fallback.db")
@@ -32,15 +38,110 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_recycle": 300,
     "pool_pre_ping": True,
 }
+# Cooperative (gevent) workers run many requests per process, each holding a
+# pooled connection while it queries; size the pool to WEB_WORKER_CONNECTIONS
+if os.environ.get("DB_POOL_SIZE"):
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"]["pool_size"] = int(os.environ["DB_POOL_SIZE"])
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"]["max_overflow"] = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
 # VK API configuration
 app.config["VK_API_TOKEN"] = os.environ.get("VK_API_TOKEN", "")
+# Optional token pool: comma-separated tokens, each optionally suffixed with '@<requests per second>'
+app.config["VK_API_TOKENS"] = [t.strip() for t in os.environ.get("VK_API_TOKENS", "").split(",") if t.strip()] or [app.config["VK_API_TOKEN"]]
 app.config["VK_API_VERSION"] = "5.131"  # Use a stable VK API version
+app.config["VK_API_URL"] = os.environ.get("VK_API_URL", "https://api.vk.com/method/")  # Override for a proxy or a test double
+app.config["VK_API_TIMEOUT"] = float(os.environ.get("VK_API_TIMEOUT", "30"))  # Seconds to connect and between bytes
+app.config["VK_API_RATE_LIMIT"] = float(os.environ.get("VK_API_RATE_LIMIT", "3"))  # Requests per second per token
+app.config["VK_TOKEN_AUTH_COOLDOWN"] = int(os.environ.get("VK_TOKEN_AUTH_COOLDOWN", "3600"))  # After error 5
+app.config["VK_TOKEN_FLOOD_COOLDOWN"] = int(os.environ.get("VK_TOKEN_FLOOD_COOLDOWN", "1"))  # After error 6
+app.config["VK_TOKEN_QUOTA_COOLDOWN"] = int(os.environ.get("VK_TOKEN_QUOTA_COOLDOWN", "3600"))  # After error 29
+# Fair sharing of the VK API capacity between users: calls admitted at once
+# per token, and per-user weights as "username:weight,..." (default 1)
+app.config["VK_SCHEDULER_SLOTS_PER_TOKEN"] = int(os.environ.get("VK_SCHEDULER_SLOTS_PER_TOKEN", "2"))
+app.config["VK_QUOTA_WEIGHTS"] = {name.strip(): float(weight) for name, _, weight in
+                                  (entry.partition(":") for entry in os.environ.get("VK_QUOTA_WEIGHTS", "").split(","))
+                                  if name.strip() and weight}
+
+# Users allowed to see service-wide statistics (comma-separated usernames)
+app.config["ADMIN_USERNAMES"] = [u.strip() for u in os.environ.get("ADMIN_USERNAMES", "").split(",") if u.strip()]
 
 # RSS configuration
 app.config["SITE_URL"] = os.environ.get("SITE_URL", "http://localhost:5000")
 app.config["FEED_CACHE_TIMEOUT"] = int(os.environ.get("FEED_CACHE_TIMEOUT", "300"))  # 5 minutes
+app.config["FEED_CACHE_MAX_BYTES"] = int(os.environ.get("FEED_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))  # Compressed, all feeds
+app.config["CACHE_SWEEP_INTERVAL"] = int(os.environ.get("CACHE_SWEEP_INTERVAL", "600"))  # Seconds between cache sweeps
+
+# Feeds per dashboard page (and default page size of /api/feeds)
+app.config["DASHBOARD_PAGE_SIZE"] = int(os.environ.get("DASHBOARD_PAGE_SIZE", "50"))
+app.config["PREVIEW_PAGE_SIZE"] = int(os.environ.get("PREVIEW_PAGE_SIZE", "10"))  # Feed preview entries per page
+
+# Optional caching proxy for photo and document attachments (/media/...)
+app.config["MEDIA_PROXY_ENABLED"] = os.environ.get("MEDIA_PROXY_ENABLED", "0") == "1"
+app.config["MEDIA_CACHE_DIR"] = os.environ.get("MEDIA_CACHE_DIR", os.path.join(app.instance_path, "media"))
+app.config["MEDIA_CACHE_MAX_BYTES"] = int(os.environ.get("MEDIA_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+app.config["MEDIA_MAX_FILE_BYTES"] = int(os.environ.get("MEDIA_MAX_FILE_BYTES", str(50 * 1024 * 1024)))
+app.config["MEDIA_TIMEOUT"] = int(os.environ.get("MEDIA_TIMEOUT", "15"))
+
+# Static snapshots: builds of recently read feeds also write the feed (plus
+# .gz/.br variants) into SNAPSHOT_DIR for the web server to serve directly;
+# see snapshot.py
+app.config["SNAPSHOT_ENABLED"] = os.environ.get("SNAPSHOT_ENABLED", "0") == "1"
+app.config["SNAPSHOT_DIR"] = os.environ.get("SNAPSHOT_DIR", os.path.join(app.instance_path, "snapshots"))
+app.config["SNAPSHOT_IDLE_TIMEOUT"] = int(os.environ.get("SNAPSHOT_IDLE_TIMEOUT", "86400"))  # Seconds a snapshot is kept fresh after a read through the app
+
+# Per feed and token reader throttling on /feeds/<id>.rss (sliding windows
+# in a shared memory file, common to all workers of a host)
+app.config["READER_LIMIT_ENABLED"] = os.environ.get("READER_LIMIT_ENABLED", "1") == "1"
+app.config["READER_LIMIT_REQUESTS"] = int(os.environ.get("READER_LIMIT_REQUESTS", "30"))  # Per window
+app.config["READER_LIMIT_WINDOW"] = int(os.environ.get("READER_LIMIT_WINDOW", "300"))  # Seconds
+app.config["READER_LIMIT_SLOTS"] = int(os.environ.get("READER_LIMIT_SLOTS", "8192"))
+app.config["READER_LIMIT_DIR"] = os.environ.get("READER_LIMIT_DIR", "")  # Default: /dev/shm
+
+# Optional per-feed machine translation of posts; off by default since the
+# default backend sends post texts to a third-party service (MyMemory)
+app.config["TRANSLATION_ENABLED"] = os.environ.get("TRANSLATION_ENABLED", "0") == "1"
+app.config["TRANSLATION_BACKEND"] = os.environ.get("TRANSLATION_BACKEND", "translate")  # 'translate', 'local' or 'module:Class'
+app.config["TRANSLATION_PROVIDER"] = os.environ.get("TRANSLATION_PROVIDER", "")  # translate package provider, default MyMemory
+app.config["TRANSLATION_API_KEY"] = os.environ.get("TRANSLATION_API_KEY", "")
+app.config["TRANSLATION_EMAIL"] = os.environ.get("TRANSLATION_EMAIL", "")  # Raises the MyMemory daily quota
+app.config["TRANSLATION_SOURCE_LANG"] = os.environ.get("TRANSLATION_SOURCE_LANG", "ru")
+app.config["TRANSLATION_MAX_WORKERS"] = int(os.environ.get("TRANSLATION_MAX_WORKERS", "4"))  # Concurrent requests
+
+# Entry authors: names from wall.get extended data, with missing ones
+# batched into users.get/groups.getById and cached per process
+app.config["AUTHOR_NAMES_ENABLED"] = os.environ.get("AUTHOR_NAMES_ENABLED", "1") == "1"
+app.config["PROFILE_CACHE_TTL"] = int(os.environ.get("PROFILE_CACHE_TTL", "86400"))  # Seconds
+app.config["PROFILE_CACHE_MAX_ENTRIES"] = int(os.environ.get("PROFILE_CACHE_MAX_ENTRIES", "100000"))
+
+# Reposted originals (copy_history) cache shared by all feeds: entries are
+# refreshed after ORIGINAL_POST_TTL and deleted when unused for ORIGINAL_POST_MAX_AGE
+app.config["ORIGINAL_POST_TTL"] = int(os.environ.get("ORIGINAL_POST_TTL", "86400"))  # Seconds
+app.config["ORIGINAL_POST_MAX_AGE"] = int(os.environ.get("ORIGINAL_POST_MAX_AGE", str(7 * 86400)))  # Seconds
+
+# Keyword filters: maximum wall.get pages (100 posts each) read to fill a filtered feed
+app.config["FILTER_MAX_PAGES"] = int(os.environ.get("FILTER_MAX_PAGES", "5"))
+
+# History backfill for archive feeds (wall.get is paged by offset in a background thread)
+app.config["BACKFILL_ENABLED"] = os.environ.get("BACKFILL_ENABLED", "1") == "1"
+app.config["BACKFILL_PAGES_PER_RUN"] = int(os.environ.get("BACKFILL_PAGES_PER_RUN", "10"))
+app.config["BACKFILL_MAX_POSTS"] = int(os.environ.get("BACKFILL_MAX_POSTS", "10000"))
+app.config["ARCHIVE_CACHE_MAX_AGE"] = int(os.environ.get("ARCHIVE_CACHE_MAX_AGE", "86400"))  # Seconds clients keep archive pages
+
+# WebSub hub and background refresh of push-subscribed feeds
+app.config["WEBSUB_LEASE_SECONDS"] = int(os.environ.get("WEBSUB_LEASE_SECONDS", str(10 * 24 * 3600)))
+app.config["WEBSUB_MAX_LEASE_SECONDS"] = int(os.environ.get("WEBSUB_MAX_LEASE_SECONDS", str(30 * 24 * 3600)))
+app.config["WEBSUB_MAX_WORKERS"] = int(os.environ.get("WEBSUB_MAX_WORKERS", "8"))
+app.config["WEBSUB_MAX_RETRIES"] = int(os.environ.get("WEBSUB_MAX_RETRIES", "3"))
+app.config["WEBSUB_TIMEOUT"] = int(os.environ.get("WEBSUB_TIMEOUT", "10"))
+app.config["BACKGROUND_REFRESH_ENABLED"] = os.environ.get("BACKGROUND_REFRESH_ENABLED", "1") == "1"
+app.config["REFRESH_INTERVAL"] = int(os.environ.get("REFRESH_INTERVAL", "60"))  # Seconds between refresh passes
+app.config["REFRESH_BATCH_SIZE"] = int(os.environ.get("REFRESH_BATCH_SIZE", "50"))  # Feeds claimed per worker and pass
+app.config["REFRESH_LEASE_SECONDS"] = int(os.environ.get("REFRESH_LEASE_SECONDS", "120"))  # Refresh lease lifetime
+app.config["FEED_BUILD_WAIT_SECONDS"] = int(os.environ.get("FEED_BUILD_WAIT_SECONDS", "15"))  # Wait for a first build running elsewhere
+
+# Search configuration (PostgreSQL text search configuration for tsvector)
+app.config["SEARCH_TS_CONFIG"] = os.environ.get("SEARCH_TS_CONFIG", "simple")
 
 # Initialize Flask-Login
 login_manager = LoginManager()
@@ -55,13 +156,27 @@ with app.app_context():
     # Import routes after app is created to avoid circular imports
     import routes  # noqa: F401
     
-    # Make sure to import the models here or their tables won't be created
+    # Make sure to import the models here so they are registered with the app
     import models  # noqa: F401
     
-    # Create database tables
-    db.create_all()
+    # Command line commands (flask init-db, ...); tables are no longer
+    # created on import, run `flask --app app init-db` once per deploy
+    import cli  # noqa: F401
+
+_background_workers_started = False
+
+@app.before_request
+def start_background_workers():
+    """Start background threads on the first request instead of at import."""
+    global _background_workers_started
+    if _background_workers_started:
+        return
+    _background_workers_started = True
     
-    logger.info("Database tables created")
+    # Refresh push-subscribed feeds in the background
+    if app.config["BACKGROUND_REFRESH_ENABLED"]:
+        from refresh import feed_refresher
+        feed_refresher.start(app)
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -0,0 +1,312 @@
+import hashlib
+import json
+import logging
+import queue
+import re
+import threading
+from datetime import datetime
+
+from flask import current_app, url_for
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from models import VKPost, BackfillState, ArchivePage
+from vk_api import VKAPIClient, WALL_GET_MAX_COUNT
+from post_store import store_posts, get_owner_ids
+from leases import claim_lease, release_lease, keep_leases, source_lease_key
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# Archive pages cover one calendar month (UTC) each
+PERIOD_RE = re.compile(r'^\d{4}-(0[1-9]|1[0-2])$')
+
+def period_of(dt):
+    """Return the archive period ('YYYY-MM') containing a datetime."""
+    return dt.strftime('%Y-%m')
+
+def period_bounds(period):
+    """
+    Get the time range of an archive period.
+    
+    Args:
+        period: Period in 'YYYY-MM' format
+        
+    Returns:
+        Tuple (start, end) of naive UTC datetimes, end exclusive
+    """
+    year, month = (int(part) for part in period.split('-'))
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start, end
+
+def get_period_before(owner_ids, period):
+    """
+    Get the newest period before the given one that has stored posts.
+    
+    Empty months are skipped so archive chains only link pages with entries.
+    
+    Args:
+        owner_ids: List of VK owner IDs
+        period: Period in 'YYYY-MM' format
+        
+    Returns:
+        Period string, or None if there are no older posts
+    """
+    if not owner_ids:
+        return None
+    start, _ = period_bounds(period)
+    newest = (db.session.query(func.max(VKPost.published_at))
+              .filter(VKPost.owner_id.in_(owner_ids), VKPost.published_at < start)
+              .scalar())
+    return period_of(newest) if newest else None
+
+def get_period_after(owner_ids, period):
+    """
+    Get the oldest period after the given one that has stored posts.
+    
+    Args:
+        owner_ids: List of VK owner IDs
+        period: Period in 'YYYY-MM' format
+        
+    Returns:
+        Period string, or None if there are no newer posts
+    """
+    if not owner_ids:
+        return None
+    _, end = period_bounds(period)
+    oldest = (db.session.query(func.min(VKPost.published_at))
+              .filter(VKPost.owner_id.in_(owner_ids), VKPost.published_at >= end)
+              .scalar())
+    return period_of(oldest) if oldest else None
+
+def is_period_complete(period, source_keys, now=None):
+    """
+    Check whether an archive period can no longer change.
+    
+    A period is complete once it has ended and the backfill of every source
+    has either read the whole wall or reached posts older than the period.
+    
+    Args:
+        period: Period in 'YYYY-MM' format
+        source_keys: Normalized keys of the feed's sources
+        now: Current time, defaults to utcnow
+        
+    Returns:
+        True if the period is complete
+    """
+    start, end = period_bounds(period)
+    if end > (now or datetime.utcnow()) or not source_keys:
+        return False
+    
+    states = {state.source_key: state for state in BackfillState.query.filter(BackfillState.source_key.in_(source_keys))}
+    for key in source_keys:
+        state = states.get(key)
+        if state is None:
+            return False
+        if state.completed_at is None and (state.oldest_published_at is None or state.oldest_published_at >= start):
+            return False
+    return True
+
+def get_latest_archive_period(source_keys):
+    """
+    Get the newest complete archive period of a feed.
+    
+    Args:
+        source_keys: Normalized keys of the feed's sources
+        
+    Returns:
+        Period string, or None if there is no complete archive page yet
+    """
+    latest = get_period_before(get_owner_ids(source_keys), period_of(datetime.utcnow()))
+    if latest is None or not is_period_complete(latest, source_keys):
+        return None
+    return latest
+
+def get_archive_page(generator, period):
+    """
+    Get the archive document of a feed period, rendering it on first use.
+    
+    Archive pages are only produced for complete periods and are stored
+    once rendered, so every later request is served from the database.
+    
+    Args:
+        generator: RSSFeedGenerator of the feed
+        period: Period in 'YYYY-MM' format
+        
+    Returns:
+        ArchivePage instance, or None if the period is not (yet) archived
+    """
+    feed = generator.feed_config
+    page = feed.archive_pages.filter_by(period=period).first()
+    if page:
+        return page
+    
+    source_keys = generator.get_source_keys()
+    owner_ids = get_owner_ids(source_keys)
+    if not owner_ids or not is_period_complete(period, source_keys):
+        return None
+    
+    start, end = period_bounds(period)
+    rows = (VKPost.query
+            .filter(VKPost.owner_id.in_(owner_ids), VKPost.published_at >= start, VKPost.published_at < end)
+            .order_by(VKPost.published_at.desc())
+            .all())
+    posts = [json.loads(row.data) for row in rows]
+    if generator.post_filter is not None:
+        posts = generator.post_filter.filter(posts)
+    
+    token = feed.access_token
+    links = [('current', url_for('get_feed', feed_id=feed.id, token=feed.access_token, _external=True))]
+    prev = get_period_before(owner_ids, period)
+    if prev:
+        links.append(('prev-archive', url_for('get_feed_archive', feed_id=feed.id, period=prev, token=token, _external=True)))
+    following = get_period_after(owner_ids, period)
+    if following and is_period_complete(following, source_keys):
+        links.append(('next-archive', url_for('get_feed_archive', feed_id=feed.id, period=following, token=token, _external=True)))
+    
+    document_url = url_for('get_feed_archive', feed_id=feed.id, period=period, token=token, _external=True)
+    source_info = generator.get_channel_info()
+    content = generator.render_posts(
+        posts,
+        source_info,
+        title=f"{feed.title} ({period})",
+        document_url=document_url,
+        links=links,
+        archive=True
+    )
+    
+    page = ArchivePage(
+        feed_id=feed.id,
+        period=period,
+        content=content,
+        etag=hashlib.sha1(content.encode('utf-8')).hexdigest()
+    )
+    db.session.add(page)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Rendered concurrently by another request
+        db.session.rollback()
+        page = feed.archive_pages.filter_by(period=period).first()
+    
+    return page
+
+def backfill_source(source_key, max_pages=None):
+    """
+    Page one source's wall history into VKPost, continuing where it stopped.
+    
+    Args:
+        source_key: Normalized source key
+        max_pages: Maximum number of wall.get pages to read in this run
+        
+    Returns:
+        True if there is nothing left to backfill for the source
+    """
+    max_pages = max_pages or current_app.config.get('BACKFILL_PAGES_PER_RUN', 10)
+    max_posts = current_app.config.get('BACKFILL_MAX_POSTS', 10000)
+    
+    state = BackfillState.query.filter_by(source_key=source_key).first()
+    if state is None:
+        state = BackfillState(source_key=source_key, next_offset=0)
+        db.session.add(state)
+    if state.completed_at is not None or (state.next_offset or 0) >= max_posts:
+        return True
+    
+    client = VKAPIClient()
+    for _ in range(max_pages):
+        response = client.get_wall_posts(source_key, count=WALL_GET_MAX_COUNT, offset=state.next_offset or 0)
+        items = (response or {}).get('items') or []
+        
+        store_posts(items, source_key)
+        state.next_offset = (state.next_offset or 0) + len(items)
+        if response:
+            state.total_count = response.get('count', state.total_count)
+        
+        # Pinned posts come first regardless of their date
+        dates = [datetime.utcfromtimestamp(post['date']) for post in items if post.get('date') and not post.get('is_pinned')]
+        if dates:
+            oldest = min(dates)
+            if state.oldest_published_at is None or oldest < state.oldest_published_at:
+                state.oldest_published_at = oldest
+        
+        if not items or state.next_offset >= (state.total_count or 0):
+            state.completed_at = datetime.utcnow()
+            break
+        if state.next_offset >= max_posts:
+            break
+    
+    db.session.commit()
+    logger.debug(f"Backfilled {source_key} up to offset {state.next_offset} of {state.total_count}")
+    return state.completed_at is not None or state.next_offset >= max_posts
+
+class BackfillWorker:
+    """Background thread backfilling sources one batch of pages at a time."""
+    
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        
+    def enqueue(self, app, source_key):
+        """
+        Queue a source for backfill; sources already queued are ignored.
+        
+        Args:
+            app: Flask application the worker runs under
+            source_key: Normalized source key
+        """
+        with self._lock:
+            if source_key in self._pending:
+                return
+            self._pending.add(source_key)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, args=(app,), name='vk-backfill', daemon=True)
+                self._thread.start()
+        self._queue.put(source_key)
+        
+    def _run(self, app):
+        while True:
+            source_key = self._queue.get()
+            done = True
+            try:
+                with app.app_context():
+                    # Another worker may already be backfilling this source
+                    lease_key = source_lease_key(source_key)
+                    owner = claim_lease(lease_key)
+                    if owner is not None:
+                        try:
+                            with keep_leases([lease_key], owner):
+                                done = backfill_source(source_key)
+                        finally:
+                            release_lease(lease_key, owner)
+            except Exception as e:
+                logger.exception(f"Backfill of {source_key} failed: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(source_key)
+            
+            # Re-queue at the back so every source makes progress in turn
+            if not done:
+                self.enqueue(app, source_key)
+
+backfill_worker = BackfillWorker()
+
+def schedule_backfill(source_keys):
+    """
+    Queue background backfill for sources whose history is not stored yet.
+    
+    Args:
+        source_keys: Normalized source keys
+    """
+    if not current_app.config.get('BACKFILL_ENABLED', True) or not source_keys:
+        return
+    
+    max_posts = current_app.config.get('BACKFILL_MAX_POSTS', 10000)
+    states = {state.source_key: state for state in BackfillState.query.filter(BackfillState.source_key.in_(source_keys))}
+    app = current_app._get_current_object()
+    for key in source_keys:
+        state = states.get(key)
+        if state is None or (state.completed_at is None and (state.next_offset or 0) < max_posts):
+            backfill_worker.enqueue(app, key)
@@ -0,0 +1,80 @@
+"""
+Post text rendering throughput benchmark.
+
+Renders large synthetic VK posts (mentions, hashtags, URLs, line breaks and
+HTML special characters) with the single-pass tokenizer used by
+format_post_content, and with an equivalent chain of re.sub calls for
+comparison.
+
+Usage:
+    python benchmarks/bench_post_text.py [--posts 100] [--size 20000] [--runs 5]
+"""
+import argparse
+import html
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from post_text import render_post_text  # noqa: E402
+
+WORDS = ['привет', 'hello', 'world', 'VK', 'новости', 'feed', 'R&D', '<tag>', '"quoted"', "it's"]
+MARKUP = ['[id{n}|Иван Петров]', '[club{n}|Группа]', '#хэштег{n}', '#news', 'https://example.com/p/{n}?a=1&b=2.', '\n']
+
+def make_post(size, rng):
+    """Build one synthetic post text of about ``size`` characters."""
+    parts = []
+    length = 0
+    while length < size:
+        if rng.random() < 0.1:
+            part = rng.choice(MARKUP).format(n=rng.randint(1, 10 ** 6))
+        else:
+            part = rng.choice(WORDS)
+        parts.append(part)
+        length += len(part) + 1
+    return ' '.join(parts)
+
+MENTION_RE = re.compile(r'\[(id|club|public|event)(\d+)\|([^\]\n]*)\]')
+URL_RE = re.compile(r'\bhttps?://[^\s<>"\'\[\]]+?(?=[.,!?:;)]*(?:\s|$))')
+HASHTAG_RE = re.compile(r'(?<![\w&])#(\w+(?:@\w+)?)')
+
+def render_chained(text):
+    """Reference implementation: escape, then one re.sub per construct."""
+    text = html.escape(text)
+    text = MENTION_RE.sub(lambda m: f'<a href="https://vk.com/{m.group(1)}{m.group(2)}" target="_blank">{m.group(3)}</a>', text)
+    text = URL_RE.sub(lambda m: f'<a href="{m.group(0)}" target="_blank">{m.group(0)}</a>', text)
+    text = HASHTAG_RE.sub(lambda m: f'<a href="https://vk.com/feed?section=search&amp;q=%23{m.group(1)}" target="_blank">#{m.group(1)}</a>', text)
+    return text.replace('\r\n', '\n').replace('\n', '<br />')
+
+def measure(render, posts, runs):
+    """Return the median seconds to render all posts once."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for text in posts:
+            render(text)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--posts', type=int, default=100, help='Posts per feed (default: 100)')
+    parser.add_argument('--size', type=int, default=20000, help='Characters per post (default: 20000)')
+    parser.add_argument('--runs', type=int, default=5, help='Timed runs (default: 5)')
+    args = parser.parse_args()
+    
+    rng = random.Random(42)
+    posts = [make_post(args.size, rng) for _ in range(args.posts)]
+    megabytes = sum(len(text.encode('utf-8')) for text in posts) / 1e6
+    
+    print(f"{args.posts} posts, {megabytes:.1f} MB of text, median of {args.runs} runs")
+    for name, render in (('single-pass tokenizer', render_post_text), ('chained re.sub', render_chained)):
+        seconds = measure(render, posts, args.runs)
+        print(f"  {name:<22} {seconds * 1000:8.1f} ms  {megabytes / seconds:6.1f} MB/s")
+
+if __name__ == '__main__':
+    main()
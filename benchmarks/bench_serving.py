@@ -0,0 +1,217 @@
+"""
+Connection capacity of sync versus gevent gunicorn workers.
+
+Starts gunicorn with each worker class against a temporary SQLite database
+and a local stand-in for the VK API that answers after --vk-latency
+seconds. Two kinds of clients run at once for --duration seconds:
+
+    pollers   fetch cached feeds from get_feed in a loop
+    checkers  call /api/check-vk-source, which waits on the VK API
+
+With sync workers every checker waiting on VK holds a whole worker and the
+pollers queue behind them; with gevent workers they share each process.
+The report shows throughput and latency of both client kinds per worker
+class.
+
+Usage:
+    python benchmarks/bench_serving.py [--workers 2] [--pollers 200] [--checkers 20]
+        [--feeds 50] [--vk-latency 0.5] [--duration 10] [--worker-classes sync,gevent]
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+REQUEST_TIMEOUT = 30
+USERNAME = 'bench'
+PASSWORD = 'bench'
+
+class FakeVKHandler(BaseHTTPRequestHandler):
+    """VK API stand-in answering every method after a fixed delay."""
+    
+    latency = 0.0
+    
+    def do_GET(self):
+        time.sleep(self.latency)
+        method = self.path.split('?', 1)[0].rsplit('/', 1)[-1]
+        if method == 'groups.getById':
+            response = [{'id': 1, 'name': 'Bench group', 'screen_name': 'bench', 'description': 'Benchmark group'}]
+        elif method == 'wall.get':
+            response = {'count': 20, 'items': [
+                {'id': i, 'owner_id': -1, 'from_id': -1, 'date': 1700000000 - i * 3600, 'text': f'Post {i}\n' + 'x' * 500}
+                for i in range(1, 21)
+            ]}
+        else:
+            response = []
+        body = json.dumps({'response': response}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+def seed_database(feeds):
+    """Create the schema, a user and ``feeds`` public feeds."""
+    from app import app, db
+    from cli import init_db
+    from models import User, VKFeed
+    
+    with app.app_context():
+        init_db()
+        user = User(username=USERNAME, email='bench@example.com')
+        user.set_password(PASSWORD)
+        db.session.add(user)
+        db.session.commit()
+        for i in range(feeds):
+            db.session.add(VKFeed(user_id=user.id, title=f'Bench {i}', vk_source_type='group',
+                                  vk_source_id=f'-{i + 1}', items_count=20, is_public=True))
+        db.session.commit()
+
+def request(port, method, path, body=None, headers=None):
+    """Make one request on a new connection and return (status, headers, body)."""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=REQUEST_TIMEOUT)
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, response, response.read()
+    finally:
+        connection.close()
+
+def login(port):
+    """Log in the benchmark user and return the session cookie."""
+    _, response, _ = request(port, 'POST', '/login', urlencode({'username': USERNAME, 'password': PASSWORD}),
+                             {'Content-Type': 'application/x-www-form-urlencoded'})
+    return response.getheader('Set-Cookie').split(';', 1)[0]
+
+def wait_for_server(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            request(port, 'GET', '/login')
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('gunicorn did not start')
+
+def run_clients(count, make_request, deadline, results):
+    """Run ``count`` client threads calling ``make_request`` until ``deadline``."""
+    def client():
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                ok = make_request() == 200
+            except OSError:
+                ok = False
+            results.append((ok, time.perf_counter() - start))
+    
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+def summarize(results, duration):
+    latencies = sorted(latency * 1000 for ok, latency in results if ok)
+    errors = sum(1 for ok, _ in results if not ok)
+    if not latencies:
+        return f"0 req/s, {errors} errors"
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return (f"{len(latencies) / duration:7.1f} req/s, p50 {statistics.median(latencies):7.1f} ms, "
+            f"p99 {p99:7.1f} ms, {errors} errors")
+
+def bench(worker_class, args, env):
+    """Start gunicorn with ``worker_class``, run the clients and print the results."""
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{args.port}',
+         '--workers', str(args.workers), '--timeout', '120', 'app:app'],
+        cwd=ROOT, env=dict(env, WEB_WORKER_CLASS=worker_class),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for_server(args.port)
+        # Build every feed once so pollers are served from the cache
+        FakeVKHandler.latency = 0.0
+        for feed_id in range(1, args.feeds + 1):
+            request(args.port, 'GET', f'/feeds/{feed_id}.rss')
+        cookie = login(args.port)
+        FakeVKHandler.latency = args.vk_latency
+        
+        def poll():
+            return request(args.port, 'GET', f'/feeds/{random.randint(1, args.feeds)}.rss')[0]
+        
+        def check():
+            return request(args.port, 'POST', '/api/check-vk-source',
+                           json.dumps({'source_type': 'group', 'source_id': '-1'}),
+                           {'Content-Type': 'application/json', 'Cookie': cookie})[0]
+        
+        poller_results = []
+        checker_results = []
+        deadline = time.monotonic() + args.duration
+        threads = (run_clients(args.pollers, poll, deadline, poller_results) +
+                   run_clients(args.checkers, check, deadline, checker_results))
+        for thread in threads:
+            thread.join()
+        
+        print(f"{worker_class} ({args.workers} workers):")
+        print(f"  pollers  {summarize(poller_results, args.duration)}")
+        print(f"  checkers {summarize(checker_results, args.duration)}")
+    finally:
+        process.terminate()
+        process.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--pollers', type=int, default=200)
+    parser.add_argument('--checkers', type=int, default=20)
+    parser.add_argument('--feeds', type=int, default=50)
+    parser.add_argument('--vk-latency', type=float, default=0.5)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--worker-classes', default='sync,gevent')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    
+    vk_server = ThreadingHTTPServer(('127.0.0.1', 0), FakeVKHandler)
+    vk_server.daemon_threads = True
+    threading.Thread(target=vk_server.serve_forever, daemon=True).start()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env.update({
+            'DATABASE_URL': f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            'LOG_LEVEL': 'WARNING',
+            'VK_API_URL': f'http://127.0.0.1:{vk_server.server_port}/method/',
+            'VK_API_TOKEN': 'bench',
+            'VK_API_RATE_LIMIT': '0',
+            'VK_SCHEDULER_SLOTS_PER_TOKEN': '1000',
+            'FEED_CACHE_TIMEOUT': '3600',
+            'BACKGROUND_REFRESH_ENABLED': '0',
+            'READER_LIMIT_ENABLED': '0',
+            'AUTHOR_NAMES_ENABLED': '0',
+            'DB_POOL_SIZE': '50',
+        })
+        os.environ.update(env)
+        seed_database(args.feeds)
+        
+        print(f"{args.pollers} pollers over {args.feeds} cached feeds, {args.checkers} checkers, "
+              f"VK latency {args.vk_latency * 1000:.0f} ms, {args.duration:.0f} s per run\n")
+        for worker_class in args.worker_classes.split(','):
+            bench(worker_class.strip(), args, env)
+    vk_server.shutdown()
+
+if __name__ == '__main__':
+    main()
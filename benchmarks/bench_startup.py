@@ -0,0 +1,62 @@
+"""
+Worker boot latency benchmark.
+
+Measures how long a fresh interpreter takes to import the app, which is what
+every gunicorn worker and autoscaled instance pays before serving traffic,
+and lists the slowest imports of one run.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 10] [--top 15]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def boot_once(env):
+    """Import the app in a fresh interpreter and return the wall time in ms."""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'import app'], cwd=ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000
+
+def slowest_imports(env, top):
+    """Return the ``top`` slowest cumulative imports as (ms, module) tuples."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT, env=env,
+                            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        imports.append((int(cumulative) / 1000, module.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        env.setdefault('LOG_LEVEL', 'WARNING')
+        
+        # Python-level warm-up so bytecode compilation is not measured
+        boot_once(env)
+        timings = [boot_once(env) for _ in range(args.runs)]
+        
+        print(f"import app: min {min(timings):.1f} ms, median {statistics.median(timings):.1f} ms, "
+              f"max {max(timings):.1f} ms over {args.runs} runs")
+        print("\nSlowest imports (cumulative):")
+        for ms, module in slowest_imports(env, args.top):
+            print(f"  {ms:8.1f} ms  {module}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Peak memory of decoding and rendering a wall.get page.
+
+Compares the previous path (``extended=1`` response loaded whole with
+``response.json()``) with the trimmed request decoded incrementally by
+ItemStream, for a synthetic 100-post wall with heavy attachments. Each
+run decodes the page and renders every post with format_post_content; a
+feed build keeps its posts, compacted, until it renders them. Peak memory
+is measured with tracemalloc.
+
+Usage:
+    python benchmarks/bench_wall_memory.py [--posts 100] [--attachments 10] [--profiles 200]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('BACKGROUND_REFRESH_ENABLED', '0')
+
+from app import app  # noqa: E402
+from vk_api import ItemStream, compact_post, format_post_content  # noqa: E402
+
+class FakeResponse:
+    """Minimal stand-in for a requests response over an in-memory body."""
+    
+    def __init__(self, body):
+        self.body = body
+    
+    def json(self):
+        # requests decodes the whole body to text, then parses it
+        return json.loads(self.body.decode('utf-8'))
+    
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+    
+    def close(self):
+        pass
+
+def make_photo(rng, owner_id):
+    sizes = [{'type': t, 'width': w, 'height': w * 3 // 4,
+              'url': f"https://sun9-{rng.randint(1, 99)}.userapi.com/impg/{rng.getrandbits(128):032x}/{t}.jpg?size={w}x{w * 3 // 4}&quality=95&sign={rng.getrandbits(128):032x}&type=album"}
+             for t, w in (('s', 75), ('m', 130), ('x', 604), ('y', 807), ('z', 1280), ('w', 2560),
+                          ('o', 130), ('p', 200), ('q', 320), ('r', 510))]
+    return {'type': 'photo', 'photo': {'id': rng.randint(1, 10 ** 9), 'owner_id': owner_id, 'album_id': -7,
+                                       'date': 1700000000, 'access_key': f"{rng.getrandbits(64):016x}",
+                                       'sizes': sizes, 'text': ''}}
+
+def make_wall(posts, attachments, profiles, extended, seed=42):
+    """Build a wall.get response body as VK would send it."""
+    rng = random.Random(seed)
+    owner_id = -123456
+    items = [{
+        'id': 1000 - i,
+        'owner_id': owner_id,
+        'from_id': owner_id,
+        'date': 1700000000 - i * 3600,
+        'text': ' '.join(rng.choice(['Привет', 'новости', 'VK', 'feed', '#тег', '[id1|Иван]', 'https://vk.com/x'])
+                         for _ in range(300)),
+        'attachments': [make_photo(rng, owner_id) for _ in range(attachments)],
+        'comments': {'count': rng.randint(0, 100)},
+        'likes': {'count': rng.randint(0, 1000)},
+        'reposts': {'count': rng.randint(0, 50)},
+        'views': {'count': rng.randint(0, 100000)},
+    } for i in range(posts)]
+    response = {'count': 5000, 'items': items}
+    if extended:
+        response['profiles'] = [{'id': i, 'first_name': 'Иван', 'last_name': 'Петров', 'sex': 2,
+                                 'screen_name': f'user{i}', 'photo_50': f'https://sun9-1.userapi.com/{i}.jpg',
+                                 'photo_100': f'https://sun9-1.userapi.com/{i}_100.jpg', 'online': 0}
+                                for i in range(profiles)]
+        response['groups'] = [{'id': i, 'name': f'Группа {i}', 'screen_name': f'club{i}', 'is_closed': 0,
+                               'type': 'page', 'photo_50': f'https://sun9-1.userapi.com/g{i}.jpg',
+                               'photo_100': f'https://sun9-1.userapi.com/g{i}_100.jpg',
+                               'photo_200': f'https://sun9-1.userapi.com/g{i}_200.jpg'}
+                              for i in range(profiles)]
+    return json.dumps({'response': response}, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def build_whole(body):
+    """Previous path: load the whole response, then render."""
+    posts = FakeResponse(body).json()['response']['items']
+    return sum(len(format_post_content(post)) for post in posts)
+
+def build_streamed(body):
+    """Trimmed request decoded post by post while rendering."""
+    return sum(len(format_post_content(post)) for post in ItemStream(FakeResponse(body)))
+
+def build_streamed_list(body):
+    """Trimmed request decoded incrementally into a list, then rendered."""
+    posts = list(ItemStream(FakeResponse(body)))
+    return sum(len(format_post_content(post)) for post in posts)
+
+def build_compacted_list(body):
+    """As a feed build does: posts compacted as they are decoded, kept, then rendered."""
+    posts = [compact_post(post) for post in ItemStream(FakeResponse(body))]
+    return sum(len(format_post_content(post)) for post in posts)
+
+def measure(build, body):
+    """Return (peak MB above the body itself, seconds)."""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    with app.test_request_context():
+        build(body)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1e6, seconds
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--posts', type=int, default=100, help='Posts per page (default: 100)')
+    parser.add_argument('--attachments', type=int, default=10, help='Photos per post (default: 10)')
+    parser.add_argument('--profiles', type=int, default=200, help='Profiles and groups with extended=1 (default: 200)')
+    args = parser.parse_args()
+    
+    whole_body = make_wall(args.posts, args.attachments, args.profiles, extended=True)
+    trimmed_body = make_wall(args.posts, args.attachments, args.profiles, extended=False)
+    
+    print(f"{args.posts} posts x {args.attachments} photos")
+    print(f"  response size: extended {len(whole_body) / 1e6:.2f} MB, trimmed {len(trimmed_body) / 1e6:.2f} MB")
+    for name, build, body in (('extended + response.json()', build_whole, whole_body),
+                              ('trimmed + ItemStream, list', build_streamed_list, trimmed_body),
+                              ('trimmed + ItemStream, compacted', build_compacted_list, trimmed_body),
+                              ('trimmed + ItemStream', build_streamed, trimmed_body)):
+        peak, seconds = measure(build, body)
+        print(f"  {name:<32} peak {peak:7.2f} MB  {seconds * 1000:7.1f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+import logging
+import time
+
+from flask import current_app
+from sqlalchemy import func
+
+from models import VKFeed, FeedCache
+from leases import claim_lease
+from snapshot import prune_snapshots
+from reposts import delete_expired_originals
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# Held for a whole sweep interval so only one worker sweeps per interval
+SWEEP_LEASE_KEY = 'sweep:feed_cache'
+
+# A worker may re-claim its own lease, so it also remembers its last sweep
+_last_sweep = None
+
+def delete_orphaned_caches():
+    """
+    Delete cache rows whose feed no longer exists.
+    
+    Returns:
+        Number of rows deleted
+    """
+    orphaned = ~FeedCache.feed_id.in_(db.session.query(VKFeed.id))
+    deleted = FeedCache.query.filter(orphaned).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+def evict_to_size(max_bytes):
+    """
+    Evict the least recently built caches until the total stays under a cap.
+    
+    Only ``compressed_size`` is read, never the deferred bodies.
+    
+    Args:
+        max_bytes: Maximum total compressed size of all cached feeds
+        
+    Returns:
+        Number of rows evicted
+    """
+    total = db.session.query(func.coalesce(func.sum(FeedCache.compressed_size), 0)).scalar()
+    if total <= max_bytes:
+        return 0
+    
+    evict_ids = []
+    rows = (db.session.query(FeedCache.id, FeedCache.compressed_size)
+            .order_by(FeedCache.cached_at)
+            .yield_per(500))
+    for cache_id, size in rows:
+        if total <= max_bytes:
+            break
+        evict_ids.append(cache_id)
+        total -= size or 0
+    
+    for start in range(0, len(evict_ids), 500):
+        FeedCache.query.filter(FeedCache.id.in_(evict_ids[start:start + 500])).delete(synchronize_session=False)
+    db.session.commit()
+    return len(evict_ids)
+
+def sweep_feed_cache(max_bytes=None):
+    """
+    Remove orphaned feed caches and enforce FEED_CACHE_MAX_BYTES.
+    
+    Static snapshots of the removed caches are removed too, since nothing
+    would refresh them any more, and so are reposted originals no feed has
+    shown within ORIGINAL_POST_MAX_AGE.
+    
+    Args:
+        max_bytes: Size cap overriding the configured one
+        
+    Returns:
+        Tuple (orphans deleted, caches evicted)
+    """
+    if max_bytes is None:
+        max_bytes = current_app.config.get('FEED_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+    orphans = delete_orphaned_caches()
+    evicted = evict_to_size(max_bytes)
+    if orphans or evicted:
+        logger.info(f"Feed cache sweep removed {orphans} orphaned and {evicted} evicted entries")
+        if current_app.config.get('SNAPSHOT_ENABLED'):
+            prune_snapshots()
+    expired = delete_expired_originals(current_app.config.get('ORIGINAL_POST_MAX_AGE', 7 * 86400))
+    if expired:
+        logger.info(f"Feed cache sweep removed {expired} unused reposted originals")
+    return orphans, evicted
+
+def sweep_if_due():
+    """
+    Sweep the feed cache unless another worker did within CACHE_SWEEP_INTERVAL.
+    
+    Returns:
+        True if this worker swept
+    """
+    global _last_sweep
+    interval = current_app.config.get('CACHE_SWEEP_INTERVAL', 600)
+    if _last_sweep is not None and time.monotonic() - _last_sweep < interval:
+        return False
+    # Held until it expires, so no worker sweeps again within the interval
+    if claim_lease(SWEEP_LEASE_KEY, ttl=interval) is None:
+        return False
+    _last_sweep = time.monotonic()
+    sweep_feed_cache()
+    return True
@@ -0,0 +1,133 @@
+import logging
+
+import click
+from sqlalchemy import inspect as sa_inspect, text
+
+from app import app, db
+
+logger = logging.getLogger(__name__)
+
+def drop_legacy_feed_cache():
+    """Drop a feed_cache table from before compressed bodies; it only holds caches."""
+    inspector = sa_inspect(db.engine)
+    if not inspector.has_table('feed_cache'):
+        return
+    if 'body' not in {column['name'] for column in inspector.get_columns('feed_cache')}:
+        db.session.execute(text('DROP TABLE feed_cache'))
+        db.session.commit()
+        logger.info("Dropped legacy feed_cache table")
+
+# Columns added to existing tables after their first release, as
+# (table, column); create_all only creates whole tables, so init-db adds
+# these to databases created before them. Added columns must be nullable.
+ADDED_COLUMNS = [
+    ('vk_feed', 'include_keywords'),
+    ('vk_feed', 'exclude_keywords'),
+    ('vk_feed', 'last_post_at'),
+    ('vk_feed', 'translate_to'),
+    ('feed_cache', 'fingerprint'),
+    ('feed_cache', 'read_at'),
+]
+
+def add_missing_columns():
+    """Add the ADDED_COLUMNS an existing database does not have yet."""
+    inspector = sa_inspect(db.engine)
+    for table_name, column_name in ADDED_COLUMNS:
+        if not inspector.has_table(table_name):
+            continue
+        if column_name in {column['name'] for column in inspector.get_columns(table_name)}:
+            continue
+        column = db.metadata.tables[table_name].c[column_name]
+        column_type = column.type.compile(dialect=db.engine.dialect)
+        db.session.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}'))
+        db.session.commit()
+        logger.info(f"Added column {table_name}.{column_name}")
+
+def init_db():
+    """Create missing tables and columns and the full-text search index."""
+    import models  # noqa: F401
+    from post_store import ensure_search_index
+    
+    drop_legacy_feed_cache()
+    db.create_all()
+    add_missing_columns()
+    # create_all skips existing tables, so add indexes introduced later
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+    ensure_search_index()
+    logger.info("Database tables created")
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create database tables and indexes (run once per deploy)."""
+    init_db()
+    click.echo('Database initialized.')
+
+@app.cli.command('sweep-cache')
+@click.option('--max-bytes', type=int, default=None, help='Size cap overriding FEED_CACHE_MAX_BYTES.')
+def sweep_cache_command(max_bytes):
+    """Remove orphaned feed caches and evict the oldest over the size cap."""
+    from cache_sweeper import sweep_feed_cache
+    
+    orphans, evicted = sweep_feed_cache(max_bytes)
+    click.echo(f'Removed {orphans} orphaned and {evicted} evicted cache entries.')
+
+@app.cli.command('sync-snapshots')
+def sync_snapshots_command():
+    """Rebuild the static snapshot tree from the feed cache."""
+    from snapshot import sync_snapshots
+    
+    if not app.config.get('SNAPSHOT_ENABLED'):
+        raise click.ClickException('SNAPSHOT_ENABLED is not set.')
+    written, removed = sync_snapshots()
+    click.echo(f'Wrote {written} snapshots, removed {removed} stale ones.')
+
+@app.cli.command('warm-cache')
+@click.option('--user', 'usernames', multiple=True, help='Only feeds of this user (repeatable).')
+@click.option('--source', 'sources', multiple=True, help='Only feeds reading this VK source ID, screen name or URL (repeatable).')
+@click.option('--force', is_flag=True, help='Rebuild feeds with a fresh cache too.')
+@click.option('--built-before', type=click.DateTime(), default=None,
+              help='Only feeds cached before this UTC time; pass the time a run printed to resume it.')
+@click.option('--jobs', type=int, default=None, help='Feeds built at once (default: tokens x VK_SCHEDULER_SLOTS_PER_TOKEN).')
+@click.option('--dry-run', is_flag=True, help='Only report the feeds and the estimated VK API calls.')
+def warm_cache_command(usernames, sources, force, built_before, jobs, dry_run):
+    """Build missing and stale feed caches ahead of readers, e.g. after a deploy or restore."""
+    from datetime import datetime, timedelta
+    from warmup import select_feeds, estimate_calls, api_capacity, warm_feeds
+    
+    started = datetime.utcnow().replace(microsecond=0)
+    if built_before is None:
+        built_before = started if force else started - timedelta(seconds=app.config.get('FEED_CACHE_TIMEOUT', 300))
+    feed_ids = select_feeds(built_before, usernames, sources)
+    if not feed_ids:
+        click.echo('No feeds to build.')
+        return
+    
+    if dry_run:
+        calls = estimate_calls(feed_ids)
+        capacity = api_capacity()
+        duration = f', about {timedelta(seconds=round(calls / capacity))} at {capacity:g} calls/s' if capacity else ''
+        click.echo(f'{len(feed_ids)} feeds to build, about {calls} VK API calls{duration} '
+                   f'(author and repost lookups not counted).')
+        return
+    
+    if jobs is None:
+        jobs = len(app.config['VK_API_TOKENS']) * app.config.get('VK_SCHEDULER_SLOTS_PER_TOKEN', 2)
+    resume = f'--built-before {started.isoformat()}'
+    click.echo(f'Building {len(feed_ids)} feeds with {jobs} jobs; if interrupted, rerun with {resume} to resume.')
+    
+    def progress(done, counts, elapsed, calls):
+        if done % 10 and done != len(feed_ids):
+            return
+        rate = done / elapsed if elapsed else 0
+        eta = timedelta(seconds=round((len(feed_ids) - done) / rate)) if rate else '?'
+        click.echo(f'  {done}/{len(feed_ids)} feeds, {counts["failed"]} failed, {rate:.1f} feeds/s, '
+                   f'{calls / elapsed if elapsed else 0:.1f} VK calls/s, ETA {eta}')
+    
+    try:
+        counts = warm_feeds(feed_ids, built_before, jobs, progress)
+    except KeyboardInterrupt:
+        raise click.ClickException(f'Interrupted; rerun with {resume} to resume.')
+    click.echo(f'Built {counts["built"]} feeds, {counts["skipped"]} skipped (built since or deleted), '
+               f'{counts["leased"]} skipped (leased), {counts["failed"]} failed.')
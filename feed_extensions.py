@@ -0,0 +1,74 @@
+from feedgen.ext.base import BaseExtension
+from feedgen.util import xml_elem
+
+ATOM_NS = 'http://www.w3.org/2005/Atom'
+FEED_HISTORY_NS = 'http://purl.org/syndication/history/1.0'
+
+class FeedLinksExtension(BaseExtension):
+    """
+    Extra ``atom:link`` elements for RSS channels.
+    
+    feedgen only writes the ``self`` link into RSS and uses the last link
+    added through ``FeedGenerator.link`` as the channel ``<link>``, so links
+    such as ``prev-archive`` (RFC 5005) or ``hub`` (WebSub) are added here.
+    """
+    
+    def __init__(self):
+        self._links = []
+        self._archive = False
+        
+    def extend_ns(self):
+        return {'fh': FEED_HISTORY_NS}
+        
+    def extend_rss(self, rss_feed):
+        channel = rss_feed[0]
+        for link in self._links:
+            xml_elem('{%s}link' % ATOM_NS, channel, href=link['href'], rel=link['rel'])
+        if self._archive:
+            xml_elem('{%s}archive' % FEED_HISTORY_NS, channel)
+        return rss_feed
+        
+    def extend_atom(self, atom_feed):
+        for link in self._links:
+            xml_elem('{%s}link' % ATOM_NS, atom_feed, href=link['href'], rel=link['rel'])
+        if self._archive:
+            xml_elem('{%s}archive' % FEED_HISTORY_NS, atom_feed)
+        return atom_feed
+        
+    def link(self, href, rel):
+        """
+        Add a channel link.
+        
+        Args:
+            href: Link target
+            rel: Link relation, e.g. 'prev-archive', 'current' or 'hub'
+        """
+        self._links.append({'href': href, 'rel': rel})
+        
+    def archive(self, is_archive=True):
+        """
+        Mark the document as an archive page (``fh:archive``).
+        
+        Args:
+            is_archive: Whether the document is an immutable archive page
+        """
+        self._archive = is_archive
+
+class FeedLinksEntryExtension(BaseExtension):
+    """Entry counterpart of FeedLinksExtension; entries get no extra elements."""
+    pass
+
+def add_feed_links_extension(feed_generator):
+    """
+    Register FeedLinksExtension on a FeedGenerator, if not registered yet.
+    
+    Args:
+        feed_generator: FeedGenerator instance
+        
+    Returns:
+        The registered extension, also available as ``feed_generator.feedlinks``
+    """
+    if hasattr(feed_generator, 'feedlinks'):
+        return feed_generator.feedlinks
+    feed_generator.register_extension('feedlinks', FeedLinksExtension, FeedLinksEntryExtension)
+    return feed_generator.feedlinks
@@ -0,0 +1,158 @@
+import logging
+import re
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+def parse_keywords(text):
+    """
+    Split a keyword list as entered in the feed form.
+    
+    Args:
+        text: Keywords separated by newlines or commas
+        
+    Returns:
+        Sorted tuple of unique, lower-cased keywords
+    """
+    keywords = set()
+    for line in (text or '').split('\n'):
+        for keyword in line.split(','):
+            keyword = keyword.strip().lower()
+            if keyword:
+                keywords.add(keyword)
+    return tuple(sorted(keywords))
+
+def _trie_pattern(keywords):
+    """
+    Build a regex alternation from keywords with common prefixes factored out.
+    
+    A flat ``a|b|c`` alternation makes the regex engine try every keyword at
+    every position; a prefix trie lets it reject most positions after one
+    character, so the cost no longer grows with the number of keywords.
+    
+    Args:
+        keywords: Iterable of keywords
+        
+    Returns:
+        Regex pattern string
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = True
+    
+    def build(node):
+        if '' in node and len(node) == 1:
+            return ''
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if len(branches) == 1:
+            pattern = branches[0]
+        else:
+            pattern = '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            pattern = '(?:' + pattern + ')?'
+        return pattern
+    
+    return build(trie)
+
+class PostFilter:
+    """Include/exclude keyword filter compiled into one regex per list."""
+    
+    def __init__(self, include_keywords, exclude_keywords):
+        """
+        Compile the filter.
+        
+        Args:
+            include_keywords: Tuple of keywords of which at least one must appear
+            exclude_keywords: Tuple of keywords none of which may appear
+        """
+        self.include_keywords = include_keywords
+        self.exclude_keywords = exclude_keywords
+        self._include = re.compile(_trie_pattern(include_keywords), re.IGNORECASE) if include_keywords else None
+        self._exclude = re.compile(_trie_pattern(exclude_keywords), re.IGNORECASE) if exclude_keywords else None
+        
+    def matches(self, post):
+        """
+        Check whether a post passes the filter.
+        
+        The post text and the text of any reposted originals are scanned
+        once per keyword list.
+        
+        Args:
+            post: VK post data
+            
+        Returns:
+            True if the post should be published
+        """
+        text = post_search_text(post)
+        if self._exclude is not None and self._exclude.search(text):
+            return False
+        if self._include is not None and not self._include.search(text):
+            return False
+        return True
+    
+    def filter(self, posts):
+        """
+        Return the posts that pass the filter.
+        
+        Args:
+            posts: List of VK posts
+            
+        Returns:
+            List of matching posts, in the same order
+        """
+        return [post for post in posts if self.matches(post)]
+
+def post_search_text(post):
+    """
+    Collect the text of a post that keyword filters are applied to.
+    
+    Args:
+        post: VK post data
+        
+    Returns:
+        Post text, including reposted texts and link titles
+    """
+    parts = [post.get('text') or '']
+    for original in post.get('copy_history') or []:
+        parts.append(original.get('text') or '')
+    for attachment in post.get('attachments') or []:
+        if attachment.get('type') == 'link':
+            parts.append(attachment.get('link', {}).get('title') or '')
+    return '\n'.join(parts)
+
+@lru_cache(maxsize=1024)
+def compile_post_filter(include_keywords, exclude_keywords):
+    """
+    Compile (once) the filter for a pair of keyword tuples.
+    
+    Args:
+        include_keywords: Tuple of include keywords
+        exclude_keywords: Tuple of exclude keywords
+        
+    Returns:
+        PostFilter instance
+    """
+    logger.debug(f"Compiling post filter ({len(include_keywords)} include, {len(exclude_keywords)} exclude)")
+    return PostFilter(include_keywords, exclude_keywords)
+
+def get_post_filter(feed_config):
+    """
+    Get the compiled keyword filter of a feed.
+    
+    Compiled filters are cached by their keyword lists, so a feed only pays
+    for compilation again after its keywords change.
+    
+    Args:
+        feed_config: VKFeed model instance
+        
+    Returns:
+        PostFilter instance, or None if the feed has no keywords
+    """
+    include_keywords = parse_keywords(feed_config.include_keywords)
+    exclude_keywords = parse_keywords(feed_config.exclude_keywords)
+    if not include_keywords and not exclude_keywords:
+        return None
+    return compile_post_filter(include_keywords, exclude_keywords)
@@ -1,17 +1,32 @@
+import hashlib
+import heapq
+import itertools
+import json
 import logging
+import math
 import time
-from datetime import datetime, timedelta
-from feedgen.feed import FeedGenerator
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from flask import url_for, current_app
 import uuid
-import pytz
 
-from vk_api import VKAPIClient, get_source_info, format_post_content, VKAPIError
-from models import VKFeed, FeedCache
+from vk_api import VKAPIClient, get_source_info, format_post_content, compact_post, VKAPIError, get_source_key, WALL_GET_MAX_COUNT
+from models import VKFeed, FeedCache, SourceCache, dialect_insert
+from post_store import store_posts
+from feed_filters import get_post_filter
+from profiles import profile_cache, resolve_names, post_author_id
+from reposts import dedupe_reposts, resolve_originals, post_key
+from archive import get_latest_archive_period, schedule_backfill
+from websub import hub, get_hub_url, get_topic_url
+from leases import claim_lease, release_lease, keep_leases, is_lease_held, feed_lease_key
+from snapshot import export_snapshot, is_snapshot_kept
 from app import db
 
 logger = logging.getLogger(__name__)
 
+# Streamed posts are written to the post store this many at a time
+STORE_BATCH_SIZE = 20
+
 class RSSFeedGenerator:
     """Generate RSS feeds from VK content."""
     
@@ -23,12 +38,23 @@ class RSSFeedGenerator:
             feed_config: VKFeed model instance with feed configuration
         """
         self.feed_config = feed_config
-        self.vk_client = VKAPIClient()
+        # VK calls are scheduled against the feed owner's share of the API capacity
+        self.vk_client = VKAPIClient(user=feed_config.user)
+        self.post_filter = get_post_filter(feed_config)
+        # Set by translate_posts when some texts could not be translated
+        self.translation_incomplete = False
+        # Author names of the posts being rendered, set by resolve_authors
+        self.author_names = {}
+        # Reposted originals of the posts being rendered, set by resolve_reposts
+        self.originals = {}
         
-    def get_cached_feed(self):
+    def get_cached_feed(self, allow_stale=False):
         """
         Get the cached feed content if it exists and is not expired.
         
+        Args:
+            allow_stale: Return the cached content even if it has expired
+            
         Returns:
             Cached RSS content or None if no valid cache exists
         """
@@ -39,98 +65,247 @@ class RSSFeedGenerator:
         
         if cache:
             cache_age = datetime.utcnow() - cache.cached_at
-            if cache_age.total_seconds() < cache_timeout:
+            if allow_stale or cache_age.total_seconds() < cache_timeout:
                 logger.debug(f"Using cached feed for feed_id={self.feed_config.id}")
                 return cache.cached_content
         
         return None
         
-    def update_cache(self, content):
+    def update_cache(self, content, fingerprint=None):
         """
         Update the feed cache with new content.
         
+        The row is written with a single upsert and committed together with
+        any pending changes to the feed (such as ``last_fetched``), then
+        exported to the static snapshot tree if the feed has a snapshot.
+        
         Args:
             content: RSS feed content to cache
+            fingerprint: Fingerprint of the build the content comes from
         """
-        cache = FeedCache.query.filter_by(feed_id=self.feed_config.id).first()
+        body = FeedCache.compress(content)
+        values = {
+            'feed_id': self.feed_config.id,
+            'body': body,
+            'content_size': len(content.encode('utf-8')),
+            'compressed_size': len(body),
+            'fingerprint': fingerprint,
+            'cached_at': datetime.utcnow()
+        }
         
-        if cache:
-            cache.cached_content = content
-            cache.cached_at = datetime.utcnow()
+        insert = dialect_insert(FeedCache)
+        if insert is not None:
+            db.session.execute(insert.values(**values).on_conflict_do_update(
+                index_elements=['feed_id'],
+                set_={key: value for key, value in values.items() if key != 'feed_id'}
+            ))
         else:
-            cache = FeedCache(
-                feed_id=self.feed_config.id,
-                cached_content=content,
-                cached_at=datetime.utcnow()
-            )
-            db.session.add(cache)
+            cache = FeedCache.query.filter_by(feed_id=self.feed_config.id).first()
+            if cache is None:
+                cache = FeedCache(feed_id=self.feed_config.id)
+                db.session.add(cache)
+            for key, value in values.items():
+                setattr(cache, key, value)
         
         db.session.commit()
+        if is_snapshot_kept(self.feed_config.id):
+            export_snapshot(self.feed_config, content, body, values['cached_at'])
         
-    def generate_feed(self):
+    def get_unchanged_cache(self, fingerprint):
+        """
+        Get the cached feed if it was built from the same posts and settings.
+        
+        The cache is marked fresh again (committed together with pending
+        changes to the feed) without rewriting the body.
+        
+        Args:
+            fingerprint: Fingerprint of the current build
+            
+        Returns:
+            Cached RSS content, or None if it must be rebuilt
+        """
+        cache = FeedCache.query.filter_by(feed_id=self.feed_config.id).first()
+        if cache is None or cache.fingerprint is None or cache.fingerprint != fingerprint:
+            return None
+        content = cache.cached_content
+        if content is None:
+            return None
+        cache.cached_at = datetime.utcnow()
+        db.session.commit()
+        return content
+        
+    def build_fingerprint(self, posts, source_info, links):
+        """
+        Fingerprint a build: the posts (IDs and edit timestamps) plus
+        everything else that ends up in the document.
+        
+        Args:
+            posts: List of VK posts in feed order
+            source_info: Dictionary with channel information
+            links: List of (rel, href) channel links
+            
+        Returns:
+            Hex digest
+        """
+        config = self.feed_config
+        state = {
+            'posts': [(post.get('owner_id'), post.get('id'), post.get('date'), post.get('edited'))
+                      for post in posts],
+            'channel': source_info,
+            'links': links,
+            'settings': [config.title, config.description, config.access_token, config.items_count,
+                         config.include_attachments, config.translate_to,
+                         current_app.config.get('MEDIA_PROXY_ENABLED')],
+            'authors': sorted(self.author_names.items()),
+            'originals': sorted((key, post.get('edited')) for key, post in self.originals.items())
+        }
+        return hashlib.sha256(json.dumps(state, default=str).encode('utf-8')).hexdigest()
+        
+    def generate_feed(self, force_refresh=False, leased=False):
         """
         Generate an RSS feed for the configured VK source.
         
+        Args:
+            force_refresh: Rebuild the feed even if a valid cache exists
+            leased: The caller already holds the feed's refresh lease
+            
         Returns:
             RSS feed content as a string
         """
         # Try to get from cache first
-        cached = self.get_cached_feed()
+        cached = None if force_refresh else self.get_cached_feed()
         if cached:
             return cached
-            
+        if leased:
+            return self._build_feed()
+        
+        # Only one request rebuilds a feed at a time; the others keep serving
+        # the stale copy, or wait for the first build, until it is cached
+        lease_key = feed_lease_key(self.feed_config.id)
+        owner = claim_lease(lease_key)
+        if owner is None:
+            content = self.wait_for_build(lease_key)
+            if content is not None:
+                return content
+            owner = claim_lease(lease_key)
+            if owner is None:
+                logger.warning(f"Feed_id={self.feed_config.id} is still being built elsewhere")
+                return "<!-- Feed is being generated, try again shortly -->"
+        
+        try:
+            with keep_leases([lease_key], owner):
+                return self._build_feed()
+        finally:
+            release_lease(lease_key, owner)
+    
+    def wait_for_build(self, lease_key):
+        """
+        Get the feed while another request or worker holds its refresh lease.
+        
+        A stale copy is returned right away. Without one, the cache is
+        re-read until the build elsewhere stores it, for up to
+        FEED_BUILD_WAIT_SECONDS.
+        
+        Args:
+            lease_key: Refresh lease key of the feed
+        
+        Returns:
+            Cached RSS content, or None if none appeared in time
+        """
+        deadline = time.monotonic() + current_app.config.get('FEED_BUILD_WAIT_SECONDS', 15)
+        while True:
+            content = self.get_cached_feed(allow_stale=True)
+            if content is not None:
+                logger.debug(f"Feed_id={self.feed_config.id} is being refreshed elsewhere, serving cached copy")
+                return content
+            if time.monotonic() >= deadline or not is_lease_held(lease_key):
+                return None
+            # End the read transaction so the next read sees the new row
+            db.session.commit()
+            time.sleep(0.5)
+        
+    def _build_feed(self):
+        """
+        Fetch posts from VK and build, cache and publish the feed.
+        
+        Returns:
+            RSS feed content as a string
+        """
         logger.debug(f"Generating new feed for {self.feed_config.vk_source_type}:{self.feed_config.vk_source_id}")
         
         try:
             # Get source information
-            source_info = get_source_info(
-                self.feed_config.vk_source_type, 
-                self.feed_config.vk_source_id
-            )
+            source_info = self.get_channel_info()
             
             # Create feed generator
-            fg = FeedGenerator()
-            fg.id(url_for('get_feed', feed_id=self.feed_config.id, token=self.feed_config.access_token, _external=True))
-            
-            # Usar título original directamente
-            fg.title(self.feed_config.title or source_info['title'])
-            fg.link(href=source_info['link'], rel='alternate')
-            fg.description(self.feed_config.description or source_info['description'])
-            fg.language('ru')  # Idioma original del contenido
-            
-            # Set feed image if available
-            if source_info.get('image'):
-                fg.logo(source_info['image'])
+            fg = self.create_channel(source_info)
             
             # Get wall posts
-            owner_id = self.feed_config.vk_source_id
             try:
-                response = self.vk_client.get_wall_posts(
-                    owner_id=owner_id, 
-                    count=self.feed_config.items_count
-                )
+                posts = self._fetch_posts()
                 
-                if response and 'items' in response:
-                    posts = response['items']
+                if posts is not None:
+                    posts = dedupe_reposts(posts)
+                    
+                    # Advertise the WebSub hub so readers can subscribe instead of polling
+                    links = [('hub', get_hub_url()), ('self', get_topic_url(self.feed_config))]
+                    
+                    # Link the newest complete archive page (RFC 5005)
+                    source_keys = self.get_source_keys()
+                    latest_archive = get_latest_archive_period(source_keys)
+                    if latest_archive:
+                        links.append(('prev-archive', url_for(
+                            'get_feed_archive', feed_id=self.feed_config.id, period=latest_archive,
+                            token=self.feed_config.access_token, _external=True
+                        )))
+                    
+                    # Detect posts newer than the previous build
+                    newest = max((post.get('date', 0) for post in posts), default=0)
+                    newest_at = datetime.utcfromtimestamp(newest) if newest else None
+                    previous_at = self.feed_config.last_post_at
+                    has_new_posts = newest_at is not None and (previous_at is None or newest_at > previous_at)
+                    if has_new_posts:
+                        self.feed_config.last_post_at = newest_at
+                    
+                    # Nothing changed since the last build: keep the cached
+                    # document (and its validators) and only mark it fresh
+                    self.feed_config.last_fetched = datetime.utcnow()
+                    self.resolve_authors(posts)
+                    self.resolve_reposts(posts)
+                    fingerprint = self.build_fingerprint(posts, source_info, links)
+                    unchanged = None if has_new_posts else self.get_unchanged_cache(fingerprint)
+                    if unchanged is not None:
+                        logger.debug(f"Feed_id={self.feed_config.id} unchanged, extended cache freshness")
+                        schedule_backfill(source_keys)
+                        return unchanged
                     
                     # Add each post as a feed entry
-                    for post in posts:
+                    for post in self.translate_posts(posts):
                         self._add_post_to_feed(fg, post)
                     
-                    # Update the last fetched timestamp
-                    self.feed_config.last_fetched = datetime.utcnow()
-                    db.session.commit()
+                    from feed_extensions import add_feed_links_extension
+                    feed_links = add_feed_links_extension(fg)
+                    for rel, href in links:
+                        feed_links.link(href, rel)
                     
                     # Generate the feed content
                     feed_content = fg.rss_str(pretty=True).decode('utf-8')
                     
-                    # Cache the content
-                    self.update_cache(feed_content)
+                    # Cache the content (committed with last_fetched); a
+                    # build with failed translations is redone next time
+                    self.update_cache(feed_content, None if self.translation_incomplete else fingerprint)
+                    
+                    # Keep paging older history into the post store
+                    schedule_backfill(source_keys)
+                    
+                    # Push to WebSub subscribers (not on the very first build)
+                    if has_new_posts and previous_at is not None:
+                        hub.publish(self.feed_config, feed_content)
                     
                     return feed_content
                 else:
-                    logger.warning(f"No posts found for {owner_id}")
-                    return f"<!-- No posts found for {owner_id} -->"
+                    logger.warning(f"No posts found for {self.feed_config.vk_source_id}")
+                    return f"<!-- No posts found for {self.feed_config.vk_source_id} -->"
                 
             except VKAPIError as e:
                 logger.error(f"VK API error while generating feed: {e}")
@@ -140,48 +315,466 @@ class RSSFeedGenerator:
             logger.exception(f"Error generating feed: {e}")
             return f"<!-- Error generating feed: {e} -->"
     
-    def _add_post_to_feed(self, feed_generator, post):
+    def create_channel(self, source_info):
         """
-        Add a VK post to the feed as an entry.
+        Create a FeedGenerator with the channel metadata filled in.
         
         Args:
-            feed_generator: FeedGenerator instance
-            post: VK post data
+            source_info: Dictionary as returned by get_channel_info
+            
+        Returns:
+            FeedGenerator instance without entries
         """
-        # Create a new feed entry
-        entry = feed_generator.add_entry()
+        # feedgen pulls in lxml; load it on first build rather than at boot
+        from feedgen.feed import FeedGenerator
+        
+        fg = FeedGenerator()
+        # RSS <author> requires an email; names go into dc:creator
+        fg.load_extension('dc')
+        fg.id(url_for('get_feed', feed_id=self.feed_config.id, token=self.feed_config.access_token, _external=True))
+        
+        # Usar título original directamente
+        fg.title(self.feed_config.title or source_info['title'])
+        fg.link(href=source_info['link'], rel='alternate')
+        fg.description(self.feed_config.description or source_info['description'])
+        fg.language(self.feed_config.translate_to or 'ru')  # Idioma del contenido (original o traducido)
+        
+        # Set feed image if available
+        if source_info.get('image'):
+            fg.logo(source_info['image'])
+        
+        return fg
+    
+    def render_posts(self, posts, source_info, title=None, document_url=None, links=None, archive=False):
+        """
+        Render already fetched or stored posts into an RSS document.
+        
+        The result is not cached; this is used for views derived from the
+        feed such as search results and archive pages.
+        
+        Args:
+            posts: List of VK posts
+            source_info: Dictionary with channel information
+            title: Optional channel title overriding the feed title
+            document_url: Optional channel ID overriding the feed URL
+            links: Optional list of (rel, href) channel links
+            archive: Whether to mark the document as an RFC 5005 archive page
+            
+        Returns:
+            RSS feed content as a string
+        """
+        fg = self.create_channel(source_info)
+        if title:
+            fg.title(title)
+        if document_url:
+            fg.id(document_url)
+        if links or archive:
+            from feed_extensions import add_feed_links_extension
+            feed_links = add_feed_links_extension(fg)
+            for rel, href in links or []:
+                feed_links.link(href, rel)
+            feed_links.archive(archive)
+        posts = dedupe_reposts(posts)
+        self.resolve_authors(posts)
+        self.resolve_reposts(posts)
+        for post in self.translate_posts(posts):
+            self._add_post_to_feed(fg, post)
+        return fg.rss_str(pretty=True).decode('utf-8')
+    
+    def translate_posts(self, posts):
+        """
+        Translate the text of posts when the feed has a target language.
+        
+        All texts of a build, reposted originals included, go to the
+        translator in one batch; the posts are copied, never modified,
+        since they may be shared cache entries.
+        
+        Args:
+            posts: List of VK posts
+            
+        Returns:
+            List of posts with translated text
+        """
+        target_lang = self.feed_config.translate_to
+        if not target_lang or not current_app.config.get('TRANSLATION_ENABLED', False):
+            return posts
+        
+        from translator import translate_texts
+        originals = list(self.originals.values())
+        translations = translate_texts((post.get('text') for post in itertools.chain(posts, originals)), target_lang)
+        self.translation_incomplete = any(post.get('text', '').strip() and post['text'] not in translations
+                                          for post in itertools.chain(posts, originals))
+        
+        def translate(post):
+            return dict(post, text=translations[post['text']]) if post.get('text') in translations else post
+        
+        self.originals = {key: translate(post) for key, post in self.originals.items()}
+        return [translate(post) for post in posts]
+    
+    def resolve_authors(self, posts):
+        """
+        Resolve the names of the post authors into ``author_names``.
+        
+        Names come from the profile cache, which wall.get extended data
+        fills as posts are fetched; the rest are asked for in batches.
+        
+        Args:
+            posts: List of VK posts
+        """
+        if not current_app.config.get('AUTHOR_NAMES_ENABLED', True):
+            self.author_names = {}
+            return
+        self.author_names = resolve_names(self.vk_client, (post_author_id(post) for post in posts))
+    
+    def resolve_reposts(self, posts):
+        """
+        Load the reposted originals of the posts into ``originals``.
+        
+        Originals come from the cache shared by all feeds; missing ones
+        are fetched in batches.
         
-        # Generate a unique ID for the post
+        Args:
+            posts: List of VK posts
+        """
+        self.originals = resolve_originals(self.vk_client, posts)
+    
+    def get_source_keys(self):
+        """
+        Get the normalized keys of the VK sources this feed reads from.
+        
+        Returns:
+            List of source keys
+        """
+        return [get_source_key(self.feed_config.vk_source_id)]
+    
+    def get_channel_info(self):
+        """
+        Get channel information (title, link, description, image) for the feed.
+        
+        Returns:
+            Dictionary with information about the source
+        """
+        return get_source_info(
+            self.feed_config.vk_source_type, 
+            self.feed_config.vk_source_id,
+            client=self.vk_client
+        )
+    
+    def estimate_api_calls(self):
+        """
+        Estimate the VK API calls a rebuild of the feed makes.
+        
+        Filtered feeds are counted at FILTER_MAX_PAGES pages. Author name
+        and reposted original lookups depend on the shared caches and are
+        not counted.
+        
+        Returns:
+            Number of calls
+        """
+        # Source info, plus a screen name resolution for non-numeric IDs
+        calls = 1 if get_source_key(self.feed_config.vk_source_id).lstrip('-').isdigit() else 2
+        if self.post_filter is None:
+            return calls + math.ceil((self.feed_config.items_count or 20) / WALL_GET_MAX_COUNT)
+        return calls + current_app.config.get('FILTER_MAX_PAGES', 5)
+    
+    def _fetch_posts(self):
+        """
+        Fetch the posts to publish in the feed.
+        
+        Without keyword filters a single wall.get call is made. With filters,
+        the wall is paged until ``items_count`` posts match, the wall ends or
+        FILTER_MAX_PAGES pages have been read. Posts are stored and filtered
+        as they are decoded; only the ones published are kept, compacted.
+        
+        Returns:
+            List of VK posts, or None if VK returned nothing
+            
+        Raises:
+            VKAPIError: If the wall could not be fetched
+        """
+        owner_id = self.feed_config.vk_source_id
+        count = self.feed_config.items_count
+        source_key = get_source_key(owner_id)
+        # Author profiles come with the posts when entries show names
+        extended = current_app.config.get('AUTHOR_NAMES_ENABLED', True)
+        posts = []
+        
+        if self.post_filter is None:
+            page_info = {}
+            self._consume(self.vk_client.iter_wall_posts(owner_id=owner_id, count=count, page_info=page_info,
+                                                         extended=extended), source_key, posts)
+            profile_cache.remember(page_info.get('profiles'), page_info.get('groups'))
+            return posts or None
+        
+        max_pages = current_app.config.get('FILTER_MAX_PAGES', 5)
+        offset = 0
+        for _ in range(max_pages):
+            page = self.vk_client.get_wall_posts(owner_id=owner_id, count=100, offset=offset,
+                                                 extended=extended, stream=True)
+            received = self._consume(page, source_key, posts)
+            profile_cache.remember(page.extra.get('profiles'), page.extra.get('groups'))
+            if not received:
+                break
+            
+            offset += received
+            if len(posts) >= count or offset >= (page.count or 0):
+                break
+        
+        logger.debug(f"Filtered feed_id={self.feed_config.id}: {len(posts)} matching posts in {offset} read")
+        return posts[:count] if offset else None
+    
+    def _consume(self, stream, source_key, posts):
+        """
+        Store and filter posts as they are decoded.
+        
+        Posts go to the post store in batches of STORE_BATCH_SIZE. Only
+        those passing the keyword filter are kept, compacted, so a build
+        never holds the posts it doesn't publish nor unused photo variants.
+        
+        Args:
+            stream: Iterable of VK posts (an ItemStream or iter_wall_posts)
+            source_key: Normalized key of the source the posts come from
+            posts: List the kept posts are appended to
+            
+        Returns:
+            Number of posts read from the stream
+        """
+        received = 0
+        stream = iter(stream)
+        while True:
+            batch = list(itertools.islice(stream, STORE_BATCH_SIZE))
+            if not batch:
+                return received
+            received += len(batch)
+            store_posts(batch, source_key)
+            posts.extend(compact_post(post) for post in batch
+                         if self.post_filter is None or self.post_filter.matches(post))
+    
+    def build_entry(self, post):
+        """
+        Build the entry of a VK post, as shown in the feed and its preview.
+        
+        Uses the author names and reposted originals resolved for the
+        current batch of posts.
+        
+        Args:
+            post: VK post data
+            
+        Returns:
+            Dictionary with 'id', 'link', 'title', 'content' (HTML),
+            'published' (aware datetime) and 'author'
+        """
         post_id = post.get('id')
         owner_id = post.get('owner_id')
-        entry.id(f"vk-post-{owner_id}_{post_id}")
         
-        # Set the title - use the first line of text or a default
+        # Title: the first line of text or a default
         text = post.get('text', '')
+        # A repost without a comment is titled after the post it reposts
+        if not text.strip() and post.get('copy_history'):
+            item = post['copy_history'][-1]
+            text = self.originals.get((item.get('owner_id'), item.get('id')), item).get('text', '')
         title = text.split('\n')[0][:100] if text else f"Post {post_id}"
         if not title.strip():
             title = f"Post from {datetime.fromtimestamp(post.get('date', 0))}"
+        
+        # Author: the signer, else the publisher, by name when known
+        author_id = post_author_id(post)
+        author = self.author_names.get(author_id)
+        if not author:
+            author = f"Group ID: {abs(author_id)}" if author_id < 0 else f"User ID: {author_id}"
+        
+        return {
+            'id': f"vk-post-{owner_id}_{post_id}",
+            'link': f"https://vk.com/wall{owner_id}_{post_id}",
+            'title': title,
+            'content': format_post_content(post, self.feed_config.include_attachments, self.originals),
+            'published': datetime.fromtimestamp(post.get('date', 0)).replace(tzinfo=timezone.utc),
+            'author': author
+        }
+    
+    def _add_post_to_feed(self, feed_generator, post):
+        """
+        Add a VK post to the feed as an entry.
+        
+        Args:
+            feed_generator: FeedGenerator instance
+            post: VK post data
+        """
+        data = self.build_entry(post)
+        entry = feed_generator.add_entry()
+        entry.id(data['id'])
+        entry.title(data['title'])
+        entry.link(href=data['link'])
+        entry.content(data['content'], type='html')
+        entry.published(data['published'])
+        entry.author(name=data['author'])
+        entry.dc.dc_creator(data['author'])
+
+
+def _post_date(post):
+    """Sort key for VK posts: publication timestamp."""
+    return post.get('date', 0)
+
+
+def merge_posts_by_date(post_lists, count):
+    """
+    Lazily merge several post lists into one, newest first.
+    
+    Each list is sorted on its own (walls may start with a pinned post),
+    then combined with a heap-based k-way merge that stops as soon as
+    ``count`` posts have been produced. A post found in several lists (one
+    wall added under two different names) is kept once.
+    
+    Args:
+        post_lists: Iterable of lists of VK posts
+        count: Maximum number of posts to return
+        
+    Returns:
+        List of at most ``count`` posts ordered by date, newest first
+    """
+    ordered = [sorted(posts, key=_post_date, reverse=True) for posts in post_lists if posts]
+    merged = heapq.merge(*ordered, key=_post_date, reverse=True)
+    seen = set()
+    unique = (post for post in merged if post_key(post) not in seen and not seen.add(post_key(post)))
+    return list(itertools.islice(unique, count))
+
+
+class MergedFeedGenerator(RSSFeedGenerator):
+    """Generate a single RSS feed that aggregates several VK sources."""
+    
+    def get_channel_info(self):
+        """
+        Build channel information for the merged feed without calling VK.
+        
+        Returns:
+            Dictionary with information about the feed
+        """
+        return {
+            'title': self.feed_config.title,
+            'link': url_for('get_feed', feed_id=self.feed_config.id, token=self.feed_config.access_token, _external=True),
+            'description': f"Merged feed of {len(self.feed_config.sources)} VK sources",
+            'image': None
+        }
+    
+    def get_source_keys(self):
+        """
+        Get the normalized keys of all sources of the merged feed.
+        
+        Returns:
+            List of unique source keys in source order
+        """
+        keys = []
+        for source in self.feed_config.sources:
+            key = get_source_key(source.vk_source_id)
+            if key not in keys:
+                keys.append(key)
+        return keys
+    
+    def estimate_api_calls(self):
+        """
+        Estimate the VK API calls a rebuild of the feed makes.
+        
+        Sources with a fresh ``SourceCache`` entry are not fetched and not
+        counted.
+        
+        Returns:
+            Number of calls
+        """
+        count = self.feed_config.items_count or 20
+        keys = self.get_source_keys()
+        fresh_after = datetime.utcnow() - timedelta(seconds=current_app.config.get('FEED_CACHE_TIMEOUT', 300))
+        fresh = {cache.source_key for cache in SourceCache.query.filter(SourceCache.source_key.in_(keys))
+                 if cache.cached_at >= fresh_after and (cache.fetched_count or 0) >= count}
+        return (len(keys) - len(fresh)) * math.ceil(count / WALL_GET_MAX_COUNT)
+    
+    def _fetch_posts(self):
+        """
+        Fetch the posts of every source and merge them by date.
+        
+        Sources with a fresh ``SourceCache`` entry are served from it; the
+        rest are fetched from VK concurrently. A source that fails keeps
+        using its last cached posts, if any.
+        
+        Returns:
+            List of VK posts, or None if no source returned anything
+        """
+        count = self.feed_config.items_count or 20
+        cache_timeout = current_app.config.get('FEED_CACHE_TIMEOUT', 300)
+        now = datetime.utcnow()
+        
+        keys = self.get_source_keys()
+        if not keys:
+            return None
+        
+        caches = {cache.source_key: cache for cache in SourceCache.query.filter(SourceCache.source_key.in_(keys))}
+        posts_by_key = {}
+        stale_keys = []
+        for key in keys:
+            cache = caches.get(key)
+            if (cache and (now - cache.cached_at).total_seconds() < cache_timeout
+                    and (cache.fetched_count or 0) >= count):
+                posts_by_key[key] = json.loads(cache.posts_json or '[]')
+            else:
+                stale_keys.append(key)
+        
+        if stale_keys:
+            logger.debug(f"Fetching {len(stale_keys)} of {len(keys)} sources for merged feed_id={self.feed_config.id}")
+            max_workers = current_app.config.get('MERGED_FEED_MAX_WORKERS', 8)
+            extended = current_app.config.get('AUTHOR_NAMES_ENABLED', True)
+            
+            def fetch(key):
+                try:
+                    return key, self.vk_client.get_wall_posts_paged(owner_id=key, count=count, extended=extended) or {}, None
+                except VKAPIError as e:
+                    return key, None, e
+            
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(stale_keys))) as executor:
+                results = list(executor.map(fetch, stale_keys))
             
-        entry.title(title)
+            for key, response, error in results:
+                cache = caches.get(key)
+                if error is not None:
+                    logger.warning(f"Failed to fetch source {key} for merged feed: {error}")
+                    if cache and cache.posts_json:
+                        posts_by_key[key] = json.loads(cache.posts_json)
+                    continue
+                
+                profile_cache.remember(response.get('profiles'), response.get('groups'))
+                posts = response.get('items', [])
+                posts_by_key[key] = posts
+                store_posts(posts, key)
+                if not cache:
+                    cache = SourceCache(source_key=key)
+                    db.session.add(cache)
+                cache.posts_json = json.dumps(posts, ensure_ascii=False)
+                cache.fetched_count = count
+                cache.cached_at = now
+            
+            db.session.commit()
         
-        # Set the link to the original post
-        post_url = f"https://vk.com/wall{owner_id}_{post_id}"
-        entry.link(href=post_url)
+        if not any(posts_by_key.values()):
+            return None
         
-        # Format the content
-        content = format_post_content(post, self.feed_config.include_attachments)
-        entry.content(content, type='html')
+        post_lists = posts_by_key.values()
+        if self.post_filter is not None:
+            post_lists = [self.post_filter.filter(posts) for posts in post_lists]
         
-        # Set the publication date
-        pub_date = datetime.fromtimestamp(post.get('date', 0))
-        pub_date = pub_date.replace(tzinfo=pytz.UTC)
-        entry.published(pub_date)
+        return merge_posts_by_date(post_lists, count)
+
+
+def create_feed_generator(feed_config):
+    """
+    Create the generator matching the feed type.
+    
+    Args:
+        feed_config: VKFeed model instance with feed configuration
         
-        # Add the author if available
-        if 'signer_id' in post and post['signer_id']:
-            entry.author(name=f"User ID: {post['signer_id']}")
-        else:
-            entry.author(name=f"Group ID: {abs(owner_id)}" if owner_id < 0 else f"User ID: {owner_id}")
+    Returns:
+        RSSFeedGenerator (or subclass) instance
+    """
+    if feed_config.vk_source_type == 'merged':
+        return MergedFeedGenerator(feed_config)
+    return RSSFeedGenerator(feed_config)
 
 def generate_access_token():
     """Generate a unique access token for feed access."""
@@ -0,0 +1,141 @@
+import base64
+import json
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import tuple_
+
+from models import VKFeed, FeedCache
+from app import db
+
+# Dashboard sort keys; each is backed by an index on (user_id, column, id)
+SORT_COLUMNS = {
+    'title': VKFeed.title,
+    'source': VKFeed.vk_source_id,
+    'updated': VKFeed.last_fetched,
+}
+
+MAX_PAGE_SIZE = 200
+
+def is_descending(sort_by, direction):
+    """
+    Tell whether a dashboard sort runs in descending column order.
+    
+    'updated' ascending lists the most recently updated feeds first.
+    """
+    descending = direction == 'desc'
+    return not descending if sort_by == 'updated' else descending
+
+def encode_cursor(feed, sort_by):
+    """
+    Encode the position after a feed as an opaque cursor.
+    
+    Args:
+        feed: Last VKFeed of a page
+        sort_by: Sort key of the listing
+        
+    Returns:
+        URL-safe cursor string
+    """
+    value = getattr(feed, SORT_COLUMNS[sort_by].key)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, feed.id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, sort_by):
+    """
+    Decode a cursor produced by encode_cursor.
+    
+    Returns:
+        Tuple (sort value, feed id), or None if the cursor is invalid
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, feed_id = json.loads(raw)
+        # Every sort column is text or an ISO datetime
+        if value is not None and not isinstance(value, str):
+            return None
+        if value is not None and sort_by == 'updated':
+            value = datetime.fromisoformat(value)
+        return value, int(feed_id)
+    except (ValueError, TypeError):
+        return None
+
+def _after(columns, values, descending):
+    """Build the keyset condition for rows after ``values`` as one row comparison."""
+    return tuple_(*columns) < tuple_(*values) if descending else tuple_(*columns) > tuple_(*values)
+
+def list_feeds(user_id, sort_by='title', direction='asc', cursor=None, limit=None):
+    """
+    Get one page of a user's feeds using keyset pagination.
+    
+    Args:
+        user_id: Owner of the feeds
+        sort_by: 'title', 'source' or 'updated'
+        direction: 'asc' or 'desc'
+        cursor: Cursor returned with the previous page
+        limit: Page size, defaults to DASHBOARD_PAGE_SIZE
+        
+    Returns:
+        Tuple (list of VKFeed, cursor of the next page or None)
+    """
+    if sort_by not in SORT_COLUMNS:
+        sort_by = 'title'
+    limit = max(1, min(limit or current_app.config.get('DASHBOARD_PAGE_SIZE', 50), MAX_PAGE_SIZE))
+    column = SORT_COLUMNS[sort_by]
+    descending = is_descending(sort_by, direction)
+    
+    query = VKFeed.query.filter(VKFeed.user_id == user_id)
+    position = decode_cursor(cursor, sort_by) if cursor else None
+    id_order = VKFeed.id.desc() if descending else VKFeed.id.asc()
+    
+    # Feeds with a sort value, read as a plain range of the (user_id,
+    # column, id) index: forwards, or backwards when descending
+    feeds = []
+    if position is None or position[0] is not None:
+        keyed = query.filter(column.isnot(None)) if column.nullable else query
+        if position is not None:
+            keyed = keyed.filter(_after((column, VKFeed.id), position, descending))
+        feeds = keyed.order_by(column.desc() if descending else column.asc(), id_order).limit(limit + 1).all()
+    
+    # Feeds without one (never fetched) come last, in id order
+    if column.nullable and len(feeds) <= limit:
+        unkeyed = query.filter(column.is_(None))
+        if position is not None and position[0] is None:
+            unkeyed = unkeyed.filter(_after((VKFeed.id,), (position[1],), descending))
+        feeds += unkeyed.order_by(id_order).limit(limit + 1 - len(feeds)).all()
+    
+    next_cursor = encode_cursor(feeds[limit - 1], sort_by) if len(feeds) > limit else None
+    return feeds[:limit], next_cursor
+
+def get_cache_status(feed_ids):
+    """
+    Get the cache status of several feeds with a single query.
+    
+    Only metadata columns are read, never the cached bodies.
+    
+    Args:
+        feed_ids: List of feed IDs
+        
+    Returns:
+        Dict mapping feed ID to a status dict ('cached_at', 'fresh', 'size',
+        'compressed_size'); feeds without a cache are missing
+    """
+    if not feed_ids:
+        return {}
+    cache_timeout = current_app.config.get('FEED_CACHE_TIMEOUT', 300)
+    now = datetime.utcnow()
+    rows = (db.session.query(FeedCache.feed_id, FeedCache.cached_at,
+                             FeedCache.content_size, FeedCache.compressed_size)
+            .filter(FeedCache.feed_id.in_(feed_ids))
+            .all())
+    return {
+        row.feed_id: {
+            'cached_at': row.cached_at,
+            'fresh': (now - row.cached_at).total_seconds() < cache_timeout,
+            'size': row.content_size,
+            'compressed_size': row.compressed_size,
+        }
+        for row in rows
+    }
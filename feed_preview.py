@@ -0,0 +1,93 @@
+import base64
+import json
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import and_, or_
+
+from models import VKPost
+from post_store import get_owner_ids
+from reposts import dedupe_reposts
+
+MAX_PAGE_SIZE = 50
+
+# Stored posts read per query while filling a page of a filtered feed
+SCAN_BATCH_SIZE = 100
+MAX_SCAN_BATCHES = 5
+
+def encode_cursor(published_at, row_id):
+    """Encode the position after a stored post as an opaque cursor."""
+    raw = json.dumps([published_at.isoformat(), row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor.
+    
+    Returns:
+        Tuple (published_at, row id), or None if the cursor is invalid
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        published_at, row_id = json.loads(raw)
+        return datetime.fromisoformat(published_at), int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+def get_preview_page(generator, cursor=None, limit=None):
+    """
+    Get a page of a feed's entries from the post store, newest first.
+    
+    Posts are read from what feed builds already stored and rendered with
+    the same entry model as the feed, so a warm preview makes no VK calls.
+    A feed that was never built is built once first.
+    
+    Args:
+        generator: RSSFeedGenerator of the feed
+        cursor: Cursor from a previous page, or None for the first page
+        limit: Entries per page (default PREVIEW_PAGE_SIZE)
+    
+    Returns:
+        Tuple (list of entry dicts, cursor of the next page or None)
+    """
+    limit = max(1, min(limit or current_app.config.get('PREVIEW_PAGE_SIZE', 10), MAX_PAGE_SIZE))
+    owner_ids = get_owner_ids(generator.get_source_keys())
+    if not owner_ids and cursor is None:
+        generator.generate_feed()
+        owner_ids = get_owner_ids(generator.get_source_keys())
+    if not owner_ids:
+        return [], None
+    
+    position = decode_cursor(cursor) if cursor else None
+    posts = []
+    exhausted = False
+    # Keyword filters may reject stored posts, so read until the page is full
+    for _ in range(MAX_SCAN_BATCHES):
+        query = VKPost.query.filter(VKPost.owner_id.in_(owner_ids))
+        if position is not None:
+            published_at, row_id = position
+            query = query.filter(or_(VKPost.published_at < published_at,
+                                     and_(VKPost.published_at == published_at, VKPost.id < row_id)))
+        rows = query.order_by(VKPost.published_at.desc(), VKPost.id.desc()).limit(SCAN_BATCH_SIZE).all()
+        
+        for row in rows:
+            post = json.loads(row.data)
+            if generator.post_filter is None or generator.post_filter.filter([post]):
+                posts.append(post)
+            position = (row.published_at, row.id)
+            if len(posts) >= limit:
+                break
+        
+        exhausted = len(posts) < limit and len(rows) < SCAN_BATCH_SIZE
+        if len(posts) >= limit or exhausted:
+            break
+    
+    next_cursor = encode_cursor(*position) if position is not None and not exhausted else None
+    posts = dedupe_reposts(posts)
+    generator.resolve_authors(posts)
+    generator.resolve_reposts(posts)
+    return [generator.build_entry(post) for post in generator.translate_posts(posts)], next_cursor
+
+def serialize_entry(entry):
+    """Return an entry as a JSON-serializable dict."""
+    return dict(entry, published=entry['published'].isoformat())
@@ -0,0 +1,30 @@
+"""
+Gunicorn configuration, loaded by ``gunicorn app:app`` from the working directory.
+
+WEB_WORKER_CLASS selects the worker type:
+
+    sync    each worker process serves one request at a time (default)
+    gevent  cooperative workers: each process serves up to
+            WEB_WORKER_CONNECTIONS requests at once, switching between them
+            while they wait on the database, the VK API or a slow client
+
+gevent workers need the gevent package, and psycogreen when the database is
+PostgreSQL so psycopg2 waits cooperatively as well. With many requests in
+flight per process, raise DB_POOL_SIZE and VK_SCHEDULER_SLOTS_PER_TOKEN to
+match. benchmarks/bench_serving.py compares the two worker types.
+"""
+import os
+
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'sync')
+worker_connections = int(os.environ.get('WEB_WORKER_CONNECTIONS', '1000'))
+
+def post_fork(server, worker):
+    """Make psycopg2 yield to other greenlets while it waits on PostgreSQL."""
+    if server.cfg.worker_class_str != 'gevent' or not os.environ.get('DATABASE_URL', '').startswith('postgres'):
+        return
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        server.log.warning("psycogreen is not installed, database queries block gevent workers")
+        return
+    patch_psycopg()
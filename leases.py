@@ -0,0 +1,229 @@
+import logging
+import os
+import socket
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import or_, text
+
+from models import RefreshLease, dialect_insert
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process across hosts and workers in lease owner tokens
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+def new_owner_token():
+    """
+    Return a lease owner token unique to one claim.
+    
+    Threads and greenlets of one process each get their own token, so a
+    lease held by one of them is not claimed or released by another.
+    """
+    return f"{WORKER_ID}:{uuid.uuid4().hex}"
+
+def feed_lease_key(feed_id):
+    """Return the lease key of a feed refresh."""
+    return f"feed:{feed_id}"
+
+def source_lease_key(source_key):
+    """Return the lease key of a source backfill."""
+    return f"source:{source_key}"
+
+def _ensure_lease_rows(keys):
+    """Insert lease rows that do not exist yet, ignoring concurrent inserts."""
+    rows = [{'resource_key': key} for key in keys]
+    insert = dialect_insert(RefreshLease)
+    if insert is not None:
+        db.session.execute(insert.values(rows).on_conflict_do_nothing(index_elements=['resource_key']))
+    else:
+        existing = {row.resource_key for row in RefreshLease.query.filter(RefreshLease.resource_key.in_(keys))}
+        db.session.add_all(RefreshLease(resource_key=key) for key in keys if key not in existing)
+    db.session.commit()
+
+def claim_leases(keys, ttl=None, limit=None):
+    """
+    Claim the refresh leases of several resources.
+    
+    A lease can be claimed when it is free or expired (its holder died or
+    stalled). On PostgreSQL free rows are
+    locked with ``FOR UPDATE SKIP LOCKED`` so concurrent workers split a
+    batch instead of waiting on each other; on SQLite (single node) each
+    lease is taken with an atomic compare-and-set UPDATE.
+    
+    Args:
+        keys: Lease keys to claim
+        ttl: Lease duration in seconds, defaults to REFRESH_LEASE_SECONDS
+        limit: Maximum number of leases to claim
+        
+    Returns:
+        Tuple (owner token to release the leases with, list of claimed keys)
+    """
+    owner = new_owner_token()
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return owner, []
+    ttl = ttl or current_app.config.get('REFRESH_LEASE_SECONDS', 120)
+    limit = limit or len(keys)
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl)
+    
+    _ensure_lease_rows(keys)
+    
+    if db.engine.dialect.name == 'postgresql':
+        rows = db.session.execute(text(
+            "SELECT id, resource_key FROM refresh_lease "
+            "WHERE resource_key = ANY(:keys) AND (expires_at IS NULL OR expires_at < :now) "
+            "ORDER BY expires_at NULLS FIRST LIMIT :limit FOR UPDATE SKIP LOCKED"
+        ), {'keys': keys, 'now': now, 'limit': limit}).all()
+        if rows:
+            db.session.execute(text(
+                "UPDATE refresh_lease SET owner = :owner, expires_at = :expires_at, acquired_at = :now "
+                "WHERE id = ANY(:ids)"
+            ), {'owner': owner, 'expires_at': expires_at, 'now': now, 'ids': [row.id for row in rows]})
+        db.session.commit()
+        return owner, [row.resource_key for row in rows]
+    
+    claimed = []
+    for key in keys:
+        if len(claimed) >= limit:
+            break
+        result = db.session.execute(text(
+            "UPDATE refresh_lease SET owner = :owner, expires_at = :expires_at, acquired_at = :now "
+            "WHERE resource_key = :key AND (expires_at IS NULL OR expires_at < :now)"
+        ), {'owner': owner, 'expires_at': expires_at, 'now': now, 'key': key})
+        if result.rowcount == 1:
+            claimed.append(key)
+        db.session.commit()
+    return owner, claimed
+
+def claim_lease(key, ttl=None):
+    """
+    Claim a single refresh lease.
+    
+    Taken with one upsert (and one commit) that creates the row or takes
+    it over when it is free or expired, since a build claims its lease on
+    every cache miss.
+    
+    Args:
+        key: Lease key
+        ttl: Lease duration in seconds
+        
+    Returns:
+        Owner token to release the lease with, or None if it is held elsewhere
+    """
+    insert = dialect_insert(RefreshLease)
+    if insert is None:
+        owner, claimed = claim_leases([key], ttl=ttl)
+        return owner if claimed else None
+    
+    owner = new_owner_token()
+    now = datetime.utcnow()
+    values = {'owner': owner, 'acquired_at': now,
+              'expires_at': now + timedelta(seconds=ttl or current_app.config.get('REFRESH_LEASE_SECONDS', 120))}
+    result = db.session.execute(insert.values(resource_key=key, **values).on_conflict_do_update(
+        index_elements=['resource_key'],
+        set_=values,
+        where=or_(RefreshLease.expires_at.is_(None), RefreshLease.expires_at < now)
+    ))
+    db.session.commit()
+    return owner if result.rowcount == 1 else None
+
+def renew_leases(keys, owner, ttl=None):
+    """
+    Extend leases still held by ``owner``.
+    
+    Args:
+        keys: Lease keys
+        owner: Owner token returned by the claim
+        ttl: New lifetime in seconds from now, defaults to REFRESH_LEASE_SECONDS
+        
+    Returns:
+        Number of leases renewed; fewer than ``keys`` means some were lost
+    """
+    keys = list(keys)
+    if not keys:
+        return 0
+    ttl = ttl or current_app.config.get('REFRESH_LEASE_SECONDS', 120)
+    renewed = (RefreshLease.query
+               .filter(RefreshLease.resource_key.in_(keys), RefreshLease.owner == owner)
+               .update({RefreshLease.expires_at: datetime.utcnow() + timedelta(seconds=ttl)},
+                       synchronize_session=False))
+    db.session.commit()
+    return renewed
+
+@contextmanager
+def keep_leases(keys, owner, ttl=None):
+    """
+    Renew leases in a background thread while the block runs.
+    
+    Builds of merged, filtered or translated feeds can outlive a lease;
+    the leases are renewed every third of their lifetime so another
+    worker never takes over a build that is still running.
+    
+    Args:
+        keys: Lease keys
+        owner: Owner token returned by the claim
+        ttl: Lease lifetime in seconds, defaults to REFRESH_LEASE_SECONDS
+    """
+    keys = list(keys)
+    if not keys or owner is None:
+        yield
+        return
+    app = current_app._get_current_object()
+    ttl = ttl or app.config.get('REFRESH_LEASE_SECONDS', 120)
+    stop = threading.Event()
+    
+    def renew():
+        # Own app context, hence its own session, committing only the renewal
+        with app.app_context():
+            while not stop.wait(ttl / 3):
+                try:
+                    if renew_leases(keys, owner, ttl) < len(keys):
+                        logger.warning(f"Lost {len(keys)} refresh leases of {owner} while renewing")
+                except Exception as e:
+                    logger.warning(f"Renewing refresh leases failed: {e}")
+                    db.session.rollback()
+            db.session.remove()
+    
+    thread = threading.Thread(target=renew, name='lease-keeper', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+def is_lease_held(key):
+    """Return True if a lease is currently held by anyone."""
+    now = datetime.utcnow()
+    return db.session.query(RefreshLease.query.filter(
+        RefreshLease.resource_key == key, RefreshLease.expires_at >= now
+    ).exists()).scalar()
+
+def release_leases(keys, owner):
+    """
+    Release leases so others can claim them right away.
+    
+    Leases that expired and were claimed by someone else since are left
+    alone.
+    
+    Args:
+        keys: Lease keys
+        owner: Owner token returned by the claim
+    """
+    keys = list(keys)
+    if not keys:
+        return
+    (RefreshLease.query
+     .filter(RefreshLease.resource_key.in_(keys), RefreshLease.owner == owner)
+     .update({RefreshLease.expires_at: None}, synchronize_session=False))
+    db.session.commit()
+
+def release_lease(key, owner):
+    """Release a single lease claimed with claim_lease."""
+    release_leases([key], owner)
@@ -1,4 +1,8 @@
 from app import app  # noqa: F401
 
 if __name__ == "__main__":
+    # The development server creates tables itself; deployments run `flask --app app init-db`
+    from cli import init_db
+    with app.app_context():
+        init_db()
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,210 @@
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import tempfile
+import threading
+from urllib.parse import urlparse
+
+from flask import current_app, url_for
+
+logger = logging.getLogger(__name__)
+
+# Files are served with a one year lifetime: a cached URL never changes
+MEDIA_MAX_AGE = 365 * 24 * 3600
+
+class MediaProxyError(Exception):
+    """Exception raised when an attachment cannot be fetched."""
+    pass
+
+def _signature(url):
+    digest = hmac.new(current_app.secret_key.encode('utf-8'), url.encode('utf-8'), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:16]).decode('ascii').rstrip('=')
+
+def encode_media_url(url):
+    """Encode an attachment URL for a /media/ path."""
+    return base64.urlsafe_b64encode(url.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_media_url(signature, encoded):
+    """
+    Decode the attachment URL of a /media/ path and check its signature.
+    
+    Args:
+        signature: Signature path segment
+        encoded: Encoded URL path segment
+    
+    Returns:
+        Original URL, or None if the path was not produced by media_url
+    """
+    try:
+        url = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)).decode('utf-8')
+    except ValueError:
+        return None
+    if urlparse(url).scheme not in ('http', 'https'):
+        return None
+    return url if hmac.compare_digest(signature, _signature(url)) else None
+
+def media_url(url):
+    """
+    Get the URL an attachment should be embedded with.
+    
+    With MEDIA_PROXY_ENABLED the attachment is served through the caching
+    /media/ proxy; the path is signed so the proxy only fetches URLs this
+    site produced.
+    
+    Args:
+        url: VK CDN URL of the attachment
+    
+    Returns:
+        Proxy URL, or the original URL when the proxy is disabled
+    """
+    if not url or not current_app.config.get('MEDIA_PROXY_ENABLED'):
+        return url
+    return url_for('get_media', signature=_signature(url), encoded=encode_media_url(url), _external=True)
+
+class MediaCache:
+    """
+    Size-capped on-disk LRU cache of proxied attachments.
+    
+    Each entry is a data file named after the SHA-256 of its URL plus a
+    ``.type`` file holding the content type. Hits bump the mtime of the
+    ``.type`` file, leaving the data file's Last-Modified and ETag stable,
+    and eviction removes the entries used least recently.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._total_size = None
+    
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        directory = os.path.join(current_app.config['MEDIA_CACHE_DIR'], key[:2])
+        return directory, os.path.join(directory, key)
+    
+    def get(self, url):
+        """
+        Get the cached file of an attachment, downloading it on a miss.
+        
+        Args:
+            url: Attachment URL
+        
+        Returns:
+            Tuple (file path, content type)
+        
+        Raises:
+            MediaProxyError: If the download fails or the file is too large
+        """
+        directory, path = self._paths(url)
+        cached = self._lookup(path)
+        if cached:
+            return cached
+        
+        # One download per URL and process; concurrent misses wait for it
+        with self._lock:
+            lock = self._key_locks.setdefault(path, threading.Lock())
+        with lock:
+            try:
+                cached = self._lookup(path)
+                if cached:
+                    return cached
+                os.makedirs(directory, exist_ok=True)
+                content_type, size = self._download(url, directory, path)
+            finally:
+                with self._lock:
+                    self._key_locks.pop(path, None)
+        
+        self._account(size)
+        return path, content_type
+    
+    def _lookup(self, path):
+        """Return (path, content type) of a complete cache entry and mark it used."""
+        try:
+            with open(path + '.type') as type_file:
+                content_type = type_file.read()
+            if not os.path.exists(path):
+                return None
+            os.utime(path + '.type')
+        except FileNotFoundError:
+            return None
+        return path, content_type
+    
+    def _download(self, url, directory, path):
+        import requests
+        
+        max_file_bytes = current_app.config.get('MEDIA_MAX_FILE_BYTES', 50 * 1024 * 1024)
+        timeout = current_app.config.get('MEDIA_TIMEOUT', 15)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.download-')
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as temp_file, \
+                    requests.get(url, stream=True, timeout=timeout) as response:
+                response.raise_for_status()
+                content_type = response.headers.get('Content-Type', 'application/octet-stream')
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    size += len(chunk)
+                    if size > max_file_bytes:
+                        raise MediaProxyError(f"Attachment larger than {max_file_bytes} bytes: {url}")
+                    temp_file.write(chunk)
+            # The type file goes first: a data file is only visible once complete
+            with open(path + '.type', 'w') as type_file:
+                type_file.write(content_type)
+            os.replace(temp_path, path)
+        except requests.RequestException as e:
+            os.unlink(temp_path)
+            raise MediaProxyError(f"Error fetching {url}: {e}")
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        logger.debug(f"Cached media {url} ({size} bytes)")
+        return content_type, size
+    
+    def _account(self, size):
+        """Track the cache size and evict when it exceeds MEDIA_CACHE_MAX_BYTES."""
+        max_bytes = current_app.config.get('MEDIA_CACHE_MAX_BYTES', 1024 * 1024 * 1024)
+        with self._lock:
+            if self._total_size is None:
+                self._total_size = sum(size for _, size, _ in self._entries())
+            else:
+                self._total_size += size
+            if self._total_size > max_bytes:
+                self._evict(max_bytes)
+    
+    def _entries(self):
+        """Yield (last use, size, path) of all cached files."""
+        root = current_app.config['MEDIA_CACHE_DIR']
+        for directory in os.scandir(root):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                if entry.name.startswith('.') or entry.name.endswith('.type'):
+                    continue
+                try:
+                    size = entry.stat().st_size
+                    last_used = os.stat(entry.path + '.type').st_mtime
+                except FileNotFoundError:
+                    continue
+                yield last_used, size, entry.path
+    
+    def _evict(self, max_bytes):
+        # Other workers share the directory, so re-read it rather than trust the counter
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        # Evict down to 90% of the cap so eviction doesn't run on every store
+        target = max_bytes * 0.9
+        evicted = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            for victim in (path, path + '.type'):
+                try:
+                    os.unlink(victim)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            evicted += 1
+        self._total_size = total
+        logger.info(f"Evicted {evicted} media files, cache now {total} bytes")
+
+media_cache = MediaCache()
@@ -1,4 +1,5 @@
 import datetime
+import gzip
 from app import db
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -39,6 +40,10 @@ class VKFeed(db.Model):
     include_attachments = db.Column(db.Boolean, default=True)
     include_comments = db.Column(db.Boolean, default=False)
     
+    # Keyword filters (one keyword per line or comma separated)
+    include_keywords = db.Column(db.Text)
+    exclude_keywords = db.Column(db.Text)
+    
     # Feed access control
     is_public = db.Column(db.Boolean, default=False)
     access_token = db.Column(db.String(64), unique=True)
@@ -47,6 +52,17 @@ class VKFeed(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
     last_fetched = db.Column(db.DateTime)
+    last_post_at = db.Column(db.DateTime)  # Date of the newest post seen in a build
+    
+    # Optional machine translation of the posts (target language code)
+    translate_to = db.Column(db.String(10))
+    
+    # Keyset pagination of the dashboard for each sort order
+    __table_args__ = (
+        db.Index('ix_vk_feed_user_title', 'user_id', 'title', 'id'),
+        db.Index('ix_vk_feed_user_source', 'user_id', 'vk_source_id', 'id'),
+        db.Index('ix_vk_feed_user_fetched', 'user_id', 'last_fetched', 'id'),
+    )
     
     def __repr__(self):
         return f'<VKFeed {self.title} ({self.vk_source_type}:{self.vk_source_id})>'
@@ -54,12 +70,212 @@ class VKFeed(db.Model):
 
 class FeedCache(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    feed_id = db.Column(db.Integer, db.ForeignKey('vk_feed.id'), nullable=False)
-    cached_content = db.Column(db.Text)
-    cached_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    feed_id = db.Column(db.Integer, db.ForeignKey('vk_feed.id'), nullable=False, unique=True, index=True)
+    # gzip-compressed RSS document; deferred so freshness checks don't load it
+    body = db.deferred(db.Column(db.LargeBinary))
+    content_size = db.Column(db.Integer, default=0)  # Uncompressed bytes
+    compressed_size = db.Column(db.Integer, default=0)  # Bytes stored in body
+    fingerprint = db.Column(db.String(64))  # Hash of the posts and settings the body was built from
+    cached_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
+    # Last read through the application; NULL while the feed has no snapshot
+    read_at = db.Column(db.DateTime, index=True)
     
     # Define the relationship to VKFeed
-    feed = db.relationship('VKFeed')
+    feed = db.relationship('VKFeed', backref=db.backref('cache', uselist=False, cascade="all, delete-orphan"))
+    
+    @staticmethod
+    def compress(content):
+        """Compress an RSS document for storage in ``body``."""
+        return gzip.compress(content.encode('utf-8'), compresslevel=6)
+    
+    @property
+    def cached_content(self):
+        """The cached RSS document as a string."""
+        return gzip.decompress(self.body).decode('utf-8') if self.body else None
     
     def __repr__(self):
         return f'<FeedCache for feed_id={self.feed_id}>'
+
+
+class FeedSource(db.Model):
+    """One VK source of a merged feed."""
+    id = db.Column(db.Integer, primary_key=True)
+    feed_id = db.Column(db.Integer, db.ForeignKey('vk_feed.id'), nullable=False, index=True)
+    vk_source_type = db.Column(db.String(20), nullable=False)  # 'user', 'group', 'page'
+    vk_source_id = db.Column(db.String(255), nullable=False)
+    position = db.Column(db.Integer, default=0)
+    
+    # Define the relationship to VKFeed
+    feed = db.relationship('VKFeed', backref=db.backref(
+        'sources', lazy=True, order_by='FeedSource.position', cascade="all, delete-orphan"))
+    
+    def __repr__(self):
+        return f'<FeedSource {self.vk_source_type}:{self.vk_source_id} of feed_id={self.feed_id}>'
+
+
+class SourceCache(db.Model):
+    """Raw wall posts of a single VK source, shared by every feed that uses it."""
+    id = db.Column(db.Integer, primary_key=True)
+    source_key = db.Column(db.String(255), unique=True, nullable=False, index=True)
+    posts_json = db.Column(db.Text)
+    fetched_count = db.Column(db.Integer, default=0)  # 'count' requested from wall.get
+    cached_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SourceCache for {self.source_key}>'
+
+
+class VKPost(db.Model):
+    """A wall post persisted at ingest time, used for search and archives."""
+    id = db.Column(db.Integer, primary_key=True)
+    owner_id = db.Column(db.BigInteger, nullable=False)
+    post_id = db.Column(db.BigInteger, nullable=False)
+    published_at = db.Column(db.DateTime, nullable=False)
+    edited = db.Column(db.Integer)  # VK 'edited' timestamp, if any
+    text = db.Column(db.Text)
+    data = db.Column(db.Text)  # Raw VK post as JSON
+    stored_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('owner_id', 'post_id', name='uq_vk_post_owner_post'),
+        db.Index('ix_vk_post_owner_published', 'owner_id', 'published_at'),
+        # Search results, newest first
+        db.Index('ix_vk_post_published', 'published_at', 'id'),
+    )
+    
+    def __repr__(self):
+        return f'<VKPost {self.owner_id}_{self.post_id}>'
+
+
+class SourceOwner(db.Model):
+    """Maps a normalized source key (screen name, URL ID) to its numeric VK owner ID."""
+    id = db.Column(db.Integer, primary_key=True)
+    source_key = db.Column(db.String(255), unique=True, nullable=False, index=True)
+    owner_id = db.Column(db.BigInteger, nullable=False, index=True)
+    resolved_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SourceOwner {self.source_key} -> {self.owner_id}>'
+
+
+class BackfillState(db.Model):
+    """Progress of paging a source's wall history into VKPost."""
+    id = db.Column(db.Integer, primary_key=True)
+    source_key = db.Column(db.String(255), unique=True, nullable=False, index=True)
+    next_offset = db.Column(db.Integer, default=0)
+    total_count = db.Column(db.Integer)  # Wall size reported by VK on the last page
+    oldest_published_at = db.Column(db.DateTime)  # Oldest post reached so far
+    completed_at = db.Column(db.DateTime)  # Set once the whole wall (or the cap) was read
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<BackfillState {self.source_key} offset={self.next_offset}>'
+
+
+class ArchivePage(db.Model):
+    """Rendered RFC 5005 archive document of one period of a feed; rebuilt only when the feed is edited."""
+    id = db.Column(db.Integer, primary_key=True)
+    feed_id = db.Column(db.Integer, db.ForeignKey('vk_feed.id'), nullable=False)
+    period = db.Column(db.String(7), nullable=False)  # 'YYYY-MM'
+    content = db.Column(db.Text)
+    etag = db.Column(db.String(64))
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    
+    # Define the relationship to VKFeed
+    feed = db.relationship('VKFeed', backref=db.backref(
+        'archive_pages', lazy='dynamic', cascade="all, delete-orphan"))
+    
+    __table_args__ = (
+        db.UniqueConstraint('feed_id', 'period', name='uq_archive_page_feed_period'),
+    )
+    
+    def __repr__(self):
+        return f'<ArchivePage feed_id={self.feed_id} period={self.period}>'
+
+
+class WebSubSubscription(db.Model):
+    """A WebSub subscriber callback registered with the built-in hub."""
+    id = db.Column(db.Integer, primary_key=True)
+    feed_id = db.Column(db.Integer, db.ForeignKey('vk_feed.id'), nullable=False, index=True)
+    topic = db.Column(db.String(512), nullable=False)
+    callback = db.Column(db.String(512), nullable=False)
+    secret = db.Column(db.String(200))
+    verified = db.Column(db.Boolean, default=False)
+    lease_expires_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    
+    # Define the relationship to VKFeed
+    feed = db.relationship('VKFeed', backref=db.backref(
+        'websub_subscriptions', lazy='dynamic', cascade="all, delete-orphan"))
+    
+    __table_args__ = (
+        db.UniqueConstraint('feed_id', 'callback', name='uq_websub_feed_callback'),
+    )
+    
+    def __repr__(self):
+        return f'<WebSubSubscription feed_id={self.feed_id} {self.callback}>'
+
+
+class RefreshLease(db.Model):
+    """Time-limited claim of a refresh job (a feed or a source) by one worker."""
+    id = db.Column(db.Integer, primary_key=True)
+    resource_key = db.Column(db.String(300), unique=True, nullable=False, index=True)  # e.g. 'feed:12', 'source:-1234'
+    owner = db.Column(db.String(200))  # Worker holding the lease
+    expires_at = db.Column(db.DateTime, index=True)  # NULL or past: free to claim
+    acquired_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<RefreshLease {self.resource_key} owner={self.owner}>'
+
+
+class Translation(db.Model):
+    """Machine translation of a text, keyed by the source text's SHA-256."""
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False)
+    target_lang = db.Column(db.String(10), nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    backend = db.Column(db.String(50))
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('content_hash', 'target_lang', name='uq_translation_hash_lang'),
+    )
+    
+    def __repr__(self):
+        return f'<Translation {self.content_hash[:12]} -> {self.target_lang}>'
+
+
+class OriginalPost(db.Model):
+    """A reposted original post (``copy_history`` entry), shared by every feed showing it."""
+    id = db.Column(db.Integer, primary_key=True)
+    owner_id = db.Column(db.BigInteger, nullable=False)
+    post_id = db.Column(db.BigInteger, nullable=False)
+    data = db.Column(db.Text, nullable=False)  # Raw VK post as JSON
+    fetched_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
+    
+    __table_args__ = (
+        db.UniqueConstraint('owner_id', 'post_id', name='uq_original_post_owner_post'),
+    )
+    
+    def __repr__(self):
+        return f'<OriginalPost {self.owner_id}_{self.post_id}>'
+
+
+def dialect_insert(model):
+    """
+    Get an INSERT construct supporting ON CONFLICT for the app database.
+    
+    Args:
+        model: Model class to insert into
+        
+    Returns:
+        Dialect-specific insert for PostgreSQL and SQLite, or None for other databases
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert(model)
@@ -0,0 +1,259 @@
+import json
+import logging
+import re
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import or_, text
+
+from models import VKPost, SourceOwner, dialect_insert
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# Search results per request are capped; this bounds the rows loaded and
+# returned, not the rows matched (see search_posts)
+MAX_SEARCH_RESULTS = 100
+
+_SEARCH_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+def is_postgres():
+    """Return True if the app database is PostgreSQL."""
+    return db.engine.dialect.name == 'postgresql'
+
+def ensure_search_index():
+    """
+    Create the full-text index over stored posts if it does not exist yet.
+    
+    SQLite gets an external-content FTS5 table kept in sync by triggers;
+    PostgreSQL gets a generated ``tsvector`` column with a GIN index.
+    """
+    if is_postgres():
+        ts_config = current_app.config.get('SEARCH_TS_CONFIG', 'simple')
+        statements = [
+            f"ALTER TABLE vk_post ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            f"GENERATED ALWAYS AS (to_tsvector('{ts_config}', coalesce(text, ''))) STORED",
+            "CREATE INDEX IF NOT EXISTS ix_vk_post_search ON vk_post USING GIN (search_vector)",
+        ]
+    elif db.engine.dialect.name == 'sqlite':
+        statements = [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS vk_post_fts USING fts5("
+            "text, content='vk_post', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+            "CREATE TRIGGER IF NOT EXISTS vk_post_ai AFTER INSERT ON vk_post BEGIN "
+            "INSERT INTO vk_post_fts(rowid, text) VALUES (new.id, new.text); END",
+            "CREATE TRIGGER IF NOT EXISTS vk_post_ad AFTER DELETE ON vk_post BEGIN "
+            "INSERT INTO vk_post_fts(vk_post_fts, rowid, text) VALUES ('delete', old.id, old.text); END",
+            "CREATE TRIGGER IF NOT EXISTS vk_post_au AFTER UPDATE OF text ON vk_post BEGIN "
+            "INSERT INTO vk_post_fts(vk_post_fts, rowid, text) VALUES ('delete', old.id, old.text); "
+            "INSERT INTO vk_post_fts(rowid, text) VALUES (new.id, new.text); END",
+        ]
+    else:
+        logger.warning(f"Full-text search is not supported on {db.engine.dialect.name}")
+        return
+    
+    with db.engine.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+
+def store_posts(posts, source_key=None):
+    """
+    Persist wall posts, inserting new ones and updating edited ones.
+    
+    Posts are written with a single upsert, so concurrent builds of a
+    source (or a build racing the backfill) never collide on a post.
+    
+    Args:
+        posts: List of VK posts as returned by wall.get
+        source_key: Normalized key of the source the posts were fetched from;
+            if given, it is mapped to the posts' owner ID
+            
+    Returns:
+        Number of inserted or updated posts
+    """
+    posts = [p for p in posts if p.get('id') and p.get('owner_id')]
+    if not posts:
+        return 0
+    
+    owner_changed = bool(source_key) and remember_source_owner(source_key, posts[0]['owner_id'])
+    
+    now = datetime.utcnow()
+    rows = {}
+    for post in posts:
+        rows[(post['owner_id'], post['id'])] = {
+            'owner_id': post['owner_id'],
+            'post_id': post['id'],
+            'published_at': datetime.utcfromtimestamp(post.get('date', 0)),
+            'edited': post.get('edited'),
+            'text': post.get('text', ''),
+            'data': json.dumps(post, ensure_ascii=False),
+            'stored_at': now
+        }
+    rows = list(rows.values())
+    
+    insert = dialect_insert(VKPost)
+    if insert is not None:
+        statement = insert.values(rows)
+        excluded = statement.excluded
+        # Unchanged posts are left alone so the search index is not rewritten
+        result = db.session.execute(statement.on_conflict_do_update(
+            index_elements=['owner_id', 'post_id'],
+            set_={key: excluded[key] for key in ('published_at', 'edited', 'text', 'data', 'stored_at')},
+            where=or_(VKPost.edited.is_distinct_from(excluded.edited), VKPost.text.is_distinct_from(excluded.text))
+        ))
+        changed = max(result.rowcount, 0)
+    else:
+        changed = _store_rows(rows)
+    
+    if changed or owner_changed:
+        db.session.commit()
+        logger.debug(f"Stored {changed} posts")
+    
+    return changed
+
+def _store_rows(rows):
+    """Insert or update posts one by one, for databases without ON CONFLICT."""
+    existing = {
+        (row.owner_id, row.post_id): row
+        for row in VKPost.query.filter(
+            VKPost.owner_id.in_({values['owner_id'] for values in rows}),
+            VKPost.post_id.in_([values['post_id'] for values in rows])
+        )
+    }
+    changed = 0
+    for values in rows:
+        row = existing.get((values['owner_id'], values['post_id']))
+        if row is None:
+            db.session.add(VKPost(**values))
+        elif row.edited == values['edited'] and row.text == values['text']:
+            continue
+        else:
+            for key, value in values.items():
+                setattr(row, key, value)
+        changed += 1
+    return changed
+
+def remember_source_owner(source_key, owner_id):
+    """
+    Record which numeric owner ID a source key resolves to.
+    
+    Args:
+        source_key: Normalized source key
+        owner_id: Numeric VK owner ID (negative for communities)
+        
+    Returns:
+        True if the mapping was added or changed (not yet committed)
+    """
+    insert = dialect_insert(SourceOwner)
+    if insert is not None:
+        statement = insert.values(source_key=source_key, owner_id=owner_id, resolved_at=datetime.utcnow())
+        result = db.session.execute(statement.on_conflict_do_update(
+            index_elements=['source_key'],
+            set_={'owner_id': statement.excluded.owner_id, 'resolved_at': statement.excluded.resolved_at},
+            where=SourceOwner.owner_id != statement.excluded.owner_id
+        ))
+        return result.rowcount > 0
+    
+    mapping = SourceOwner.query.filter_by(source_key=source_key).first()
+    if mapping is None:
+        db.session.add(SourceOwner(source_key=source_key, owner_id=owner_id))
+    elif mapping.owner_id != owner_id:
+        mapping.owner_id = owner_id
+        mapping.resolved_at = datetime.utcnow()
+    else:
+        return False
+    return True
+
+def get_owner_ids(source_keys):
+    """
+    Look up the numeric owner IDs of already ingested sources.
+    
+    Args:
+        source_keys: Iterable of normalized source keys
+        
+    Returns:
+        List of owner IDs; sources never ingested are left out
+    """
+    source_keys = list(set(source_keys))
+    if not source_keys:
+        return []
+    rows = SourceOwner.query.filter(SourceOwner.source_key.in_(source_keys)).all()
+    return sorted({row.owner_id for row in rows})
+
+def build_match_query(query):
+    """
+    Turn free user input into a safe full-text query.
+    
+    Every word becomes a quoted FTS5 term (implicit AND), so operators and
+    punctuation in user input can never produce a syntax error.
+    
+    Args:
+        query: Raw search string
+        
+    Returns:
+        FTS5 MATCH expression, or an empty string if there is nothing to search
+    """
+    terms = _SEARCH_TOKEN_RE.findall(query or '')[:16]
+    return ' '.join(f'"{term}"' for term in terms)
+
+def search_posts(query, owner_ids, limit=20, offset=0):
+    """
+    Search stored posts of the given owners, newest first.
+    
+    Results are ordered by publication date rather than by relevance. The
+    full-text index cannot return rows in date order, so every post
+    matching the query is looked up, filtered by owner and sorted (a
+    temporary B-tree on SQLite, a sort after the GIN bitmap scan on
+    PostgreSQL) before ``limit`` and ``offset`` apply. The cost grows with
+    the number of stored posts matching the terms, across all owners, not
+    with ``limit``: common words on a large store are the slow case. Row
+    IDs follow ingest order, not post age (wall pages are stored newest
+    first and backfill adds older history later), so they only break ties.
+    
+    Args:
+        query: Raw search string
+        owner_ids: Owner IDs to search in
+        limit: Maximum number of results (capped at MAX_SEARCH_RESULTS)
+        offset: Number of results to skip
+        
+    Returns:
+        List of VKPost instances
+    """
+    limit = max(1, min(int(limit), MAX_SEARCH_RESULTS))
+    offset = max(0, int(offset))
+    owner_ids = list(owner_ids)
+    if not owner_ids or not query or not query.strip():
+        return []
+    
+    params = {'limit': limit, 'offset': offset}
+    owner_params = []
+    for i, owner_id in enumerate(owner_ids):
+        params[f'owner_{i}'] = owner_id
+        owner_params.append(f':owner_{i}')
+    owner_filter = ', '.join(owner_params)
+    
+    if is_postgres():
+        params['query'] = query
+        params['ts_config'] = current_app.config.get('SEARCH_TS_CONFIG', 'simple')
+        sql = (
+            "SELECT id FROM vk_post "
+            "WHERE search_vector @@ websearch_to_tsquery(CAST(:ts_config AS regconfig), :query) "
+            f"AND owner_id IN ({owner_filter}) "
+            "ORDER BY published_at DESC, id DESC LIMIT :limit OFFSET :offset"
+        )
+    else:
+        match = build_match_query(query)
+        if not match:
+            return []
+        params['query'] = match
+        sql = (
+            "SELECT vk_post.id FROM vk_post_fts JOIN vk_post ON vk_post.id = vk_post_fts.rowid "
+            f"WHERE vk_post_fts MATCH :query AND vk_post.owner_id IN ({owner_filter}) "
+            "ORDER BY vk_post.published_at DESC, vk_post.id DESC LIMIT :limit OFFSET :offset"
+        )
+    
+    ids = [row[0] for row in db.session.execute(text(sql), params)]
+    if not ids:
+        return []
+    
+    posts = {post.id: post for post in VKPost.query.filter(VKPost.id.in_(ids))}
+    return [posts[post_id] for post_id in ids if post_id in posts]
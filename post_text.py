@@ -0,0 +1,88 @@
+import re
+from urllib.parse import quote
+
+# Every construct rendered from VK post text, matched by one precompiled
+# alternation so the text is scanned once. Plain runs between matches only
+# need escaping, which str.replace does at C speed. The leading lookahead
+# lets the scan skip ahead to the few characters a token can start with.
+TOKEN_RE = re.compile(r'''
+    (?=[\[h\#\r\n])
+    (?:
+        \[(?P<mention_type>id|club|public|event)(?P<mention_id>\d+)\|(?P<mention_name>[^\]\n]*)\]
+      | (?P<url>https?://[^\s<>"'\[\]]+)
+      | \#(?P<hashtag>\w+(?:@\w+)?)
+      | (?P<newline>\r?\n)
+    )
+''', re.VERBOSE)
+
+# Characters ending a sentence rather than a URL
+URL_TRAILING = '.,!?:;)'
+
+def _escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;') \
+        .replace('"', '&quot;').replace("'", '&#x27;')
+
+def escape_html(text):
+    """Escape text for HTML content and quoted attribute values."""
+    return _escape(str(text))
+
+def escape_url(url):
+    """
+    Escape a URL for an href or src attribute.
+    
+    Returns:
+        Escaped URL, or None unless it is an http(s) URL
+    """
+    if not isinstance(url, str) or not url.lower().startswith(('http://', 'https://')):
+        return None
+    return _escape(url)
+
+def _render_url(url):
+    stripped = url.rstrip(URL_TRAILING)
+    # Keep a closing parenthesis that belongs to the URL, as in Wikipedia links
+    if url[len(stripped):].startswith(')') and stripped.count('(') > stripped.count(')'):
+        stripped += ')'
+    href = _escape(stripped)
+    return f'<a href="{href}" target="_blank">{href}</a>{_escape(url[len(stripped):])}'
+
+def _render_token(match):
+    kind = match.lastgroup
+    if kind == 'newline':
+        return '<br />'
+    if kind == 'url':
+        return _render_url(match.group('url'))
+    if kind == 'hashtag':
+        tag = match.group('hashtag')
+        return (f'<a href="https://vk.com/feed?section=search&amp;q=%23{quote(tag, safe="")}" '
+                f'target="_blank">#{_escape(tag)}</a>')
+    name = match.group('mention_name')
+    return (f'<a href="https://vk.com/{match.group("mention_type")}{match.group("mention_id")}" '
+            f'target="_blank">{_escape(name)}</a>')
+
+def render_post_text(text):
+    """
+    Render VK post text as HTML in a single scan.
+    
+    HTML special characters are escaped, line breaks become ``<br />`` and
+    ``[id123|Name]``/``[club1|Group]`` mentions, ``#hashtags`` and bare URLs
+    become links.
+    
+    Args:
+        text: Raw post text
+        
+    Returns:
+        HTML fragment
+    """
+    parts = []
+    position = 0
+    for match in TOKEN_RE.finditer(text):
+        start = match.start()
+        # URLs and hashtags glued to a preceding word are plain text
+        if start and match.lastgroup in ('url', 'hashtag') and (text[start - 1].isalnum() or text[start - 1] in '_&'):
+            continue
+        if start > position:
+            parts.append(_escape(text[position:start]))
+        parts.append(_render_token(match))
+        position = match.end()
+    parts.append(_escape(text[position:]))
+    return ''.join(parts)
@@ -0,0 +1,134 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from vk_api import VKAPIError, USERS_GET_MAX_IDS, GROUPS_GET_MAX_IDS
+
+logger = logging.getLogger(__name__)
+
+def profile_name(profile):
+    """Return the display name of a user from users.get or wall.get profiles."""
+    return ' '.join(part for part in (profile.get('first_name'), profile.get('last_name')) if part)
+
+def post_author_id(post):
+    """
+    Get the ID of the author shown for a post.
+    
+    The signer of a community post wins over the publisher; users are
+    positive and communities negative, as in ``owner_id``.
+    """
+    return post.get('signer_id') or post.get('from_id') or post.get('owner_id')
+
+class ProfileCache:
+    """
+    Process-wide cache of user and community names with a TTL.
+    
+    Keys are signed IDs (users positive, communities negative). IDs VK did
+    not return a name for are cached as None so they are not asked for again
+    until they expire. The least recently stored entries are dropped beyond
+    PROFILE_CACHE_MAX_ENTRIES.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+    
+    def get_many(self, ids):
+        """
+        Look up cached names.
+        
+        Args:
+            ids: Signed user/community IDs
+        
+        Returns:
+            Tuple (names, missing): dict of cached names (None for IDs known
+            to have no name) and list of IDs not in the cache
+        """
+        now = time.monotonic()
+        names = {}
+        missing = []
+        with self._lock:
+            for owner_id in ids:
+                entry = self._entries.get(owner_id)
+                if entry is not None and entry[1] > now:
+                    names[owner_id] = entry[0]
+                else:
+                    missing.append(owner_id)
+        return names, missing
+    
+    def store(self, names):
+        """
+        Store names.
+        
+        Args:
+            names: Dict mapping signed IDs to names (or None)
+        """
+        if not names:
+            return
+        config = current_app.config
+        expires = time.monotonic() + config.get('PROFILE_CACHE_TTL', 86400)
+        max_entries = config.get('PROFILE_CACHE_MAX_ENTRIES', 100000)
+        with self._lock:
+            for owner_id, name in names.items():
+                self._entries.pop(owner_id, None)
+                self._entries[owner_id] = (name, expires)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+    
+    def remember(self, profiles=None, groups=None):
+        """
+        Store the profiles and groups of an ``extended=1`` response.
+        
+        Args:
+            profiles: List of users in users.get format
+            groups: List of communities in groups.getById format
+        """
+        names = {profile['id']: profile_name(profile) or None for profile in profiles or () if profile.get('id')}
+        names.update((-group['id'], group.get('name') or None) for group in groups or () if group.get('id'))
+        self.store(names)
+
+profile_cache = ProfileCache()
+
+def resolve_names(client, ids):
+    """
+    Get the names of users and communities, asking VK only for unknown ones.
+    
+    Cache misses are fetched with one users.get and one groups.getById call
+    per batch of IDs. When VK fails the names are left out and the caller
+    falls back to the IDs.
+    
+    Args:
+        client: VKAPIClient instance
+        ids: Iterable of signed user/community IDs
+    
+    Returns:
+        Dict mapping signed IDs to names, for the IDs with a known name
+    """
+    unique = list(dict.fromkeys(owner_id for owner_id in ids if isinstance(owner_id, int) and owner_id))
+    names, missing = profile_cache.get_many(unique)
+    
+    user_ids = [owner_id for owner_id in missing if owner_id > 0]
+    group_ids = [-owner_id for owner_id in missing if owner_id < 0]
+    fetched = {}
+    try:
+        for start in range(0, len(user_ids), USERS_GET_MAX_IDS):
+            batch = dict.fromkeys(user_ids[start:start + USERS_GET_MAX_IDS])
+            batch.update((user['id'], profile_name(user) or None) for user in client.get_users(list(batch)))
+            fetched.update(batch)
+        for start in range(0, len(group_ids), GROUPS_GET_MAX_IDS):
+            batch = dict.fromkeys(-group_id for group_id in group_ids[start:start + GROUPS_GET_MAX_IDS])
+            batch.update((-group['id'], group.get('name') or None)
+                         for group in client.get_groups([-group_id for group_id in batch]))
+            fetched.update(batch)
+    except VKAPIError as e:
+        # Batches that completed are still cached
+        logger.warning(f"Failed to resolve {len(missing)} author names: {e}")
+    
+    if missing:
+        profile_cache.store(fetched)
+        logger.debug(f"Resolved {len(fetched)} of {len(missing)} uncached author names")
+    names.update(fetched)
+    return {owner_id: name for owner_id, name in names.items() if name}
@@ -0,0 +1,262 @@
+import fcntl
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+# Slot layout: key hash, feed ID, window number, previous window count,
+# current window count, lifetime requests, lifetime throttled
+SLOT = struct.Struct('<QqqIIQQ')
+HEADER = struct.Struct('<8sII')
+MAGIC = b'vk2rsrl3'
+
+# Slots probed for a key before the least recently used one is taken over
+MAX_PROBES = 8
+
+def _hash(value):
+    # 0 marks an empty slot
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+
+def feed_etag(content):
+    """Return the ETag of a rendered feed."""
+    return f'{_hash(content):016x}'
+
+def client_key(feed, token, remote_addr):
+    """
+    Get the limiter bucket of a feed request.
+    
+    Requests with the feed's own token share the token's bucket, wherever
+    they come from. Anything else (public access, or a token a public feed
+    does not check) is counted per client address, so readers of a popular
+    public feed do not lock each other out and made-up tokens do not buy
+    fresh buckets.
+    
+    Args:
+        feed: Requested VKFeed, already authorized
+        token: Token from the query string
+        remote_addr: Client address
+    
+    Returns:
+        Bucket key
+    """
+    if token and token == feed.access_token:
+        return f'{feed.id}:token:{token}'
+    return f'{feed.id}:addr:{remote_addr or ""}'
+
+class SlidingWindowTable:
+    """
+    Fixed-size table of sliding window counters in a shared memory file.
+    
+    Every worker process on a host maps the same file (on /dev/shm when it
+    exists) and updates it under an exclusive flock, so the windows are
+    shared across workers without a network round trip. Rates are estimated
+    with the sliding window counter method: the previous fixed window's
+    count weighted by its remaining overlap plus the current window's count.
+    """
+    
+    def __init__(self, path, slots, window):
+        """
+        Initialize the table (the file is mapped on first use).
+        
+        Args:
+            path: Shared memory file
+            slots: Number of counters
+            window: Window length in seconds
+        """
+        self.path = path
+        self.slots = slots
+        self.window = window
+        self._lock = threading.Lock()
+        self._pid = None
+        self._file = None
+        self._map = None
+    
+    def _open(self):
+        """Map the file, (re)initializing it if its layout differs."""
+        size = HEADER.size + self.slots * SLOT.size
+        self._file = os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600), 'r+b')
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        try:
+            self._file.seek(0)
+            header = self._file.read(HEADER.size)
+            if len(header) < HEADER.size or HEADER.unpack(header) != (MAGIC, self.slots, int(self.window)):
+                self._file.truncate(0)
+                self._file.truncate(size)
+                self._file.seek(0)
+                self._file.write(HEADER.pack(MAGIC, self.slots, int(self.window)))
+                self._file.flush()
+        finally:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._pid = os.getpid()
+    
+    def _slot_offset(self, index):
+        return HEADER.size + index * SLOT.size
+    
+    def _find(self, key_hash):
+        """Return (offset, slot values) of a key, claiming a slot if it is new."""
+        start = key_hash % self.slots
+        victim = None
+        for probe in range(MAX_PROBES):
+            offset = self._slot_offset((start + probe) % self.slots)
+            values = SLOT.unpack_from(self._map, offset)
+            if values[0] == key_hash:
+                return offset, values
+            if values[0] == 0:
+                return offset, (key_hash, 0, 0, 0, 0, 0, 0)
+            if victim is None or values[2] < victim[1][2]:
+                victim = (offset, values)
+        return victim[0], (key_hash, 0, 0, 0, 0, 0, 0)
+    
+    def _roll(self, values, window_number):
+        """Advance a slot to the current window."""
+        key_hash, feed_id, number, previous, current, total, throttled = values
+        if number != window_number:
+            previous = current if number == window_number - 1 else 0
+            current = 0
+        return key_hash, feed_id, window_number, previous, current, total, throttled
+    
+    def _rate(self, previous, current, now):
+        elapsed = (now % self.window) / self.window
+        return previous * (1 - elapsed) + current
+    
+    def update(self, key, func):
+        """
+        Atomically read, modify and write the slot of a key.
+        
+        Args:
+            key: Counter key
+            func: Called with (slot values rolled to the current window, now);
+                returns (new slot values, result)
+        
+        Returns:
+            The result of func
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._open()
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                offset, values = self._find(_hash(key))
+                values, result = func(self._roll(values, int(now // self.window)), now)
+                SLOT.pack_into(self._map, offset, *values)
+                return result
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+    
+    def scan(self):
+        """Return all used slots rolled to the current window, with the current time."""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._open()
+            fcntl.flock(self._file, fcntl.LOCK_SH)
+            try:
+                now = time.time()
+                window_number = int(now // self.window)
+                slots = (SLOT.unpack_from(self._map, self._slot_offset(index)) for index in range(self.slots))
+                return [self._roll(values, window_number) for values in slots if values[0]], now
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+
+class ReaderLimiter:
+    """Per feed and client request limits plus per-feed request statistics."""
+    
+    def __init__(self):
+        self._tables = None
+        self._init_lock = threading.Lock()
+    
+    def _get_tables(self):
+        if self._tables is None:
+            with self._init_lock:
+                if self._tables is None:
+                    config = current_app.config
+                    directory = config.get('READER_LIMIT_DIR') or \
+                        ('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir())
+                    window = config.get('READER_LIMIT_WINDOW', 300)
+                    slots = config.get('READER_LIMIT_SLOTS', 8192)
+                    self._tables = (
+                        SlidingWindowTable(os.path.join(directory, 'vk2rss-reader-limits'), slots, window),
+                        SlidingWindowTable(os.path.join(directory, 'vk2rss-feed-stats'), slots, window),
+                    )
+        return self._tables
+    
+    def check(self, feed_id, client):
+        """
+        Count a feed request and decide whether it is served.
+        
+        Args:
+            feed_id: Requested feed
+            client: Bucket key from client_key
+        
+        Returns:
+            Tuple (allowed, retry_after): retry_after is in seconds, 0 when
+            the request is allowed
+        """
+        limits, stats = self._get_tables()
+        limit = current_app.config.get('READER_LIMIT_REQUESTS', 30)
+        
+        def count(values, now):
+            key_hash, _, number, previous, current, total, throttled = values
+            if limits._rate(previous, current, now) + 1 <= limit:
+                return (key_hash, feed_id, number, previous, current + 1, total + 1, throttled), (True, 0)
+            return (key_hash, feed_id, number, previous, current, total + 1, throttled + 1), \
+                (False, self._retry_after(limits, previous, current, limit, now))
+        
+        allowed, retry_after = limits.update(client, count)
+        
+        def record(values, now):
+            key_hash, _, number, previous, current, total, throttled = values
+            return (key_hash, feed_id, number, previous, current + 1, total + 1,
+                    throttled + (not allowed)), None
+        
+        stats.update(f'feed:{feed_id}', record)
+        return allowed, retry_after
+    
+    @staticmethod
+    def _retry_after(table, previous, current, limit, now):
+        """Seconds until the estimated rate leaves room for one more request."""
+        window = table.window
+        elapsed = now % window
+        excess = table._rate(previous, current, now) + 1 - limit
+        # The previous window's weight decays by previous / window per second
+        if previous and excess <= previous * (window - elapsed) / window:
+            return max(1, math.ceil(excess * window / previous))
+        # Otherwise wait for this window to become the decaying previous one
+        wait = window - elapsed
+        if current + 1 > limit:
+            wait += window * (1 - (limit - 1) / current)
+        return max(1, math.ceil(wait))
+    
+    def feed_stats(self, limit=50):
+        """
+        Get request statistics of the most requested feeds.
+        
+        Args:
+            limit: Number of feeds to return
+        
+        Returns:
+            List of dicts ('feed_id', 'requests_per_minute', 'total',
+            'throttled'), hottest first, as seen by this host
+        """
+        _, stats = self._get_tables()
+        slots, now = stats.scan()
+        rows = [{
+            'feed_id': feed_id,
+            'requests_per_minute': round(stats._rate(previous, current, now) * 60 / stats.window, 2),
+            'total': total,
+            'throttled': throttled,
+        } for _, feed_id, _, previous, current, total, throttled in slots]
+        rows.sort(key=lambda row: (row['requests_per_minute'], row['total']), reverse=True)
+        return rows[:limit]
+
+reader_limiter = ReaderLimiter()
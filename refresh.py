@@ -0,0 +1,146 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, or_
+
+from models import VKFeed, FeedCache, WebSubSubscription
+from feed_generator import create_feed_generator
+from leases import claim_leases, release_leases, keep_leases, feed_lease_key
+from cache_sweeper import sweep_if_due
+from snapshot import expire_idle_snapshots
+from app import db
+
+logger = logging.getLogger(__name__)
+
+def get_due_push_feed_ids():
+    """
+    Get the IDs of feeds with active WebSub subscribers whose cache expired.
+    
+    Those readers no longer poll, so the server refreshes the feeds itself.
+    Expired subscriptions are removed on the way.
+    
+    Returns:
+        List of feed IDs, least recently built first
+    """
+    now = datetime.utcnow()
+    WebSubSubscription.query.filter(WebSubSubscription.lease_expires_at <= now).delete()
+    db.session.commit()
+    
+    stale_before = now - timedelta(seconds=current_app.config.get('FEED_CACHE_TIMEOUT', 300))
+    rows = (db.session.query(WebSubSubscription.feed_id)
+            .outerjoin(FeedCache, FeedCache.feed_id == WebSubSubscription.feed_id)
+            .filter(WebSubSubscription.verified.is_(True))
+            .filter(or_(FeedCache.cached_at.is_(None), FeedCache.cached_at < stale_before))
+            .group_by(WebSubSubscription.feed_id)
+            .order_by(func.min(FeedCache.cached_at))
+            .all())
+    return [row[0] for row in rows]
+
+def get_due_snapshot_feed_ids():
+    """
+    Get the IDs of feeds exported as static snapshots whose cache expired.
+    
+    Snapshot readers are served by the web server and never reach the
+    application, so the server keeps the snapshots of feeds read through
+    the application within SNAPSHOT_IDLE_TIMEOUT fresh itself.
+    
+    Returns:
+        List of feed IDs, least recently built first
+    """
+    if not current_app.config.get('SNAPSHOT_ENABLED'):
+        return []
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=current_app.config.get('FEED_CACHE_TIMEOUT', 300))
+    idle_before = now - timedelta(seconds=current_app.config.get('SNAPSHOT_IDLE_TIMEOUT', 86400))
+    rows = (db.session.query(FeedCache.feed_id)
+            .filter(FeedCache.cached_at < stale_before, FeedCache.read_at >= idle_before)
+            .order_by(FeedCache.cached_at)
+            .all())
+    return [row[0] for row in rows]
+
+def refresh_feeds(feed_ids):
+    """
+    Rebuild the given feeds whose cache has expired.
+    
+    The caller holds the refresh leases of the feeds. New posts found by
+    a rebuild are pushed to WebSub subscribers by the feed generator.
+    
+    Args:
+        feed_ids: List of feed IDs
+        
+    Returns:
+        Number of feeds processed
+    """
+    refreshed = 0
+    for feed in VKFeed.query.filter(VKFeed.id.in_(feed_ids)):
+        try:
+            create_feed_generator(feed).generate_feed(leased=True)
+            refreshed += 1
+        except Exception as e:
+            logger.exception(f"Background refresh of feed_id={feed.id} failed: {e}")
+            db.session.rollback()
+    return refreshed
+
+def refresh_due_feeds():
+    """
+    Run one refresh pass over the due push-subscribed and snapshot feeds.
+    
+    Snapshots of feeds gone idle are removed first. Feeds are claimed through refresh leases, at most REFRESH_BATCH_SIZE per
+    pass, so every worker on every node takes a disjoint share of the work.
+    A worker that dies leaves its leases to expire and be reclaimed.
+    
+    Returns:
+        Number of feeds refreshed by this worker
+    """
+    expire_idle_snapshots()
+    feed_ids = list(dict.fromkeys(get_due_push_feed_ids() + get_due_snapshot_feed_ids()))
+    if not feed_ids:
+        return 0
+    
+    owner, keys = claim_leases([feed_lease_key(feed_id) for feed_id in feed_ids],
+                               limit=current_app.config.get('REFRESH_BATCH_SIZE', 50))
+    claimed_ids = [int(key.split(':', 1)[1]) for key in keys]
+    try:
+        with keep_leases(keys, owner):
+            return refresh_feeds(claimed_ids)
+    finally:
+        release_leases(keys, owner)
+
+class FeedRefresher:
+    """Background thread periodically refreshing push-subscribed and snapshot feeds and sweeping the feed cache."""
+    
+    def __init__(self):
+        self._thread = None
+        self._stop = threading.Event()
+        
+    def start(self, app):
+        """
+        Start the refresh thread if it is not running yet.
+        
+        Args:
+            app: Flask application the thread runs under
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(app,), name='feed-refresh', daemon=True)
+        self._thread.start()
+        
+    def stop(self):
+        """Ask the refresh thread to exit after the current pass."""
+        self._stop.set()
+        
+    def _run(self, app):
+        interval = app.config.get('REFRESH_INTERVAL', 60)
+        while not self._stop.wait(interval):
+            try:
+                # url_for needs a request context to build external URLs
+                with app.test_request_context(base_url=app.config.get('SITE_URL')):
+                    refresh_due_feeds()
+                    sweep_if_due()
+            except Exception as e:
+                logger.exception(f"Background refresh pass failed: {e}")
+
+feed_refresher = FeedRefresher()
@@ -0,0 +1,149 @@
+import json
+import logging
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from models import OriginalPost, dialect_insert
+from vk_api import VKAPIError, WALL_GET_BY_ID_MAX_IDS
+from app import db
+
+logger = logging.getLogger(__name__)
+
+def post_key(post):
+    """Return the (owner_id, post_id) key of a post."""
+    return post.get('owner_id'), post.get('id')
+
+def repost_keys(post):
+    """Return the keys of the posts in a post's ``copy_history``, outermost first."""
+    return [post_key(item) for item in post.get('copy_history') or () if item.get('owner_id') and item.get('id')]
+
+def is_complete(item):
+    """Return True if a copy_history entry carries content rather than just its IDs."""
+    return bool(item.get('text') or item.get('attachments') or item.get('copy_history'))
+
+def dedupe_reposts(posts):
+    """
+    Drop entries repeating an original already in the feed.
+    
+    A repost is dropped when the post it ultimately reposts is itself in
+    the list or was reposted by an earlier (newer) entry.
+    
+    Args:
+        posts: List of VK posts in feed order
+    
+    Returns:
+        List of posts
+    """
+    seen = {post_key(post) for post in posts}
+    result = []
+    for post in posts:
+        keys = repost_keys(post)
+        if keys:
+            original = keys[-1]
+            if original in seen:
+                continue
+            seen.add(original)
+        result.append(post)
+    if len(result) < len(posts):
+        logger.debug(f"Dropped {len(posts) - len(result)} duplicate reposts")
+    return result
+
+def resolve_originals(client, posts):
+    """
+    Get the reposted originals of posts from the shared original-post cache.
+    
+    Originals that came complete in ``copy_history`` are stored as they
+    are; the rest are fetched with batched wall.getById calls. Cached
+    originals older than ORIGINAL_POST_TTL are refreshed the same way.
+    
+    Args:
+        client: VKAPIClient instance
+        posts: List of VK posts
+    
+    Returns:
+        Dict mapping (owner_id, post_id) to original posts
+    """
+    inline = {}
+    for post in posts:
+        for item in post.get('copy_history') or ():
+            key = post_key(item)
+            if key[0] and key[1] and (key not in inline or is_complete(item)):
+                inline[key] = item
+    if not inline:
+        return {}
+    
+    fresh_after = datetime.utcnow() - timedelta(seconds=current_app.config.get('ORIGINAL_POST_TTL', 86400))
+    originals = {}
+    rows = OriginalPost.query.filter(
+        OriginalPost.owner_id.in_({owner_id for owner_id, _ in inline}),
+        OriginalPost.post_id.in_({post_id for _, post_id in inline}),
+        OriginalPost.fetched_at >= fresh_after
+    )
+    for row in rows:
+        if (row.owner_id, row.post_id) in inline:
+            originals[(row.owner_id, row.post_id)] = json.loads(row.data)
+    
+    new = {key: item for key, item in inline.items() if key not in originals and is_complete(item)}
+    missing = [key for key in inline if key not in originals and key not in new]
+    try:
+        for start in range(0, len(missing), WALL_GET_BY_ID_MAX_IDS):
+            batch = missing[start:start + WALL_GET_BY_ID_MAX_IDS]
+            # Deleted or hidden originals are cached as their stubs, so they
+            # are not asked for again on every build
+            items = client.get_posts_by_id(batch)
+            new.update((key, inline[key]) for key in batch)
+            new.update((post_key(item), item) for item in items)
+    except VKAPIError as e:
+        logger.warning(f"Failed to fetch {len(missing)} reposted originals: {e}")
+    
+    if new:
+        _store(new)
+        logger.debug(f"Cached {len(new)} reposted originals ({len(missing)} fetched, {len(originals)} cached)")
+    originals.update(new)
+    return originals
+
+def _store(originals):
+    """Insert or refresh originals in the cache."""
+    now = datetime.utcnow()
+    rows = [{'owner_id': owner_id, 'post_id': post_id, 'fetched_at': now,
+             'data': json.dumps(item, ensure_ascii=False)}
+            for (owner_id, post_id), item in originals.items()]
+    insert = dialect_insert(OriginalPost)
+    if insert is not None:
+        statement = insert.values(rows)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['owner_id', 'post_id'],
+            set_={'data': statement.excluded.data, 'fetched_at': statement.excluded.fetched_at}
+        ))
+    else:
+        existing = {
+            (row.owner_id, row.post_id): row
+            for row in OriginalPost.query.filter(
+                OriginalPost.owner_id.in_({row['owner_id'] for row in rows}),
+                OriginalPost.post_id.in_({row['post_id'] for row in rows})
+            )
+        }
+        for values in rows:
+            row = existing.get((values['owner_id'], values['post_id']))
+            if row is None:
+                db.session.add(OriginalPost(**values))
+            else:
+                row.data = values['data']
+                row.fetched_at = now
+    db.session.commit()
+
+def delete_expired_originals(max_age):
+    """
+    Delete cached originals no feed has shown for a while.
+    
+    Args:
+        max_age: Age in seconds after which a cached original is deleted
+    
+    Returns:
+        Number of rows deleted
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age)
+    deleted = OriginalPost.query.filter(OriginalPost.fetched_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
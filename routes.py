@@ -1,16 +1,79 @@
 import os
+import json
 import logging
 from datetime import datetime
-from flask import render_template, redirect, url_for, flash, request, abort, Response, jsonify
+from functools import wraps
+from flask import render_template, redirect, url_for, flash, request, abort, Response, jsonify, current_app, send_file
 from flask_login import login_user, logout_user, login_required, current_user
 
 from app import app, db
-from models import User, VKFeed
-from vk_api import VKAPIClient, VKAPIError, get_source_info
-from feed_generator import RSSFeedGenerator, generate_access_token
+from models import User, VKFeed, FeedSource, ArchivePage
+from vk_api import VKAPIClient, VKAPIError, get_source_info, extract_vk_id_from_url
+from feed_generator import create_feed_generator, generate_access_token
+from post_store import search_posts, get_owner_ids, MAX_SEARCH_RESULTS
+from archive import get_archive_page, PERIOD_RE
+from websub import hub, WebSubError
+from reader_limits import reader_limiter, client_key, feed_etag
+from translator import TRANSLATION_LANGUAGES
+from media_proxy import media_cache, decode_media_url, MediaProxyError, MEDIA_MAX_AGE
+from feed_listing import SORT_COLUMNS, list_feeds, get_cache_status, decode_cursor as decode_feed_cursor
+from snapshot import remove_snapshot, mark_read as mark_snapshot_read
+from feed_preview import decode_cursor, get_preview_page, serialize_entry
 
 logger = logging.getLogger(__name__)
 
+def admin_required(view):
+    """Restrict a view to users listed in ADMIN_USERNAMES."""
+    @wraps(view)
+    @login_required
+    def wrapped(*args, **kwargs):
+        if current_user.username not in current_app.config.get('ADMIN_USERNAMES', []):
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapped
+
+def parse_translate_to(value):
+    """Return the target language chosen in a feed form, or None for no translation."""
+    return value if value in dict(TRANSLATION_LANGUAGES) else None
+
+def parse_merged_sources(text):
+    """
+    Parse the source list of a merged feed.
+    
+    Args:
+        text: Sources separated by newlines or commas; anything after '#' on a line is ignored
+        
+    Returns:
+        List of unique source IDs in the order given
+    """
+    sources = []
+    for line in (text or '').split('\n'):
+        line = line.split('#', 1)[0]
+        for item in line.split(','):
+            item = item.strip()
+            if not item:
+                continue
+            source_id = extract_vk_id_from_url(item)
+            if source_id not in sources:
+                sources.append(source_id)
+    return sources
+
+def set_feed_sources(feed, source_ids):
+    """
+    Replace the sources of a merged feed.
+    
+    Args:
+        feed: VKFeed model instance
+        source_ids: List of VK source IDs
+    """
+    feed.sources = [
+        FeedSource(vk_source_type='group', vk_source_id=source_id, position=position)
+        for position, source_id in enumerate(source_ids)
+    ]
+    # Summary for listings; the authoritative list lives in FeedSource
+    summary = ', '.join(source_ids)
+    feed.vk_source_id = summary if len(summary) <= 255 else summary[:252] + '...'
+
 @app.route('/')
 def index():
     """Home page route."""
@@ -92,29 +155,19 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    """User dashboard showing their feeds."""
+    """User dashboard showing their feeds, one keyset page at a time."""
     # Obtener parámetros de ordenamiento
     sort_by = request.args.get('sort', 'title')  # Por defecto, ordenar por título
     direction = request.args.get('dir', 'asc')   # Por defecto, orden ascendente
+    if sort_by not in SORT_COLUMNS:
+        sort_by = 'title'
+    cursor = request.args.get('cursor')
     
-    # Construir la consulta base
-    query = VKFeed.query.filter_by(user_id=current_user.id)
-    
-    # Aplicar ordenamiento según el parámetro
-    if sort_by == 'title':
-        query = query.order_by(VKFeed.title.asc() if direction == 'asc' else VKFeed.title.desc())
-    elif sort_by == 'source':
-        query = query.order_by(VKFeed.vk_source_id.asc() if direction == 'asc' else VKFeed.vk_source_id.desc())
-    elif sort_by == 'updated':
-        query = query.order_by(VKFeed.last_fetched.desc() if direction == 'asc' else VKFeed.last_fetched.asc())
-    else:
-        # Ordenamiento por defecto
-        query = query.order_by(VKFeed.title.asc())
-    
-    # Ejecutar la consulta
-    feeds = query.all()
+    feeds, next_cursor = list_feeds(current_user.id, sort_by, direction, cursor)
+    cache_status = get_cache_status([feed.id for feed in feeds])
     
-    return render_template('dashboard.html', feeds=feeds, sort_by=sort_by, direction=direction)
+    return render_template('dashboard.html', feeds=feeds, sort_by=sort_by, direction=direction,
+                           cursor=cursor, next_cursor=next_cursor, cache_status=cache_status)
 
 @app.route('/feeds/add', methods=['GET', 'POST'])
 @login_required
@@ -129,6 +182,37 @@ def add_feed():
         include_attachments = 'include_attachments' in request.form
         include_comments = 'include_comments' in request.form
         is_public = 'is_public' in request.form
+        include_keywords = request.form.get('include_keywords', '').strip()
+        exclude_keywords = request.form.get('exclude_keywords', '').strip()
+        translate_to = parse_translate_to(request.form.get('translate_to'))
+        
+        if vk_source_type == 'merged':
+            source_ids = parse_merged_sources(request.form.get('vk_sources', ''))
+            if not title or not source_ids:
+                flash('Title and at least one VK source are required', 'danger')
+                return redirect(url_for('add_feed'))
+                
+            feed = VKFeed(
+                user_id=current_user.id,
+                title=title[:117] + '...' if len(title) > 120 else title,
+                description="",
+                vk_source_type='merged',
+                items_count=items_count,
+                include_attachments=include_attachments,
+                include_comments=include_comments,
+                include_keywords=include_keywords,
+                exclude_keywords=exclude_keywords,
+                translate_to=translate_to,
+                is_public=is_public,
+                access_token=generate_access_token()
+            )
+            set_feed_sources(feed, source_ids)
+            
+            db.session.add(feed)
+            db.session.commit()
+            
+            flash(f'Merged feed with {len(source_ids)} sources added successfully!', 'success')
+            return redirect(url_for('dashboard'))
         
         # Basic validation
         if not all([title, vk_source_type, vk_source_id]):
@@ -137,7 +221,8 @@ def add_feed():
             
         try:
             # Validate the VK source by fetching info
-            source_info = get_source_info(vk_source_type, vk_source_id)
+            source_info = get_source_info(vk_source_type, vk_source_id,
+                                          client=VKAPIClient(user=current_user, interactive=True))
             
             # If title is not provided, use the one from VK
             if not title:
@@ -157,6 +242,9 @@ def add_feed():
                 items_count=items_count,
                 include_attachments=include_attachments,
                 include_comments=include_comments,
+                include_keywords=include_keywords,
+                exclude_keywords=exclude_keywords,
+                translate_to=translate_to,
                 is_public=is_public,
                 access_token=generate_access_token()
             )
@@ -193,11 +281,33 @@ def edit_feed(feed_id):
         feed.include_attachments = 'include_attachments' in request.form
         feed.include_comments = 'include_comments' in request.form
         feed.is_public = 'is_public' in request.form
+        feed.include_keywords = request.form.get('include_keywords', '').strip()
+        feed.exclude_keywords = request.form.get('exclude_keywords', '').strip()
+        # The field is hidden while translation is disabled; keep the setting
+        if 'translate_to' in request.form:
+            feed.translate_to = parse_translate_to(request.form.get('translate_to'))
         
         # Truncar el título si es más largo que 120 caracteres
         if feed.title and len(feed.title) > 120:
             feed.title = feed.title[:117] + '...'
         
+        if feed.vk_source_type == 'merged':
+            source_ids = parse_merged_sources(request.form.get('vk_sources', ''))
+            if not feed.title or not source_ids:
+                flash('Title and at least one VK source are required', 'danger')
+                return redirect(url_for('edit_feed', feed_id=feed_id))
+                
+            set_feed_sources(feed, source_ids)
+            feed.updated_at = datetime.utcnow()
+            
+            # Archive pages were rendered with the old settings
+            ArchivePage.query.filter_by(feed_id=feed.id).delete()
+            db.session.commit()
+            remove_snapshot(feed.id)
+            
+            flash('Feed updated successfully!', 'success')
+            return redirect(url_for('dashboard'))
+        
         # Basic validation
         if not all([feed.title, feed.vk_source_type, feed.vk_source_id]):
             flash('Title and VK source information are required', 'danger')
@@ -205,11 +315,17 @@ def edit_feed(feed_id):
             
         try:
             # Validate the VK source by fetching info
-            get_source_info(feed.vk_source_type, feed.vk_source_id)
+            get_source_info(feed.vk_source_type, feed.vk_source_id,
+                            client=VKAPIClient(user=current_user, interactive=True))
             
             # Update the feed
             feed.updated_at = datetime.utcnow()
+            
+            # Archive pages were rendered with the old settings
+            ArchivePage.query.filter_by(feed_id=feed.id).delete()
             db.session.commit()
+            # The snapshot may be public or under the old settings until the next build
+            remove_snapshot(feed.id)
             
             flash('Feed updated successfully!', 'success')
             return redirect(url_for('dashboard'))
@@ -232,6 +348,7 @@ def delete_feed(feed_id):
         
     db.session.delete(feed)
     db.session.commit()
+    remove_snapshot(feed_id)
     
     flash('Feed deleted successfully', 'success')
     return redirect(url_for('dashboard'))
@@ -246,40 +363,259 @@ def preview_feed(feed_id):
     if feed.user_id != current_user.id and not feed.is_public:
         abort(403)
         
-    # Generate the feed content
-    generator = RSSFeedGenerator(feed)
-    feed_content = generator.generate_feed()
+    # Entries come from the post store; no full build, no VK calls when warm
+    entries, next_cursor = get_preview_page(create_feed_generator(feed))
     
-    # Get source information for display
-    try:
-        source_info = get_source_info(feed.vk_source_type, feed.vk_source_id)
-    except VKAPIError:
-        source_info = {
-            'title': feed.title,
-            'link': '#',
-            'description': feed.description,
-            'image': None
-        }
+    # Source information for display, without asking VK again
+    source_info = {
+        'title': feed.title,
+        'link': '#' if feed.vk_source_type == 'merged' else f"https://vk.com/{extract_vk_id_from_url(feed.vk_source_id)}",
+        'description': feed.description,
+        'image': None
+    }
     
-    return render_template('preview_feed.html', feed=feed, source_info=source_info)
+    return render_template('preview_feed.html', feed=feed, source_info=source_info,
+                           entries=entries, next_cursor=next_cursor)
+
+@app.route('/api/feeds/<int:feed_id>/entries')
+@login_required
+def api_feed_entries(feed_id):
+    """API endpoint returning a page of preview entries, for infinite scroll."""
+    feed = VKFeed.query.get_or_404(feed_id)
+    
+    # Same access rules as the preview page
+    if feed.user_id != current_user.id and not feed.is_public:
+        abort(403)
+        
+    cursor = request.args.get('cursor')
+    if cursor and decode_cursor(cursor) is None:
+        return jsonify({'entries': [], 'message': 'Invalid cursor'}), 400
+    
+    entries, next_cursor = get_preview_page(create_feed_generator(feed), cursor=cursor,
+                                            limit=request.args.get('limit', type=int))
+    return jsonify({
+        'entries': [serialize_entry(entry) for entry in entries],
+        'next_cursor': next_cursor
+    })
+
+def set_feed_cache_headers(response, feed, etag, max_age=None):
+    """Set the validator and caching headers shared by every feed document response."""
+    if etag:
+        response.set_etag(etag)
+    # Token URLs are secrets, so shared caches must not keep private feeds
+    if feed.is_public:
+        response.cache_control.public = True
+    else:
+        response.cache_control.private = True
+    response.cache_control.max_age = max_age if max_age is not None else app.config.get('FEED_CACHE_TIMEOUT', 300)
+    return response
 
 @app.route('/feeds/<int:feed_id>.rss')
 def get_feed(feed_id):
     """Get the RSS feed content."""
-    feed = VKFeed.query.get_or_404(feed_id)
     token = request.args.get('token')
+    feed = VKFeed.query.get_or_404(feed_id)
     
     # Check if feed is public or token is valid
     if not feed.is_public and feed.access_token != token:
         abort(403)
+    
+    generator = create_feed_generator(feed)
+    
+    # Throttle readers polling too often before building the feed
+    if app.config.get('READER_LIMIT_ENABLED'):
+        allowed, retry_after = reader_limiter.check(feed_id, client_key(feed, token, request.remote_addr))
+        if not allowed:
+            # A throttled reader that already has the cached document gets a
+            # 304 instead of an error; this costs one cache read, no build
+            cached = generator.get_cached_feed(allow_stale=True)
+            etag = feed_etag(cached) if cached else None
+            if etag and request.if_none_match.contains_weak(etag):
+                return set_feed_cache_headers(Response(status=304), feed, etag)
+            response = Response('Too many requests for this feed, slow down polling\n', status=429, mimetype='text/plain')
+            response.retry_after = retry_after
+            return set_feed_cache_headers(response, feed, etag)
         
     # Generate the feed content
-    generator = RSSFeedGenerator(feed)
     feed_content = generator.generate_feed()
+    mark_snapshot_read(feed, feed_content)
+    
+    # Return as XML, answering conditional requests with 304
+    etag = feed_etag(feed_content)
+    response = set_feed_cache_headers(Response(feed_content, mimetype='application/rss+xml'), feed, etag)
+    return response.make_conditional(request)
+
+@app.route('/feeds/<int:feed_id>/archive/<period>.rss')
+def get_feed_archive(feed_id, period):
+    """Get an RFC 5005 archive page of the feed (one calendar month)."""
+    feed = VKFeed.query.get_or_404(feed_id)
+    token = request.args.get('token')
+    
+    # Check if feed is public or token is valid
+    if not feed.is_public and feed.access_token != token:
+        abort(403)
+        
+    if not PERIOD_RE.match(period):
+        abort(404)
+        
+    page = get_archive_page(create_feed_generator(feed), period)
+    if page is None:
+        abort(404)
+        
+    # Archive pages only change when the feed is edited (its pages are then
+    # rebuilt), so they are cached long but not forever; the ETag revalidates
+    response = Response(page.content, mimetype='application/rss+xml')
+    set_feed_cache_headers(response, feed, page.etag, app.config.get('ARCHIVE_CACHE_MAX_AGE', 86400))
+    return response.make_conditional(request)
+
+@app.route('/media/<signature>/<encoded>')
+def get_media(signature, encoded):
+    """Serve a VK photo or document through the on-disk media cache."""
+    if not app.config.get('MEDIA_PROXY_ENABLED'):
+        abort(404)
+    # Only paths signed by media_url are fetched
+    url = decode_media_url(signature, encoded)
+    if url is None:
+        abort(403)
+        
+    try:
+        path, content_type = media_cache.get(url)
+    except MediaProxyError as e:
+        logger.warning(str(e))
+        abort(502)
+        
+    # conditional=True answers Range and If-None-Match requests; the file is
+    # handed to the server's file wrapper, which uses sendfile under gunicorn
+    response = send_file(path, mimetype=content_type, conditional=True, max_age=MEDIA_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/websub/hub', methods=['POST'])
+def websub_hub():
+    """WebSub hub endpoint accepting (un)subscription requests for feeds."""
+    try:
+        hub.subscribe(
+            mode=request.form.get('hub.mode'),
+            topic=request.form.get('hub.topic'),
+            callback=request.form.get('hub.callback'),
+            lease_seconds=request.form.get('hub.lease_seconds'),
+            secret=request.form.get('hub.secret')
+        )
+    except WebSubError as e:
+        return Response(str(e), status=400, mimetype='text/plain')
+        
+    # Intent is verified asynchronously against the callback
+    return Response('', status=202)
+
+@app.route('/feeds/<int:feed_id>/search.rss')
+def search_feed(feed_id):
+    """Search the stored posts of a feed and return the results as RSS."""
+    feed = VKFeed.query.get_or_404(feed_id)
+    token = request.args.get('token')
+    
+    # Same access rules as the feed itself
+    if not feed.is_public and feed.access_token != token:
+        abort(403)
+        
+    query = request.args.get('q', '').strip()
+    if not query:
+        abort(400)
+        
+    generator = create_feed_generator(feed)
+    owner_ids = get_owner_ids(generator.get_source_keys())
+    posts = search_posts(query, owner_ids, limit=request.args.get('limit', feed.items_count or 20, type=int))
+    
+    source_info = {
+        'title': feed.title,
+        'link': url_for('search_feed', feed_id=feed.id, q=query, token=token, _external=True),
+        'description': f'Posts matching "{query}"',
+        'image': None
+    }
+    feed_content = generator.render_posts(
+        [json.loads(post.data) for post in posts],
+        source_info,
+        title=f'{feed.title}: {query}'
+    )
     
-    # Return as XML
     return Response(feed_content, mimetype='application/rss+xml')
 
+@app.route('/api/search')
+@login_required
+def api_search():
+    """API endpoint to search stored posts of the user's feeds."""
+    query = request.args.get('q', '').strip()
+    feed_id = request.args.get('feed_id', type=int)
+    limit = request.args.get('limit', 20, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    
+    if not query:
+        return jsonify({'results': [], 'message': 'Query is required'}), 400
+        
+    feeds_query = VKFeed.query.filter_by(user_id=current_user.id)
+    if feed_id:
+        feeds_query = feeds_query.filter_by(id=feed_id)
+        
+    source_keys = []
+    for feed in feeds_query:
+        source_keys.extend(create_feed_generator(feed).get_source_keys())
+        
+    posts = search_posts(query, get_owner_ids(source_keys), limit=limit, offset=offset)
+    
+    return jsonify({
+        'query': query,
+        'limit': min(limit, MAX_SEARCH_RESULTS),
+        'offset': offset,
+        'results': [{
+            'owner_id': post.owner_id,
+            'post_id': post.post_id,
+            'date': post.published_at.isoformat(),
+            'text': post.text,
+            'url': f"https://vk.com/wall{post.owner_id}_{post.post_id}"
+        } for post in posts]
+    })
+
+@app.route('/api/feeds')
+@login_required
+def api_feeds():
+    """API endpoint listing the user's feeds with keyset pagination."""
+    sort_by = request.args.get('sort', 'title')
+    direction = request.args.get('dir', 'asc')
+    if sort_by not in SORT_COLUMNS:
+        return jsonify({'feeds': [], 'message': f'Unsupported sort: {sort_by}'}), 400
+    cursor = request.args.get('cursor')
+    if cursor and decode_feed_cursor(cursor, sort_by) is None:
+        return jsonify({'feeds': [], 'message': 'Invalid cursor'}), 400
+    limit = request.args.get('limit', type=int)
+    
+    feeds, next_cursor = list_feeds(current_user.id, sort_by, direction, cursor, limit)
+    cache_status = get_cache_status([feed.id for feed in feeds])
+    
+    def feed_json(feed):
+        status = cache_status.get(feed.id)
+        return {
+            'id': feed.id,
+            'title': feed.title,
+            'source_type': feed.vk_source_type,
+            'source_id': feed.vk_source_id,
+            'is_public': feed.is_public,
+            'last_fetched': feed.last_fetched.isoformat() if feed.last_fetched else None,
+            'url': url_for('get_feed', feed_id=feed.id, token=feed.access_token, _external=True),
+            'cache': {
+                'cached_at': status['cached_at'].isoformat(),
+                'fresh': status['fresh'],
+                'size': status['size'],
+                'compressed_size': status['compressed_size']
+            } if status else None
+        }
+    
+    return jsonify({
+        'sort': sort_by,
+        'dir': direction,
+        'feeds': [feed_json(feed) for feed in feeds],
+        'next_cursor': next_cursor
+    })
+
 @app.route('/api/check-vk-source', methods=['POST'])
 @login_required
 def check_vk_source():
@@ -290,8 +626,12 @@ def check_vk_source():
     if not source_type or not source_id:
         return jsonify({'valid': False, 'message': 'Source type and ID are required'})
         
+    client = VKAPIClient(user=current_user, interactive=True)
+    # Give the pooled database connection back while waiting on VK
+    db.session.close()
+    
     try:
-        source_info = get_source_info(source_type, source_id)
+        source_info = get_source_info(source_type, source_id, client=client)
         return jsonify({
             'valid': True,
             'info': source_info
@@ -302,6 +642,49 @@ def check_vk_source():
             'message': str(e)
         })
 
+@app.route('/api/admin/vk-tokens')
+@admin_required
+def vk_token_stats():
+    """API endpoint reporting per-token usage of this worker's VK token pool."""
+    pool = VKAPIClient().token_pool
+    return jsonify({
+        'pid': os.getpid(),
+        'tokens': pool.stats()
+    })
+
+@app.route('/api/admin/vk-usage')
+@admin_required
+def vk_usage_stats():
+    """API endpoint reporting per-user VK API consumption of this worker."""
+    scheduler = VKAPIClient().token_pool.scheduler
+    stats = scheduler.stats()
+    usernames = dict(db.session.query(User.id, User.username)
+                     .filter(User.id.in_([user_id for user_id in stats if user_id is not None])))
+    weights = app.config.get('VK_QUOTA_WEIGHTS', {})
+    users = [dict(counters, user_id=user_id, username=usernames.get(user_id),
+                  weight=weights.get(usernames.get(user_id), 1.0))
+             for user_id, counters in stats.items()]
+    users.sort(key=lambda row: row['calls'], reverse=True)
+    return jsonify({
+        'pid': os.getpid(),
+        'slots': scheduler.slots,
+        'users': users
+    })
+
+@app.route('/api/admin/feed-stats')
+@admin_required
+def feed_request_stats():
+    """API endpoint reporting the most requested feeds on this host."""
+    stats = reader_limiter.feed_stats(limit=request.args.get('limit', 50, type=int))
+    titles = dict(db.session.query(VKFeed.id, VKFeed.title)
+                  .filter(VKFeed.id.in_([row['feed_id'] for row in stats])))
+    for row in stats:
+        row['title'] = titles.get(row['feed_id'])
+    return jsonify({
+        'window': app.config.get('READER_LIMIT_WINDOW'),
+        'feeds': stats
+    })
+
 @app.context_processor
 def utility_processor():
     """Utility functions for templates."""
@@ -320,6 +703,7 @@ def utility_processor():
     return {
         'format_datetime': format_datetime,
         'get_feed_url': get_feed_url,
+        'translation_languages': TRANSLATION_LANGUAGES if app.config.get('TRANSLATION_ENABLED') else [],
         'now': now
     }
 
@@ -390,6 +774,7 @@ def import_feeds():
         
         created_feeds = 0
         errors = []
+        import_client = VKAPIClient(user=current_user)
         
         for line in url_lines:
             # Skip comments if line starts with #
@@ -412,8 +797,9 @@ def import_feeds():
                 from vk_api import extract_vk_id_from_url, get_source_info
                 source_id = extract_vk_id_from_url(url)
                 
-                # Get source info using the selected source type
-                source_info = get_source_info(vk_source_type, source_id)
+                # Get source info using the selected source type; bulk
+                # imports use the user's background share, not the interactive lane
+                source_info = get_source_info(vk_source_type, source_id, client=import_client)
                 
                 # Create a better title if none was provided
                 if not title or title == default_title:
@@ -0,0 +1,207 @@
+import calendar
+import logging
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from models import VKFeed, FeedCache
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# Snapshot tree under SNAPSHOT_DIR, one directory per feed:
+#
+#   feeds/<feed_id>/public.rss[.gz|.br]    public feeds
+#   feeds/<feed_id>/<access_token>.rss...  token protected feeds
+#
+# The token is the only secret in a feed URL, so private snapshots sit
+# under a path nobody can guess without it. Example nginx configuration
+# (gzip_static/brotli_static pick the precompressed variants):
+#
+#   location ~ ^/feeds/(\d+)\.rss$ {
+#       root <SNAPSHOT_DIR>;
+#       default_type application/rss+xml;
+#       gzip_static on;
+#       try_files /feeds/$1/$arg_token.rss /feeds/$1/public.rss @vk2rss;
+#   }
+#
+# Snapshot reads never reach the application, so it cannot tell which
+# feeds are still read. A snapshot is exported when the application serves
+# the feed (FeedCache.read_at) and kept fresh by the background refresh for
+# SNAPSHOT_IDLE_TIMEOUT; then it is removed, and the next read falls
+# through to the application, which exports it again. A feed read only
+# through its snapshot thus costs one application request per idle period.
+
+PUBLIC_NAME = 'public'
+
+def snapshot_dir(feed_id):
+    """Return the snapshot directory of a feed."""
+    return os.path.join(current_app.config['SNAPSHOT_DIR'], 'feeds', str(feed_id))
+
+def snapshot_name(feed):
+    """Return the file name (without extension) the feed is exported under."""
+    return PUBLIC_NAME if feed.is_public else feed.access_token
+
+def _write_atomic(path, data, mtime):
+    """Write a file through a temporary file and rename, so readers never see a partial file."""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            temp_file.write(data)
+        os.chmod(temp_path, 0o644)
+        # The web server derives Last-Modified and ETag from mtime and size
+        if mtime is not None:
+            os.utime(temp_path, (mtime, mtime))
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def _variants(content, body):
+    """Yield (extension, data) of a document, the uncompressed one last."""
+    data = content.encode('utf-8')
+    # The cache body already is the gzip variant
+    yield '.rss.gz', body or FeedCache.compress(content)
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        yield '.rss.br', brotli.compress(data, mode=brotli.MODE_TEXT)
+    yield '.rss', data
+
+def export_snapshot(feed, content, body=None, cached_at=None):
+    """
+    Write the rendered feed and its precompressed variants to the snapshot tree.
+    
+    Files of the feed under another name (a public feed made private, a
+    changed token) are removed. Errors are logged, never raised: the
+    get_feed route keeps serving the feed.
+    
+    Args:
+        feed: VKFeed instance
+        content: RSS document
+        body: Gzip-compressed document, if already at hand
+        cached_at: Build time, used as the files' modification time
+    
+    Returns:
+        True if the snapshot was written
+    """
+    if not current_app.config.get('SNAPSHOT_ENABLED') or not content:
+        return False
+    directory = snapshot_dir(feed.id)
+    name = snapshot_name(feed)
+    mtime = calendar.timegm(cached_at.utctimetuple()) if cached_at else None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        written = set()
+        for extension, data in _variants(content, body):
+            _write_atomic(os.path.join(directory, name + extension), data, mtime)
+            written.add(name + extension)
+        for entry in os.scandir(directory):
+            if entry.name not in written and not entry.name.startswith('.'):
+                os.unlink(entry.path)
+    except OSError as e:
+        logger.error(f"Failed to export snapshot of feed_id={feed.id}: {e}")
+        return False
+    return True
+
+def remove_snapshot(feed_id):
+    """Remove the snapshot of a feed so requests fall through to the application."""
+    if current_app.config.get('SNAPSHOT_ENABLED'):
+        shutil.rmtree(snapshot_dir(feed_id), ignore_errors=True)
+
+def is_snapshot_kept(feed_id):
+    """Return True if the feed has a snapshot to keep up to date."""
+    if not current_app.config.get('SNAPSHOT_ENABLED'):
+        return False
+    return db.session.query(FeedCache.read_at).filter_by(feed_id=feed_id).scalar() is not None
+
+def mark_read(feed, content):
+    """
+    Record that the application served a feed, exporting its snapshot if it had none.
+    
+    The read time is written at most once per FEED_CACHE_TIMEOUT.
+    
+    Args:
+        feed: VKFeed instance
+        content: RSS document just served
+    """
+    if not current_app.config.get('SNAPSHOT_ENABLED'):
+        return
+    now = datetime.utcnow()
+    cache = FeedCache.query.filter_by(feed_id=feed.id).first()
+    if cache is None or (cache.read_at is not None and
+                         now - cache.read_at < timedelta(seconds=current_app.config.get('FEED_CACHE_TIMEOUT', 300))):
+        return
+    revived, cached_at = cache.read_at is None, cache.cached_at
+    cache.read_at = now
+    db.session.commit()
+    if revived:
+        export_snapshot(feed, content, cached_at=cached_at)
+
+def expire_idle_snapshots():
+    """
+    Remove the snapshots of feeds not read through the application for SNAPSHOT_IDLE_TIMEOUT.
+    
+    Returns:
+        Number of snapshots removed
+    """
+    if not current_app.config.get('SNAPSHOT_ENABLED'):
+        return 0
+    idle_before = datetime.utcnow() - timedelta(seconds=current_app.config.get('SNAPSHOT_IDLE_TIMEOUT', 86400))
+    feed_ids = [row[0] for row in db.session.query(FeedCache.feed_id).filter(FeedCache.read_at < idle_before)]
+    if not feed_ids:
+        return 0
+    FeedCache.query.filter(FeedCache.feed_id.in_(feed_ids), FeedCache.read_at < idle_before) \
+        .update({FeedCache.read_at: None}, synchronize_session=False)
+    db.session.commit()
+    for feed_id in feed_ids:
+        remove_snapshot(feed_id)
+    logger.debug(f"Removed {len(feed_ids)} idle snapshots")
+    return len(feed_ids)
+
+def prune_snapshots(keep_ids=None):
+    """
+    Remove the snapshots of feeds that are gone, no longer cached or idle.
+    
+    Args:
+        keep_ids: Feed IDs to keep, defaults to the cached feeds read recently
+    
+    Returns:
+        Number of snapshot directories removed
+    """
+    root = os.path.join(current_app.config['SNAPSHOT_DIR'], 'feeds')
+    if not os.path.isdir(root):
+        return 0
+    if keep_ids is None:
+        keep_ids = {row[0] for row in db.session.query(FeedCache.feed_id).filter(FeedCache.read_at.isnot(None))}
+    removed = 0
+    for entry in os.scandir(root):
+        if entry.is_dir() and not (entry.name.isdigit() and int(entry.name) in keep_ids):
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    return removed
+
+def sync_snapshots():
+    """
+    Rebuild the snapshot tree from the cache of the recently read feeds.
+    
+    Returns:
+        Tuple (snapshots written, stale directories removed)
+    """
+    written = 0
+    exported_ids = set()
+    rows = (db.session.query(VKFeed, FeedCache)
+            .join(FeedCache, FeedCache.feed_id == VKFeed.id)
+            .filter(FeedCache.read_at.isnot(None))
+            .options(db.undefer(FeedCache.body))
+            .yield_per(100))
+    for feed, cache in rows:
+        exported_ids.add(feed.id)
+        if export_snapshot(feed, cache.cached_content, cache.body, cache.cached_at):
+            written += 1
+    return written, prune_snapshots(exported_ids)
@@ -0,0 +1,157 @@
+"""
+Shared fixtures: a temporary database, a local VK API stand-in and a helper
+starting local HTTP servers for subscribers, image servers and the like.
+
+The application reads its configuration from the environment at import, so
+the environment is set up here before anything imports ``app``.
+"""
+import json
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+_tmp = tempfile.mkdtemp(prefix='vk2rss-tests-')
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(_tmp, 'test.db')}",
+    'SITE_URL': 'http://localhost',
+    'LOG_LEVEL': 'WARNING',
+    'VK_API_TOKEN': 'test',
+    'VK_API_RATE_LIMIT': '0',
+    'BACKGROUND_REFRESH_ENABLED': '0',
+    'BACKFILL_ENABLED': '0',
+    'READER_LIMIT_ENABLED': '0',
+    'AUTHOR_NAMES_ENABLED': '0',
+    'TRANSLATION_ENABLED': '0',
+    'MEDIA_CACHE_DIR': os.path.join(_tmp, 'media'),
+})
+
+from app import app as flask_app, db  # noqa: E402
+from cli import init_db  # noqa: E402
+from models import User, VKFeed  # noqa: E402
+
+def serve(handler_class):
+    """
+    Start a threaded HTTP server on a free local port.
+    
+    Args:
+        handler_class: BaseHTTPRequestHandler subclass
+    
+    Returns:
+        Tuple (server, base URL); call server.shutdown() when done
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+class QuietHandler(BaseHTTPRequestHandler):
+    """Request handler that doesn't log every request to stderr."""
+    
+    def send_body(self, status, body=b'', content_type='text/plain', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+def make_post(post_id, date, text=None, owner_id=-1):
+    """Return a wall.get item."""
+    return {'id': post_id, 'owner_id': owner_id, 'from_id': owner_id, 'date': date,
+            'text': f'Post {post_id}' if text is None else text}
+
+class FakeVK:
+    """
+    Local VK API stand-in answering groups.getById and wall.get.
+    
+    Attributes:
+        posts: wall.get items, newest first
+        walls: wall.get items by owner_id or domain, for walls other than posts
+        calls: Names of the methods called so far
+        tokens: Access token of each call so far
+        token_errors: VK error code returned to calls made with a token
+    """
+    
+    def __init__(self):
+        self.posts = []
+        self.walls = {}
+        self.calls = []
+        self.tokens = []
+        self.token_errors = {}
+        fake = self
+        
+        class Handler(QuietHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                method = url.path.rsplit('/', 1)[-1]
+                params = {name: values[0] for name, values in parse_qs(url.query).items()}
+                fake.calls.append(method)
+                fake.tokens.append(params.get('access_token'))
+                error = fake.token_errors.get(params.get('access_token'))
+                if error:
+                    body = {'error': {'error_code': error, 'error_msg': f'Test error {error}'}}
+                else:
+                    body = {'response': fake.respond(method, params)}
+                self.send_body(200, json.dumps(body).encode('utf-8'), 'application/json')
+        
+        self.server, self.url = serve(Handler)
+    
+    def respond(self, method, params):
+        if method == 'groups.getById':
+            return [{'id': 1, 'name': 'Test group', 'screen_name': 'test', 'description': 'Test group'}]
+        if method == 'wall.get':
+            offset = int(params.get('offset', 0))
+            count = int(params.get('count', 20))
+            posts = self.walls.get(params.get('owner_id') or params.get('domain'), self.posts)
+            return {'count': len(posts), 'items': posts[offset:offset + count]}
+        return []
+
+@pytest.fixture(scope='session')
+def fake_vk():
+    fake = FakeVK()
+    flask_app.config['VK_API_URL'] = f'{fake.url}/method/'
+    yield fake
+    fake.server.shutdown()
+
+@pytest.fixture
+def app(fake_vk):
+    """Application with an empty database and an empty VK wall."""
+    fake_vk.posts = []
+    fake_vk.walls.clear()
+    fake_vk.calls.clear()
+    fake_vk.tokens.clear()
+    fake_vk.token_errors.clear()
+    with flask_app.app_context():
+        db.drop_all()
+        init_db()
+        yield flask_app
+        db.session.remove()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def user(app):
+    user = User(username='reader', email='reader@example.com')
+    user.set_password('secret')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+@pytest.fixture
+def feed(user):
+    """Private group feed reading the fake VK wall."""
+    feed = VKFeed(user_id=user.id, title='Test feed', vk_source_type='group', vk_source_id='-1',
+                  items_count=20, access_token='token')
+    db.session.add(feed)
+    db.session.commit()
+    return feed
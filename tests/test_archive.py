@@ -0,0 +1,42 @@
+from datetime import datetime
+
+import pytest
+
+from app import db
+from models import BackfillState
+from tests.conftest import make_post
+
+ARCHIVE_URL = '/feeds/{}/archive/2023-11.rss'
+
+@pytest.fixture
+def archived_feed(app, client, feed, fake_vk):
+    """Feed whose November 2023 posts are stored and fully backfilled."""
+    fake_vk.posts = [make_post(2, 1700003600), make_post(1, 1700000000)]
+    client.get(f'/feeds/{feed.id}.rss?token=token')
+    db.session.add(BackfillState(source_key='-1', completed_at=datetime.utcnow()))
+    db.session.commit()
+    return feed
+
+def test_private_archive_page_is_not_shared(client, archived_feed):
+    response = client.get(ARCHIVE_URL.format(archived_feed.id) + '?token=token')
+    
+    assert response.status_code == 200
+    assert response.cache_control.private
+    assert not response.cache_control.public
+    assert not response.cache_control.immutable
+    assert response.cache_control.max_age == 86400
+    assert response.headers['ETag']
+
+def test_public_archive_page_is_revalidated(client, archived_feed):
+    archived_feed.is_public = True
+    db.session.commit()
+    
+    response = client.get(ARCHIVE_URL.format(archived_feed.id))
+    
+    assert response.cache_control.public
+    assert not response.cache_control.immutable
+    assert client.get(ARCHIVE_URL.format(archived_feed.id),
+                      headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+def test_archive_page_needs_token(client, archived_feed):
+    assert client.get(ARCHIVE_URL.format(archived_feed.id) + '?token=wrong').status_code == 403
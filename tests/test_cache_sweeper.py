@@ -0,0 +1,83 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import inspect as sa_inspect, text
+
+import cache_sweeper
+from app import app as flask_app, db
+from cache_sweeper import evict_to_size, sweep_feed_cache, sweep_if_due
+from cli import init_db
+from models import FeedCache, VKFeed
+
+@pytest.fixture
+def caches(user):
+    """Three feeds with 100-byte caches, built one, two and three hours ago."""
+    now = datetime.utcnow()
+    feeds = []
+    for hours in (1, 2, 3):
+        feed = VKFeed(user_id=user.id, title=f'{hours}h', vk_source_type='group', vk_source_id='-1',
+                      access_token=f'token{hours}')
+        db.session.add(feed)
+        db.session.flush()
+        db.session.add(FeedCache(feed_id=feed.id, body=b'x' * 100, compressed_size=100,
+                                 cached_at=now - timedelta(hours=hours)))
+        feeds.append(feed)
+    db.session.commit()
+    return feeds
+
+def cached_feed_ids():
+    return sorted(row[0] for row in db.session.query(FeedCache.feed_id))
+
+def test_under_the_cap_nothing_is_evicted(caches):
+    assert evict_to_size(300) == 0
+    assert len(cached_feed_ids()) == 3
+
+def test_least_recently_built_are_evicted_first(caches):
+    newest, middle, oldest = caches
+    
+    assert evict_to_size(150) == 2
+    assert cached_feed_ids() == [newest.id]
+
+def test_sweep_removes_orphans_and_their_snapshots(caches, tmp_path, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'SNAPSHOT_ENABLED', True)
+    monkeypatch.setitem(flask_app.config, 'SNAPSHOT_DIR', str(tmp_path))
+    newest, middle, oldest = caches
+    FeedCache.query.update({FeedCache.read_at: datetime.utcnow()})
+    for feed in caches:
+        os.makedirs(tmp_path / 'feeds' / str(feed.id))
+    db.session.delete(oldest)
+    db.session.commit()
+    # Deleting the feed through the ORM would take its cache along
+    db.session.add(FeedCache(feed_id=oldest.id, body=b'x', compressed_size=1))
+    db.session.commit()
+    
+    assert sweep_feed_cache(150) == (1, 1)
+    assert cached_feed_ids() == [newest.id]
+    assert os.listdir(tmp_path / 'feeds') == [str(newest.id)]
+
+def test_only_one_sweep_per_interval(app, monkeypatch):
+    monkeypatch.setattr(cache_sweeper, '_last_sweep', None)
+    
+    assert sweep_if_due()
+    # Another worker, without a memory of this sweep, is held off by the lease
+    monkeypatch.setattr(cache_sweeper, '_last_sweep', None)
+    assert not sweep_if_due()
+
+def test_init_db_drops_the_legacy_feed_cache(app):
+    db.session.execute(text('DROP TABLE feed_cache'))
+    db.session.execute(text('CREATE TABLE feed_cache (id INTEGER PRIMARY KEY, feed_id INTEGER, '
+                            'content TEXT, cached_at DATETIME)'))
+    db.session.execute(text("INSERT INTO feed_cache (feed_id, content) VALUES (1, '<rss/>')"))
+    db.session.commit()
+    
+    init_db()
+    
+    columns = {column['name'] for column in sa_inspect(db.engine).get_columns('feed_cache')}
+    assert {'body', 'fingerprint', 'read_at'} <= columns and 'content' not in columns
+    assert FeedCache.query.count() == 0
+
+def test_init_db_keeps_the_current_feed_cache(caches):
+    init_db()
+    
+    assert len(cached_feed_ids()) == 3
@@ -0,0 +1,87 @@
+from datetime import datetime
+
+import pytest
+
+from app import db
+from models import FeedCache, VKPost
+from feed_generator import RSSFeedGenerator, create_feed_generator
+from vk_api import compact_post
+from tests.conftest import make_post
+
+def photo(*types):
+    return {'type': 'photo', 'photo': {'id': 1, 'sizes': [
+        {'type': size_type, 'height': 100, 'url': f'https://example.com/{size_type}.jpg'} for size_type in types]}}
+
+def test_compact_post_keeps_the_shown_photo_size():
+    post = dict(make_post(1, 1700000000), attachments=[photo('s', 'x', 'w', 'm')],
+                copy_history=[dict(make_post(5, 1690000000), attachments=[photo('s', 'z')])])
+    
+    compact = compact_post(post)
+    
+    assert compact['attachments'][0]['photo']['sizes'] == [{'type': 'w', 'height': 100, 'url': 'https://example.com/w.jpg'}]
+    assert [size['type'] for size in compact['copy_history'][0]['attachments'][0]['photo']['sizes']] == ['z']
+    assert len(post['attachments'][0]['photo']['sizes']) == 4
+    assert compact['text'] == post['text']
+
+def test_filtered_build_stores_every_post_read(app, feed, fake_vk):
+    feed.include_keywords = 'cats'
+    db.session.commit()
+    fake_vk.posts = [make_post(i, 1700000000 - i * 3600, 'About cats' if i % 10 == 0 else 'About dogs')
+                     for i in range(1, 51)]
+    
+    with app.test_request_context():
+        content = create_feed_generator(feed).generate_feed()
+    
+    assert content.count('<item>') == 5
+    assert 'About dogs' not in content
+    assert VKPost.query.count() == 50
+
+@pytest.fixture
+def writes(monkeypatch):
+    """Record the contents written to the feed cache."""
+    written = []
+    update_cache = RSSFeedGenerator.update_cache
+    
+    def spy(self, content, fingerprint=None):
+        written.append(content)
+        return update_cache(self, content, fingerprint)
+    
+    monkeypatch.setattr(RSSFeedGenerator, 'update_cache', spy)
+    return written
+
+def rebuild(app, feed):
+    with app.test_request_context():
+        return create_feed_generator(feed).generate_feed(force_refresh=True)
+
+def test_unchanged_wall_is_not_rebuilt(app, feed, fake_vk, writes):
+    fake_vk.posts = [make_post(2, 1700003600), make_post(1, 1700000000)]
+    content = rebuild(app, feed)
+    cache = FeedCache.query.filter_by(feed_id=feed.id).one()
+    cache.cached_at = datetime(2020, 1, 1)
+    db.session.commit()
+    
+    assert rebuild(app, feed) == content
+    assert len(writes) == 1
+    # Only the freshness is renewed
+    assert FeedCache.query.filter_by(feed_id=feed.id).one().cached_at > datetime(2020, 1, 1)
+
+def test_edited_post_rebuilds(app, feed, fake_vk, writes):
+    fake_vk.posts = [make_post(2, 1700003600), make_post(1, 1700000000)]
+    rebuild(app, feed)
+    fake_vk.posts[1] = dict(make_post(1, 1700000000, 'Corrected'), edited=1700007200)
+    
+    content = rebuild(app, feed)
+    
+    assert len(writes) == 2
+    assert 'Corrected' in content
+
+def test_settings_change_rebuilds(app, feed, fake_vk, writes):
+    fake_vk.posts = [make_post(1, 1700000000)]
+    rebuild(app, feed)
+    feed.title = 'Renamed feed'
+    db.session.commit()
+    
+    content = rebuild(app, feed)
+    
+    assert len(writes) == 2
+    assert 'Renamed feed' in content
@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from models import VKFeed
+from feed_listing import list_feeds, encode_cursor, decode_cursor
+
+def add_feeds(user, specs):
+    """Create feeds from (title, source id, last fetched) tuples; return them in id order."""
+    feeds = [VKFeed(user_id=user.id, title=title, vk_source_type='group', vk_source_id=source,
+                    last_fetched=fetched, access_token=f'token{i}')
+             for i, (title, source, fetched) in enumerate(specs)]
+    db.session.add_all(feeds)
+    db.session.commit()
+    return feeds
+
+def all_pages(user, sort_by, direction, limit):
+    """Follow next cursors from the first page; return the feed ids in listing order."""
+    ids, cursor = [], None
+    while True:
+        feeds, cursor = list_feeds(user.id, sort_by, direction, cursor, limit)
+        ids += [feed.id for feed in feeds]
+        if cursor is None:
+            return ids
+
+@pytest.fixture
+def feeds(user):
+    now = datetime(2024, 1, 1)
+    return add_feeds(user, [
+        ('Beta', '-3', now),
+        ('Alpha', '-1', None),
+        ('Beta', '-2', now - timedelta(hours=1)),
+        ('Alpha', '-5', now),
+        ('Gamma', '-4', None),
+        ('Beta', '-6', now),
+    ])
+
+@pytest.mark.parametrize('limit', [1, 2, 4, 50])
+def test_ties_are_ordered_by_id(app, user, feeds, limit):
+    ids = [feed.id for feed in feeds]
+    
+    assert all_pages(user, 'title', 'asc', limit) == [ids[1], ids[3], ids[0], ids[2], ids[5], ids[4]]
+    assert all_pages(user, 'title', 'desc', limit) == [ids[4], ids[5], ids[2], ids[0], ids[3], ids[1]]
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 50])
+def test_feeds_never_fetched_come_last(app, user, feeds, limit):
+    ids = [feed.id for feed in feeds]
+    
+    # 'updated' ascending lists the most recently updated first
+    assert all_pages(user, 'updated', 'asc', limit) == [ids[5], ids[3], ids[0], ids[2], ids[4], ids[1]]
+    assert all_pages(user, 'updated', 'desc', limit) == [ids[2], ids[0], ids[3], ids[5], ids[1], ids[4]]
+
+def test_cursor_round_trip(app, feeds):
+    for sort_by in ('title', 'source', 'updated'):
+        for feed in feeds:
+            value = getattr(feed, {'title': 'title', 'source': 'vk_source_id', 'updated': 'last_fetched'}[sort_by])
+            assert decode_cursor(encode_cursor(feed, sort_by), sort_by) == (value, feed.id)
+
+@pytest.mark.parametrize('cursor', ['', 'not-base64!', 'WzFd', 'eyJhIjoxfQ', 'W1sxXSwxXQ', 'WyJ4IiwieSJd'])
+def test_bad_cursors_are_rejected(app, cursor):
+    assert decode_cursor(cursor, 'title') is None
+
+def test_bad_cursor_starts_over_on_dashboard_listing(app, user, feeds):
+    first, _ = list_feeds(user.id, 'title', 'asc', None, 2)
+    
+    assert list_feeds(user.id, 'title', 'asc', 'garbage', 2)[0] == first
+
+@pytest.fixture
+def logged_in(client, user):
+    client.post('/login', data={'username': 'reader', 'password': 'secret'})
+    return client
+
+@pytest.mark.parametrize('limit, expected', [(-1, 1), (0, 6), (1, 1), (1000, 6)])
+def test_api_limit_is_bounded(logged_in, feeds, limit, expected):
+    response = logged_in.get(f'/api/feeds?limit={limit}')
+    
+    assert response.status_code == 200
+    assert len(response.get_json()['feeds']) == expected
+
+def test_api_rejects_bad_cursor(logged_in, feeds):
+    response = logged_in.get('/api/feeds?cursor=W1sxXSwxXQ')
+    
+    assert response.status_code == 400
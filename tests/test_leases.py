@@ -0,0 +1,93 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from app import db
+from models import RefreshLease
+from leases import claim_lease, claim_leases, release_lease, release_leases, renew_leases, keep_leases, is_lease_held
+
+def expire(key):
+    """Move a lease's expiry into the past, as if its holder had died."""
+    RefreshLease.query.filter_by(resource_key=key).update({RefreshLease.expires_at: datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+
+def test_claim_and_release(app):
+    owner = claim_lease('feed:1')
+    
+    assert owner is not None
+    assert is_lease_held('feed:1')
+    assert claim_lease('feed:1') is None
+    
+    release_lease('feed:1', owner)
+    assert not is_lease_held('feed:1')
+    assert claim_lease('feed:1') is not None
+
+def test_every_claim_gets_its_own_owner(app):
+    first = claim_lease('feed:1')
+    second = claim_lease('feed:2')
+    
+    assert first != second
+    # Releasing with another claim's token leaves the lease alone
+    release_lease('feed:1', second)
+    assert is_lease_held('feed:1')
+
+def test_expired_lease_is_taken_over(app):
+    stale_owner = claim_lease('feed:1')
+    expire('feed:1')
+    
+    new_owner = claim_lease('feed:1')
+    
+    assert new_owner is not None
+    # The stale holder can neither renew nor release the new claim
+    assert renew_leases(['feed:1'], stale_owner) == 0
+    release_lease('feed:1', stale_owner)
+    assert is_lease_held('feed:1')
+    assert RefreshLease.query.filter_by(resource_key='feed:1').one().owner == new_owner
+
+def test_batch_claim_skips_held_leases(app):
+    held = claim_lease('feed:2')
+    
+    owner, keys = claim_leases(['feed:1', 'feed:2', 'feed:3'])
+    
+    assert keys == ['feed:1', 'feed:3']
+    release_leases(keys, owner)
+    assert not is_lease_held('feed:1') and is_lease_held('feed:2')
+    assert claim_leases(['feed:1', 'feed:3'], limit=1)[1] == ['feed:1']
+    release_lease('feed:2', held)
+
+def test_concurrent_claims_have_one_winner(app):
+    owners = []
+    barrier = threading.Barrier(8)
+    
+    def claim():
+        with app.app_context():
+            barrier.wait()
+            owners.append(claim_lease('feed:9'))
+            db.session.remove()
+    
+    threads = [threading.Thread(target=claim) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len([owner for owner in owners if owner is not None]) == 1
+
+def test_kept_lease_outlives_its_ttl(app):
+    owner = claim_lease('feed:1', ttl=1)
+    
+    with keep_leases(['feed:1'], owner, ttl=1):
+        time.sleep(1.5)
+        db.session.commit()
+        assert claim_lease('feed:1', ttl=1) is None
+    
+    release_lease('feed:1', owner)
+    assert claim_lease('feed:1') is not None
+
+def test_unkept_lease_expires(app):
+    claim_lease('feed:1', ttl=1)
+    
+    time.sleep(1.2)
+    
+    assert not is_lease_held('feed:1')
+    assert claim_lease('feed:1') is not None
@@ -0,0 +1,120 @@
+import os
+
+import pytest
+
+import media_proxy
+import routes
+from media_proxy import media_url
+from tests.conftest import serve, QuietHandler
+
+IMAGE = bytes(range(256)) * 400
+
+class ImageServer:
+    """Local stand-in for the VK CDN serving IMAGE at any path."""
+    
+    def __init__(self):
+        self.requests = []
+        image_server = self
+        
+        class Handler(QuietHandler):
+            def do_GET(self):
+                image_server.requests.append(self.path)
+                self.send_body(200, IMAGE, 'image/jpeg')
+        
+        self.server, self.url = serve(Handler)
+
+@pytest.fixture
+def image_server():
+    image_server = ImageServer()
+    yield image_server
+    image_server.server.shutdown()
+
+@pytest.fixture
+def media_app(app, tmp_path, monkeypatch):
+    """Application with the media proxy enabled and an empty cache."""
+    monkeypatch.setitem(app.config, 'MEDIA_PROXY_ENABLED', True)
+    monkeypatch.setitem(app.config, 'MEDIA_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(routes, 'media_cache', media_proxy.MediaCache())
+    return app
+
+def proxy_path(app, url):
+    with app.test_request_context():
+        return media_url(url).replace('http://localhost', '')
+
+def cached_files(app):
+    root = app.config['MEDIA_CACHE_DIR']
+    return sorted(name for directory in os.listdir(root)
+                  for name in os.listdir(os.path.join(root, directory)) if not name.endswith('.type'))
+
+def cached_path(app, url):
+    with app.app_context():
+        return routes.media_cache._paths(url)[1]
+
+def test_disabled_proxy_embeds_original_urls(app, image_server):
+    url = f'{image_server.url}/photo.jpg'
+    
+    with app.test_request_context():
+        assert media_url(url) == url
+
+def test_signature_mismatch_is_forbidden(media_app, image_server):
+    path = proxy_path(media_app, f'{image_server.url}/photo.jpg')
+    _, _, signature, encoded = path.split('/')
+    other = proxy_path(media_app, f'{image_server.url}/other.jpg').split('/')[-1]
+    client = media_app.test_client()
+    
+    assert client.get(f'/media/{signature[:-1]}x/{encoded}').status_code == 403
+    assert client.get(f'/media/{signature}/{other}').status_code == 403
+    assert image_server.requests == []
+
+def test_miss_fetches_once(media_app, image_server):
+    path = proxy_path(media_app, f'{image_server.url}/photo.jpg')
+    client = media_app.test_client()
+    
+    first = client.get(path)
+    second = client.get(path)
+    
+    assert first.status_code == second.status_code == 200
+    assert first.data == second.data == IMAGE
+    assert first.content_type == 'image/jpeg'
+    assert image_server.requests == ['/photo.jpg']
+    assert 'immutable' in first.headers['Cache-Control']
+    assert first.cache_control.max_age == media_proxy.MEDIA_MAX_AGE
+
+def test_least_recently_used_files_are_evicted(media_app, image_server, monkeypatch):
+    # Room for two images; storing a third evicts down to 90% of the cap
+    monkeypatch.setitem(media_app.config, 'MEDIA_CACHE_MAX_BYTES', int(len(IMAGE) * 2.5))
+    paths = [proxy_path(media_app, f'{image_server.url}/{i}.jpg') for i in range(3)]
+    client = media_app.test_client()
+    client.get(paths[0])
+    client.get(paths[1])
+    # Mark the first image used after the second
+    os.utime(cached_path(media_app, f'{image_server.url}/0.jpg') + '.type',
+             (os.path.getmtime(cached_path(media_app, f'{image_server.url}/1.jpg')) + 1,) * 2)
+    
+    client.get(paths[2])
+    
+    assert len(cached_files(media_app)) == 2
+    assert not os.path.exists(cached_path(media_app, f'{image_server.url}/1.jpg'))
+    client.get(paths[0])
+    assert image_server.requests == ['/0.jpg', '/1.jpg', '/2.jpg']
+
+def test_range_request(media_app, image_server):
+    path = proxy_path(media_app, f'{image_server.url}/photo.jpg')
+    client = media_app.test_client()
+    
+    response = client.get(path, headers={'Range': 'bytes=100-199'})
+    
+    assert response.status_code == 206
+    assert response.data == IMAGE[100:200]
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(IMAGE)}'
+
+def test_if_none_match(media_app, image_server):
+    path = proxy_path(media_app, f'{image_server.url}/photo.jpg')
+    client = media_app.test_client()
+    etag = client.get(path).headers['ETag']
+    
+    response = client.get(path, headers={'If-None-Match': etag})
+    
+    assert response.status_code == 304
+    assert response.data == b''
+    assert image_server.requests == ['/photo.jpg']
@@ -0,0 +1,64 @@
+import pytest
+
+from app import db
+from feed_generator import create_feed_generator, merge_posts_by_date
+from models import FeedSource, VKFeed
+from tests.conftest import make_post
+
+def test_merge_orders_by_date_and_stops_at_count():
+    # Walls may start with an older pinned post
+    first = [make_post(1, 100), make_post(3, 300), make_post(2, 200)]
+    second = [make_post(6, 600, owner_id=-2), make_post(4, 150, owner_id=-2)]
+    
+    merged = merge_posts_by_date([first, [], second], 4)
+    
+    assert [(post['owner_id'], post['id']) for post in merged] == [(-2, 6), (-1, 3), (-1, 2), (-2, 4)]
+
+def test_merge_keeps_a_post_from_several_lists_once():
+    wall = [make_post(2, 200), make_post(1, 100)]
+    
+    merged = merge_posts_by_date([wall, list(wall)], 2)
+    
+    assert [post['id'] for post in merged] == [2, 1]
+
+@pytest.fixture
+def merged_feed(user):
+    def create(*source_ids, items_count=20):
+        feed = VKFeed(user_id=user.id, title='Merged', vk_source_type='merged', items_count=items_count,
+                      vk_source_id=', '.join(source_ids), access_token='merged')
+        feed.sources = [FeedSource(vk_source_type='group', vk_source_id=source_id, position=position)
+                        for position, source_id in enumerate(source_ids)]
+        db.session.add(feed)
+        db.session.commit()
+        return feed
+    return create
+
+def build(app, feed):
+    with app.test_request_context():
+        return create_feed_generator(feed).generate_feed()
+
+def test_merged_feed_interleaves_sources(app, merged_feed, fake_vk):
+    fake_vk.walls = {
+        '-1': [make_post(1, 1700000100, 'First old'), make_post(3, 1700000300, 'First new')],
+        '-2': [make_post(4, 1700000400, 'Second new', -2), make_post(2, 1700000200, 'Second old', -2)],
+    }
+    feed = merged_feed('-1', '-2', items_count=3)
+    
+    with app.test_request_context():
+        posts = create_feed_generator(feed)._fetch_posts()
+    content = build(app, feed)
+    
+    assert [post['text'] for post in posts] == ['Second new', 'First new', 'Second old']
+    assert content.count('<item>') == 3
+    assert 'First old' not in content
+
+def test_same_wall_under_two_names_is_merged_once(app, merged_feed, fake_vk):
+    fake_vk.walls = {'-1': [make_post(2, 1700000200, 'Newer'), make_post(1, 1700000100, 'Older')]}
+    fake_vk.posts = fake_vk.walls['-1']
+    
+    content = build(app, merged_feed('-1', 'https://vk.com/wall-1', 'club1'))
+    
+    # The URL normalizes to the same key and is fetched once; the screen name is not
+    assert fake_vk.calls.count('wall.get') == 2
+    assert content.count('<item>') == 2
+    assert content.count('<title>Newer</title>') == 1
@@ -0,0 +1,51 @@
+import pytest
+
+from post_text import escape_html, escape_url, render_post_text
+
+def test_plain_text_is_escaped():
+    assert render_post_text('<script>alert("x") & \'y\'</script>') == \
+        '&lt;script&gt;alert(&quot;x&quot;) &amp; &#x27;y&#x27;&lt;/script&gt;'
+
+def test_line_breaks():
+    assert render_post_text('one\ntwo\r\nthree') == 'one<br />two<br />three'
+
+def test_mention_name_is_escaped():
+    assert render_post_text('[id1|<b>Anna</b>] hi') == \
+        '<a href="https://vk.com/id1" target="_blank">&lt;b&gt;Anna&lt;/b&gt;</a> hi'
+
+def test_malformed_mentions_stay_text():
+    assert render_post_text('[id1|broken\n] [club|x]') == '[id1|broken<br />] [club|x]'
+
+def test_url_cannot_break_out_of_the_attribute():
+    html = render_post_text('see https://example.com/?a=1&b=<i>"quoted"</i>')
+    
+    assert html == ('see <a href="https://example.com/?a=1&amp;b=" target="_blank">'
+                    'https://example.com/?a=1&amp;b=</a>&lt;i&gt;&quot;quoted&quot;&lt;/i&gt;')
+
+@pytest.mark.parametrize('text, href, tail', [
+    ('https://example.com/page.', 'https://example.com/page', '.'),
+    ('https://example.com/a?b=c!)', 'https://example.com/a?b=c', '!)'),
+    ('https://en.wikipedia.org/wiki/Python_(language)', 'https://en.wikipedia.org/wiki/Python_(language)', ''),
+    ("https://example.com/it's", 'https://example.com/it', '&#x27;s'),
+])
+def test_url_punctuation(text, href, tail):
+    assert render_post_text(text) == f'<a href="{href}" target="_blank">{href}</a>{tail}'
+
+def test_hashtags_are_quoted_in_links():
+    assert render_post_text('#новости@club') == \
+        ('<a href="https://vk.com/feed?section=search&amp;q=%23%D0%BD%D0%BE%D0%B2%D0%BE%D1%81%D1%82%D0%B8%40club" '
+         'target="_blank">#новости@club</a>')
+
+def test_tokens_glued_to_words_stay_text():
+    assert render_post_text('a#b xhttps://example.com &#39;') == 'a#b xhttps://example.com &amp;#39;'
+
+def test_escape_url_only_allows_http():
+    assert escape_url('https://example.com/?a=1&b="2"') == 'https://example.com/?a=1&amp;b=&quot;2&quot;'
+    assert escape_url('HTTP://EXAMPLE.COM') == 'HTTP://EXAMPLE.COM'
+    assert escape_url('javascript:alert(1)') is None
+    assert escape_url(' https://example.com') is None
+    assert escape_url(None) is None
+
+def test_escape_html_accepts_any_value():
+    assert escape_html(5) == '5'
+    assert escape_html('<a href="x">') == '&lt;a href=&quot;x&quot;&gt;'
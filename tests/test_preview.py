@@ -0,0 +1,40 @@
+import pytest
+
+from vk_api import format_post_content
+from tests.conftest import make_post
+
+SCRIPT = '<script>alert(1)</script>'
+
+def crafted_post():
+    return dict(make_post(1, 1700000000), attachments=[
+        {'type': 'link', 'link': {'url': 'https://example.com/?a="><b>', 'title': SCRIPT}},
+        {'type': 'link', 'link': {'url': 'javascript:alert(1)', 'title': 'Click'}},
+        {'type': 'video', 'video': {'id': 1, 'owner_id': -1, 'title': f'<img src=x onerror="{SCRIPT}">'}},
+        {'type': 'doc', 'doc': {'url': 'https://example.com/doc.pdf', 'title': SCRIPT}},
+    ])
+
+def test_attachment_fields_are_escaped(app):
+    with app.test_request_context():
+        html = format_post_content(crafted_post())
+    
+    assert '<script>' not in html
+    assert '<img src=x' not in html
+    assert '&lt;script&gt;alert(1)&lt;/script&gt;' in html
+    assert 'href="https://example.com/?a=&quot;&gt;&lt;b&gt;"' in html
+    assert 'javascript:' not in html
+    assert 'href="https://example.com/doc.pdf"' in html
+
+@pytest.fixture
+def logged_in(client, user):
+    client.post('/login', data={'username': 'reader', 'password': 'secret'})
+    return client
+
+def test_preview_page_escapes_attachments(logged_in, feed, fake_vk):
+    fake_vk.posts = [crafted_post()]
+    
+    page = logged_in.get(f'/feeds/{feed.id}/preview').get_data(as_text=True)
+    entries = logged_in.get(f'/api/feeds/{feed.id}/entries').get_json()
+    
+    assert 'Post 1' in page
+    assert SCRIPT not in page
+    assert SCRIPT not in entries['entries'][0]['content']
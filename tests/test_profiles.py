@@ -0,0 +1,115 @@
+from types import SimpleNamespace
+
+import pytest
+
+import profiles
+from app import app as flask_app
+from profiles import ProfileCache, post_author_id, resolve_names
+from vk_api import VKAPIError
+
+class StubClient:
+    """Answers get_users and get_groups from dicts of names, recording the requested IDs."""
+    
+    def __init__(self, users=None, groups=None, groups_error=None):
+        self.users = users or {}
+        self.groups = groups or {}
+        self.groups_error = groups_error
+        self.calls = []
+    
+    def get_users(self, user_ids):
+        self.calls.append(('users', user_ids))
+        return [{'id': user_id, 'first_name': self.users[user_id], 'last_name': 'Test'}
+                for user_id in user_ids if user_id in self.users]
+    
+    def get_groups(self, group_ids):
+        self.calls.append(('groups', group_ids))
+        if self.groups_error:
+            raise self.groups_error
+        return [{'id': group_id, 'name': self.groups[group_id]} for group_id in group_ids if group_id in self.groups]
+
+class Clock:
+    """Stand-in for time.monotonic in profiles."""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(app, monkeypatch):
+    """Fresh profile cache on a controlled clock."""
+    clock = Clock()
+    monkeypatch.setattr(profiles, 'time', SimpleNamespace(monotonic=clock))
+    monkeypatch.setattr(profiles, 'profile_cache', ProfileCache())
+    return clock
+
+def test_author_is_signer_then_sender_then_owner():
+    assert post_author_id({'signer_id': 5, 'from_id': -1, 'owner_id': -1}) == 5
+    assert post_author_id({'from_id': 7, 'owner_id': -1}) == 7
+    assert post_author_id({'owner_id': -1}) == -1
+
+def test_names_are_fetched_once(clock):
+    client = StubClient(users={1: 'Anna', 2: 'Boris'}, groups={10: 'Club'})
+    
+    first = resolve_names(client, [1, -10, 2, 1, 0, None])
+    second = resolve_names(client, [2, -10])
+    
+    assert first == {1: 'Anna Test', -10: 'Club', 2: 'Boris Test'}
+    assert second == {2: 'Boris Test', -10: 'Club'}
+    assert client.calls == [('users', [1, 2]), ('groups', [10])]
+
+def test_misses_are_fetched_in_batches(clock, monkeypatch):
+    monkeypatch.setattr(profiles, 'USERS_GET_MAX_IDS', 2)
+    client = StubClient(users={1: 'A', 2: 'B', 3: 'C'})
+    
+    assert len(resolve_names(client, [1, 2, 3])) == 3
+    assert client.calls == [('users', [1, 2]), ('users', [3])]
+
+def test_unknown_ids_are_remembered(clock):
+    client = StubClient()
+    
+    assert resolve_names(client, [404]) == {}
+    assert resolve_names(client, [404]) == {}
+    assert len(client.calls) == 1
+
+def test_names_expire(clock, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'PROFILE_CACHE_TTL', 60)
+    client = StubClient(users={1: 'Anna'})
+    resolve_names(client, [1])
+    
+    clock.now += 59
+    resolve_names(client, [1])
+    assert len(client.calls) == 1
+    
+    clock.now += 2
+    client.users[1] = 'Anya'
+    assert resolve_names(client, [1]) == {1: 'Anya Test'}
+    assert len(client.calls) == 2
+
+def test_oldest_entries_are_dropped_beyond_the_cap(clock, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'PROFILE_CACHE_MAX_ENTRIES', 2)
+    profiles.profile_cache.store({1: 'A'})
+    profiles.profile_cache.store({2: 'B'})
+    profiles.profile_cache.store({1: 'A', 3: 'C'})
+    
+    assert profiles.profile_cache.get_many([1, 2, 3]) == ({1: 'A', 3: 'C'}, [2])
+
+def test_failed_batches_are_retried(clock):
+    client = StubClient(users={1: 'Anna'}, groups={10: 'Club'}, groups_error=VKAPIError('Too many requests', 6))
+    
+    assert resolve_names(client, [1, -10]) == {1: 'Anna Test'}
+    
+    client.groups_error = None
+    assert resolve_names(client, [1, -10]) == {1: 'Anna Test', -10: 'Club'}
+    # The users batch that completed was cached
+    assert client.calls[-1] == ('groups', [10])
+    assert ('users', [1]) not in client.calls[1:]
+
+def test_extended_responses_fill_the_cache(clock):
+    profiles.profile_cache.remember(profiles=[{'id': 1, 'first_name': 'Anna', 'last_name': 'Test'}],
+                                    groups=[{'id': 10, 'name': 'Club'}])
+    client = StubClient()
+    
+    assert resolve_names(client, [1, -10]) == {1: 'Anna Test', -10: 'Club'}
+    assert client.calls == []
@@ -0,0 +1,110 @@
+from types import SimpleNamespace
+
+import pytest
+
+import reader_limits
+from app import app as flask_app, db
+from feed_generator import create_feed_generator
+from reader_limits import SlidingWindowTable, reader_limiter
+from tests.conftest import make_post
+
+WINDOW = 60
+# Start of a fixed window, so the previous window has no weight left
+WINDOW_START = 1_000_000 * WINDOW
+
+class Clock:
+    """Stand-in for time.time in reader_limits."""
+    
+    def __init__(self, now):
+        self.now = now
+    
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(WINDOW_START)
+    monkeypatch.setattr(reader_limits, 'time', SimpleNamespace(time=clock))
+    return clock
+
+@pytest.fixture
+def limited(app, feed, fake_vk, clock, tmp_path, monkeypatch):
+    """Feed served with a limit of three requests per minute and reader."""
+    fake_vk.posts = [make_post(1, 1700000000)]
+    monkeypatch.setitem(flask_app.config, 'READER_LIMIT_ENABLED', True)
+    monkeypatch.setitem(flask_app.config, 'READER_LIMIT_REQUESTS', 3)
+    monkeypatch.setitem(flask_app.config, 'READER_LIMIT_WINDOW', WINDOW)
+    monkeypatch.setitem(flask_app.config, 'READER_LIMIT_DIR', str(tmp_path))
+    monkeypatch.setattr(reader_limiter, '_tables', None)
+    return feed
+
+def feed_url(feed):
+    return f'/feeds/{feed.id}.rss?token=token'
+
+def test_sliding_window_weights_previous_window(tmp_path, clock):
+    table = SlidingWindowTable(str(tmp_path / 'limits'), 16, WINDOW)
+    
+    def count(values, now):
+        return values[:4] + (values[4] + 1,) + values[5:], table._rate(values[3], values[4], now)
+    
+    for _ in range(10):
+        table.update('reader', count)
+    
+    # Half way through the next window half of the previous count is left
+    clock.now = WINDOW_START + WINDOW * 1.5
+    assert table.update('reader', count) == 5
+    
+    # A skipped window forgets everything
+    clock.now = WINDOW_START + WINDOW * 3
+    assert table.update('reader', count) == 0
+
+def test_over_limit_is_throttled(client, limited, clock):
+    for _ in range(3):
+        assert client.get(feed_url(limited)).status_code == 200
+    
+    response = client.get(feed_url(limited))
+    
+    assert response.status_code == 429
+    # The window's three requests decay to two, leaving room, 20s into the next window
+    assert response.headers['Retry-After'] == str(WINDOW + 20)
+    assert response.headers['ETag']
+    assert response.cache_control.private
+    
+    clock.now = WINDOW_START + WINDOW + 20
+    assert client.get(feed_url(limited)).status_code == 200
+    
+    stats = reader_limiter.feed_stats()
+    assert stats[0]['feed_id'] == limited.id
+    assert stats[0]['total'] == 5
+    assert stats[0]['throttled'] == 1
+
+def test_throttled_reader_with_current_document_gets_304(client, limited):
+    etag = client.get(feed_url(limited)).headers['ETag']
+    for _ in range(2):
+        client.get(feed_url(limited))
+    
+    response = client.get(feed_url(limited), headers={'If-None-Match': etag})
+    
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+def test_throttled_reader_with_outdated_document_gets_429(client, limited):
+    etag = client.get(feed_url(limited)).headers['ETag']
+    for _ in range(2):
+        client.get(feed_url(limited))
+    create_feed_generator(limited).update_cache('<rss>changed</rss>')
+    
+    response = client.get(feed_url(limited), headers={'If-None-Match': etag})
+    
+    assert response.status_code == 429
+    assert response.headers['ETag'] != etag
+
+def test_forwarded_for_is_ignored_without_trusted_proxy(client, limited):
+    limited.is_public = True
+    db.session.commit()
+    url = f'/feeds/{limited.id}.rss'
+    
+    statuses = [client.get(url, headers={'X-Forwarded-For': f'10.0.0.{number}'}).status_code
+                for number in range(4)]
+    
+    assert statuses == [200, 200, 200, 429]
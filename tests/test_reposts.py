@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from models import OriginalPost
+from reposts import dedupe_reposts, delete_expired_originals, resolve_originals
+from vk_api import VKAPIError
+from tests.conftest import make_post
+
+class StubClient:
+    """Answers get_posts_by_id from a dict of posts, recording the requested keys."""
+    
+    def __init__(self, posts=(), error=None):
+        self.posts = {(post['owner_id'], post['id']): post for post in posts}
+        self.requests = []
+        self.error = error
+    
+    def get_posts_by_id(self, keys):
+        self.requests.append(list(keys))
+        if self.error:
+            raise self.error
+        return [self.posts[key] for key in keys if key in self.posts]
+
+def repost(post_id, date, *history):
+    """Return a post reposting the given copy_history chain, outermost first."""
+    return dict(make_post(post_id, date, ''), copy_history=list(history))
+
+def stub(post_id, owner_id=-5):
+    """Return a copy_history entry carrying only the IDs of its post."""
+    return {'id': post_id, 'owner_id': owner_id}
+
+def keys(posts):
+    return [(post['owner_id'], post['id']) for post in posts]
+
+def test_repost_of_a_post_in_the_feed_is_dropped():
+    original = make_post(1, 1700000000)
+    posts = [repost(2, 1700003600, original), original]
+    
+    assert keys(dedupe_reposts(posts)) == [(-1, 1)]
+
+def test_only_the_newest_repost_of_an_original_is_kept():
+    original = make_post(7, 1690000000, owner_id=-5)
+    posts = [repost(3, 1700007200, original), make_post(2, 1700003600),
+             repost(1, 1700000000, stub(9, -6), original)]
+    
+    # A repost of a repost counts as a repost of the innermost original
+    assert keys(dedupe_reposts(posts)) == [(-1, 3), (-1, 2)]
+
+def test_distinct_reposts_are_kept():
+    posts = [repost(2, 1700003600, stub(8)), repost(1, 1700000000, stub(7))]
+    
+    assert dedupe_reposts(posts) == posts
+
+def test_complete_originals_are_cached_without_fetching(app):
+    original = make_post(7, 1690000000, 'Original', owner_id=-5)
+    client = StubClient()
+    
+    originals = resolve_originals(client, [repost(1, 1700000000, original)])
+    
+    assert originals == {(-5, 7): original}
+    assert client.requests == []
+    assert OriginalPost.query.count() == 1
+
+def test_stub_originals_are_fetched_once_and_shared(app):
+    client = StubClient([make_post(7, 1690000000, 'Fetched', owner_id=-5)])
+    posts = [repost(2, 1700003600, stub(7)), repost(1, 1700000000, stub(8))]
+    
+    first = resolve_originals(client, posts)
+    second = resolve_originals(StubClient(), posts)
+    
+    assert client.requests == [[(-5, 7), (-5, 8)]]
+    assert first[(-5, 7)]['text'] == second[(-5, 7)]['text'] == 'Fetched'
+    # The deleted original is cached as its stub, not asked for again
+    assert first[(-5, 8)] == second[(-5, 8)] == stub(8)
+
+def test_expired_originals_are_refreshed(app):
+    posts = [repost(1, 1700000000, stub(7))]
+    resolve_originals(StubClient([make_post(7, 1690000000, 'Old', owner_id=-5)]), posts)
+    OriginalPost.query.update({OriginalPost.fetched_at: datetime.utcnow() - timedelta(days=2)})
+    db.session.commit()
+    client = StubClient([make_post(7, 1690000000, 'Edited', owner_id=-5)])
+    
+    assert resolve_originals(client, posts)[(-5, 7)]['text'] == 'Edited'
+    assert len(client.requests) == 1
+
+def test_failed_fetch_keeps_cached_originals(app):
+    original = make_post(7, 1690000000, 'Original', owner_id=-5)
+    resolve_originals(StubClient(), [repost(1, 1700000000, original)])
+    client = StubClient(error=VKAPIError('Too many requests', 6))
+    
+    originals = resolve_originals(client, [repost(2, 1700003600, original), repost(1, 1700000000, stub(8))])
+    
+    assert originals == {(-5, 7): original}
+    assert OriginalPost.query.count() == 1
+
+@pytest.mark.parametrize('age, kept', [(1, 1), (3, 0)])
+def test_unused_originals_expire(app, age, kept):
+    resolve_originals(StubClient(), [repost(1, 1700000000, make_post(7, 1690000000, owner_id=-5))])
+    OriginalPost.query.update({OriginalPost.fetched_at: datetime.utcnow() - timedelta(days=age)})
+    db.session.commit()
+    
+    assert delete_expired_originals(2 * 86400) == 1 - kept
+    assert OriginalPost.query.count() == kept
@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import text
+
+from app import db
+from post_store import build_match_query, search_posts, store_posts
+from tests.conftest import make_post
+
+@pytest.fixture
+def stored(app):
+    """Posts of two communities, in Russian and English."""
+    # drop_all leaves the external-content index behind; resync it
+    db.session.execute(text("INSERT INTO vk_post_fts(vk_post_fts) VALUES ('rebuild')"))
+    store_posts([
+        make_post(3, 1700000300, 'Привет, мир! Новости города'),
+        make_post(2, 1700000200, 'Ёлка на площади: новости'),
+        make_post(1, 1700000100, 'cats OR dogs, "quoted" NEAR(x) title:y'),
+    ], '-1')
+    store_posts([
+        make_post(1, 1700000400, 'Другие новости', owner_id=-2),
+    ], '-2')
+
+def found(query, owner_ids=(-1,)):
+    return [(post.owner_id, post.post_id) for post in search_posts(query, owner_ids)]
+
+def test_cyrillic_words_match_case_insensitively(stored):
+    assert found('привет') == [(-1, 3)]
+    assert found('НОВОСТИ') == [(-1, 3), (-1, 2)]
+    assert found('ёлка') == [(-1, 2)]
+    # Only whole words match
+    assert found('нов') == []
+
+def test_operators_are_searched_as_words(stored):
+    assert build_match_query('cats OR dogs*') == '"cats" "OR" "dogs"'
+    assert build_match_query('"" ( - : ^') == ''
+    
+    assert found('cats OR dogs') == [(-1, 1)]
+    assert found('NEAR(x)') == [(-1, 1)]
+    assert found('title:y -"quoted') == [(-1, 1)]
+    assert found('cats AND мир') == []
+    assert found('( "') == []
+
+def test_results_are_limited_to_owners(stored):
+    assert found('новости') == [(-1, 3), (-1, 2)]
+    assert found('новости', (-2,)) == [(-2, 1)]
+    assert found('новости', (-1, -2)) == [(-2, 1), (-1, 3), (-1, 2)]
+    assert found('новости', ()) == []
+
+def test_results_are_paged_newest_first(stored):
+    pages = [[post.post_id for post in search_posts('новости', [-1], limit=1, offset=offset)]
+             for offset in range(3)]
+    
+    assert pages == [[3], [2], []]
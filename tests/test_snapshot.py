@@ -0,0 +1,80 @@
+import gzip
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import app as flask_app, db
+from feed_generator import create_feed_generator
+from models import FeedCache, VKFeed
+from refresh import get_due_snapshot_feed_ids, refresh_due_feeds
+from snapshot import export_snapshot, snapshot_dir
+from tests.conftest import make_post
+
+CONTENT = '<rss><channel><title>Новости</title></channel></rss>'
+
+@pytest.fixture
+def snapshots(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'SNAPSHOT_ENABLED', True)
+    monkeypatch.setitem(flask_app.config, 'SNAPSHOT_DIR', str(tmp_path))
+    return tmp_path
+
+def snapshot_files(feed):
+    directory = snapshot_dir(feed.id)
+    return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+def test_export_writes_compressed_variants(snapshots, feed):
+    assert export_snapshot(feed, CONTENT, cached_at=datetime(2024, 1, 1))
+    
+    path = os.path.join(snapshot_dir(feed.id), 'token.rss')
+    with open(path, encoding='utf-8') as plain:
+        assert plain.read() == CONTENT
+    with open(path + '.gz', 'rb') as compressed:
+        assert gzip.decompress(compressed.read()).decode('utf-8') == CONTENT
+    # Build time (UTC) as modification time, for Last-Modified
+    assert os.path.getmtime(path) == os.path.getmtime(path + '.gz') == 1704067200
+
+def test_export_writes_brotli_variant(snapshots, feed):
+    brotli = pytest.importorskip('brotli')
+    
+    export_snapshot(feed, CONTENT)
+    
+    with open(os.path.join(snapshot_dir(feed.id), 'token.rss.br'), 'rb') as compressed:
+        assert brotli.decompress(compressed.read()).decode('utf-8') == CONTENT
+
+def test_only_feeds_read_through_the_app_are_exported(snapshots, client, feed, fake_vk):
+    fake_vk.posts = [make_post(1, 1700000000)]
+    unread = VKFeed(user_id=feed.user_id, title='Unread', vk_source_type='group', vk_source_id='-1',
+                    access_token='other')
+    db.session.add(unread)
+    db.session.commit()
+    
+    client.get(f'/feeds/{feed.id}.rss?token=token')
+    create_feed_generator(unread).generate_feed()
+    
+    assert 'token.rss.gz' in snapshot_files(feed)
+    assert snapshot_files(unread) == []
+
+def test_idle_snapshots_stop_being_refreshed(snapshots, client, feed, fake_vk, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'SNAPSHOT_IDLE_TIMEOUT', 3600)
+    fake_vk.posts = [make_post(1, 1700000000)]
+    client.get(f'/feeds/{feed.id}.rss?token=token')
+    cache = FeedCache.query.filter_by(feed_id=feed.id).one()
+    
+    # Read recently: kept fresh by the background refresh
+    cache.cached_at = datetime.utcnow() - timedelta(hours=2)
+    db.session.commit()
+    assert get_due_snapshot_feed_ids() == [feed.id]
+    
+    # Not read through the app for longer than the idle timeout: removed
+    cache.read_at = datetime.utcnow() - timedelta(hours=2)
+    db.session.commit()
+    with flask_app.test_request_context():
+        refresh_due_feeds()
+    assert snapshot_files(feed) == []
+    assert FeedCache.query.filter_by(feed_id=feed.id).one().read_at is None
+    assert get_due_snapshot_feed_ids() == []
+    
+    # The next read falls through to the app and exports it again
+    client.get(f'/feeds/{feed.id}.rss?token=token')
+    assert 'token.rss' in snapshot_files(feed)
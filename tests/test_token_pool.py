@@ -0,0 +1,87 @@
+import pytest
+
+import vk_api
+from vk_api import VKAPIClient, VKAPIError
+
+@pytest.fixture
+def pool_app(app, monkeypatch):
+    """Two tokens, 'first' and 'second', in a fresh process-wide pool."""
+    monkeypatch.setattr(VKAPIClient, '_token_pools', {})
+    monkeypatch.setitem(app.config, 'VK_API_TOKENS', ['first', 'second'])
+    return app
+
+def token_stats(client):
+    return {stats['token']: stats for stats in client.token_pool.stats()}
+
+@pytest.mark.parametrize('code, config_key', [
+    (5, 'VK_TOKEN_AUTH_COOLDOWN'),
+    (6, 'VK_TOKEN_FLOOD_COOLDOWN'),
+    (29, 'VK_TOKEN_QUOTA_COOLDOWN'),
+])
+def test_token_error_fails_over_and_cools_down(pool_app, fake_vk, monkeypatch, code, config_key):
+    monkeypatch.setitem(pool_app.config, config_key, 600)
+    fake_vk.token_errors['first'] = code
+    client = VKAPIClient()
+    
+    assert client.get_group_info(1)[0]['name'] == 'Test group'
+    assert fake_vk.tokens == ['first', 'second']
+    
+    stats = token_stats(client)
+    assert not stats['...irst']['healthy']
+    assert stats['...irst']['last_error'] == code
+    assert 590 < stats['...irst']['cooldown_seconds'] <= 600
+    assert stats['...cond']['healthy']
+    
+    # The next call goes straight to the healthy token
+    client.get_group_info(1)
+    assert fake_vk.tokens == ['first', 'second', 'second']
+
+def test_cooled_down_token_returns_to_rotation(pool_app, fake_vk, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(vk_api.time, 'monotonic', lambda: clock[0])
+    monkeypatch.setitem(pool_app.config, 'VK_TOKEN_FLOOD_COOLDOWN', 1)
+    fake_vk.token_errors['first'] = 6
+    client = VKAPIClient()
+    client.get_group_info(1)
+    del fake_vk.token_errors['first']
+    
+    client.get_group_info(1)
+    clock[0] += 1.5
+    client.get_group_info(1)
+    
+    assert fake_vk.tokens == ['first', 'second', 'second', 'first']
+
+def test_other_errors_do_not_fail_over(pool_app, fake_vk):
+    fake_vk.token_errors['first'] = 15
+    client = VKAPIClient()
+    
+    with pytest.raises(VKAPIError) as error:
+        client.get_group_info(1)
+    
+    assert error.value.code == 15
+    assert fake_vk.tokens == ['first']
+    assert token_stats(client)['...irst']['healthy']
+
+def test_every_token_failing_raises(pool_app, fake_vk):
+    fake_vk.token_errors.update(first=29, second=29)
+    client = VKAPIClient()
+    
+    with pytest.raises(VKAPIError) as error:
+        client.get_group_info(1)
+    assert error.value.code == 29
+    assert fake_vk.tokens == ['first', 'second']
+    
+    # Both are cooling down now: no call reaches VK
+    with pytest.raises(VKAPIError, match='No healthy VK API token'):
+        client.get_group_info(1)
+    assert fake_vk.tokens == ['first', 'second']
+
+def test_least_loaded_token_is_picked(pool_app):
+    pool = VKAPIClient().token_pool
+    
+    first = pool.acquire()
+    second = pool.acquire()
+    
+    assert {first.token, second.token} == {'first', 'second'}
+    pool.release(first)
+    assert pool.acquire().token == first.token
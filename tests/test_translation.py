@@ -0,0 +1,107 @@
+import pytest
+
+from app import db
+from models import FeedCache, Translation
+from feed_generator import create_feed_generator
+from translator import LocalBackend, TranslationBackend, TranslationError, content_hash
+from tests.conftest import make_post
+
+@pytest.fixture
+def backend_calls(app, monkeypatch):
+    """Enable translation with the local backend and record the texts it is given."""
+    monkeypatch.setitem(app.config, 'TRANSLATION_ENABLED', True)
+    monkeypatch.setitem(app.config, 'TRANSLATION_BACKEND', 'local')
+    calls = []
+    translate = LocalBackend.translate
+    
+    def counting_translate(self, text, target_lang):
+        calls.append(text)
+        return translate(self, text, target_lang)
+    
+    monkeypatch.setattr(LocalBackend, 'translate', counting_translate)
+    return calls
+
+@pytest.fixture
+def translated_feed(feed, backend_calls):
+    """Feed translated to English."""
+    feed.translate_to = 'en'
+    db.session.commit()
+    return feed
+
+def build(app, feed):
+    with app.test_request_context():
+        return create_feed_generator(feed).generate_feed(force_refresh=True)
+
+def drop_cache(feed):
+    """Forget the cached document so the next build renders every post again."""
+    FeedCache.query.filter_by(feed_id=feed.id).delete()
+    db.session.commit()
+
+def test_posts_are_translated_and_cached_by_hash(app, translated_feed, backend_calls, fake_vk):
+    fake_vk.posts = [make_post(2, 1700003600, 'Второй пост'), make_post(1, 1700000000, 'Первый пост')]
+    
+    content = build(app, translated_feed)
+    
+    assert '[en] Второй пост' in content
+    assert '[en] Первый пост' in content
+    assert sorted(backend_calls) == ['Второй пост', 'Первый пост']
+    rows = {row.content_hash: row for row in Translation.query}
+    assert set(rows) == {content_hash('Второй пост'), content_hash('Первый пост')}
+    row = rows[content_hash('Первый пост')]
+    assert (row.target_lang, row.text, row.backend) == ('en', '[en] Первый пост', 'local')
+
+def test_rebuild_makes_no_backend_calls(app, translated_feed, backend_calls, fake_vk):
+    fake_vk.posts = [make_post(1, 1700000000, 'Первый пост')]
+    first = build(app, translated_feed)
+    backend_calls.clear()
+    drop_cache(translated_feed)
+    
+    second = build(app, translated_feed)
+    
+    assert backend_calls == []
+    assert '[en] Первый пост' in second
+    assert first.count('[en]') == second.count('[en]')
+
+def test_only_new_posts_are_translated(app, translated_feed, backend_calls, fake_vk):
+    fake_vk.posts = [make_post(1, 1700000000, 'Первый пост')]
+    build(app, translated_feed)
+    backend_calls.clear()
+    
+    fake_vk.posts.insert(0, make_post(2, 1700003600, 'Второй пост'))
+    content = build(app, translated_feed)
+    
+    assert backend_calls == ['Второй пост']
+    assert '[en] Первый пост' in content and '[en] Второй пост' in content
+
+def test_failed_translation_is_retried(app, translated_feed, backend_calls, fake_vk, monkeypatch):
+    fake_vk.posts = [make_post(1, 1700000000, 'Первый пост')]
+    
+    def failing_translate(self, text, target_lang):
+        raise TranslationError('Quota exceeded')
+    
+    with monkeypatch.context() as patch:
+        patch.setattr(LocalBackend, 'translate', failing_translate)
+        content = build(app, translated_feed)
+    assert 'Первый пост' in content and '[en]' not in content
+    assert Translation.query.count() == 0
+    
+    content = build(app, translated_feed)
+    
+    assert '[en] Первый пост' in content
+    assert Translation.query.count() == 1
+
+def test_disabled_translation_keeps_original_text(app, translated_feed, backend_calls, fake_vk, monkeypatch):
+    monkeypatch.setitem(app.config, 'TRANSLATION_ENABLED', False)
+    fake_vk.posts = [make_post(1, 1700000000, 'Первый пост')]
+    
+    content = build(app, translated_feed)
+    
+    assert '[en]' not in content
+    assert backend_calls == []
+
+def test_backend_must_implement_translate():
+    class Incomplete(TranslationBackend):
+        name = 'incomplete'
+    
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from leases import claim_lease, feed_lease_key
+from models import FeedCache, VKFeed
+from warmup import warm_feeds
+from tests.conftest import make_post
+
+@pytest.fixture
+def feeds(feed, fake_vk):
+    """Three feeds: one to build, one leased by another worker, one rebuilt since selection."""
+    fake_vk.posts = [make_post(1, 1700000000)]
+    leased = VKFeed(user_id=feed.user_id, title='Leased', vk_source_type='group', vk_source_id='-1',
+                    access_token='leased')
+    fresh = VKFeed(user_id=feed.user_id, title='Fresh', vk_source_type='group', vk_source_id='-1',
+                   access_token='fresh')
+    db.session.add_all([leased, fresh])
+    db.session.commit()
+    db.session.add(FeedCache(feed_id=fresh.id, body=FeedCache.compress('<rss/>'), cached_at=datetime.utcnow()))
+    db.session.commit()
+    assert claim_lease(feed_lease_key(leased.id)) is not None
+    return feed, leased, fresh
+
+def test_leased_feeds_are_reported_separately(app, feeds):
+    feed, leased, fresh = feeds
+    reports = []
+    
+    counts = warm_feeds([feed.id, leased.id, fresh.id], datetime.utcnow() - timedelta(seconds=1), 1,
+                        lambda done, counts, elapsed, calls: reports.append((done, counts['leased'])))
+    
+    assert counts == {'built': 1, 'leased': 1, 'skipped': 1}
+    assert [done for done, _ in reports] == [1, 2, 3]
+    assert reports[-1][1] == 1
+    assert FeedCache.query.filter_by(feed_id=leased.id).first() is None
+    assert FeedCache.query.filter_by(feed_id=feed.id).one().cached_content.count('<item>') == 1
+
+def test_cli_summary_counts_leased_feeds(app, feeds):
+    result = app.test_cli_runner().invoke(args=['warm-cache', '--jobs', '2'])
+    
+    assert result.exit_code == 0, result.output
+    assert 'Built 1 feeds, 0 skipped (built since or deleted), 1 skipped (leased), 0 failed.' in result.output
@@ -0,0 +1,193 @@
+import hashlib
+import hmac
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+from app import db
+from models import WebSubSubscription
+from feed_generator import create_feed_generator
+from refresh import get_due_push_feed_ids
+from websub import hub
+from tests.conftest import serve, QuietHandler, make_post
+
+TOPIC = 'http://localhost/feeds/{}.rss?token=token'
+
+class Subscriber:
+    """
+    Local subscriber callback recording verification requests and deliveries.
+    
+    Attributes:
+        verifications: Query parameters of each verification request
+        deliveries: (headers, body) of each delivery
+        statuses: Status codes returned to deliveries, in order; 204 once used up
+        echo: Whether verification requests are confirmed
+    """
+    
+    def __init__(self):
+        self.verifications = []
+        self.deliveries = []
+        self.statuses = []
+        self.echo = True
+        self.received = threading.Event()
+        subscriber = self
+        
+        class Handler(QuietHandler):
+            def do_GET(self):
+                params = {name: values[0] for name, values in parse_qs(urlparse(self.path).query).items()}
+                subscriber.verifications.append(params)
+                challenge = params['hub.challenge'] if subscriber.echo else 'no'
+                self.send_body(200, challenge.encode('utf-8'))
+                subscriber.received.set()
+            
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                subscriber.deliveries.append((dict(self.headers), body))
+                self.send_body(subscriber.statuses.pop(0) if subscriber.statuses else 204)
+                subscriber.received.set()
+        
+        self.server, url = serve(Handler)
+        self.callback = f'{url}/callback'
+    
+    def wait(self, timeout=5):
+        assert self.received.wait(timeout), 'subscriber was not called'
+        self.received.clear()
+
+@pytest.fixture
+def subscriber():
+    subscriber = Subscriber()
+    yield subscriber
+    subscriber.server.shutdown()
+
+def wait_for_subscriptions(count, timeout=5):
+    """Wait until the hub's worker has stored ``count`` verified subscriptions."""
+    deadline = time.monotonic() + timeout
+    while True:
+        # End the read transaction to see the worker's commits
+        db.session.commit()
+        if WebSubSubscription.query.filter_by(verified=True).count() == count:
+            return
+        assert time.monotonic() < deadline, 'subscription was not stored'
+        time.sleep(0.05)
+
+def subscribe(feed, callback, secret=None, lease_expires_at=None):
+    subscription = WebSubSubscription(
+        feed_id=feed.id, callback=callback, topic=TOPIC.format(feed.id), secret=secret, verified=True,
+        lease_expires_at=lease_expires_at or datetime.utcnow() + timedelta(days=1)
+    )
+    db.session.add(subscription)
+    db.session.commit()
+    return subscription
+
+def test_feed_advertises_hub(client, feed, fake_vk):
+    fake_vk.posts = [make_post(1, 1700000000)]
+    
+    body = client.get(f'/feeds/{feed.id}.rss?token=token').get_data(as_text=True)
+    
+    assert 'href="http://localhost/websub/hub" rel="hub"' in body
+    assert f'href="{TOPIC.format(feed.id)}" rel="self"'.replace('&', '&amp;') in body
+
+def test_subscription_is_verified(client, feed, subscriber):
+    response = client.post('/websub/hub', data={
+        'hub.mode': 'subscribe', 'hub.topic': TOPIC.format(feed.id),
+        'hub.callback': subscriber.callback, 'hub.lease_seconds': '3600'
+    })
+    
+    assert response.status_code == 202
+    subscriber.wait()
+    params = subscriber.verifications[0]
+    assert params['hub.mode'] == 'subscribe'
+    assert params['hub.topic'] == TOPIC.format(feed.id)
+    assert params['hub.lease_seconds'] == '3600'
+    
+    wait_for_subscriptions(1)
+    subscription = WebSubSubscription.query.one()
+    assert subscription.callback == subscriber.callback
+    assert subscription.lease_expires_at > datetime.utcnow() + timedelta(seconds=3500)
+
+def test_unconfirmed_subscription_is_not_stored(client, feed, subscriber):
+    subscriber.echo = False
+    
+    client.post('/websub/hub', data={
+        'hub.mode': 'subscribe', 'hub.topic': TOPIC.format(feed.id), 'hub.callback': subscriber.callback
+    })
+    
+    subscriber.wait()
+    # Give the hub's worker time to (not) store the subscription
+    time.sleep(0.2)
+    db.session.commit()
+    assert WebSubSubscription.query.count() == 0
+
+def test_subscription_to_private_feed_needs_token(client, feed, subscriber):
+    response = client.post('/websub/hub', data={
+        'hub.mode': 'subscribe', 'hub.topic': f'http://localhost/feeds/{feed.id}.rss?token=wrong',
+        'hub.callback': subscriber.callback
+    })
+    
+    assert response.status_code == 400
+    assert subscriber.verifications == []
+
+def test_new_post_is_pushed_signed(app, feed, fake_vk, subscriber):
+    fake_vk.posts = [make_post(1, 1700000000)]
+    with app.test_request_context():
+        create_feed_generator(feed).generate_feed()
+    subscribe(feed, subscriber.callback, secret='s3cret')
+    
+    fake_vk.posts.insert(0, make_post(2, 1700003600, 'Fresh post'))
+    with app.test_request_context():
+        content = create_feed_generator(feed).generate_feed(force_refresh=True)
+    
+    subscriber.wait()
+    headers, body = subscriber.deliveries[0]
+    assert body == content.encode('utf-8')
+    assert b'Fresh post' in body
+    expected = hmac.new(b's3cret', body, hashlib.sha256).hexdigest()
+    assert headers['X-Hub-Signature'] == f'sha256={expected}'
+    assert 'rel="hub"' in headers['Link'] and 'rel="self"' in headers['Link']
+
+def test_unchanged_feed_is_not_pushed(app, feed, fake_vk, subscriber):
+    fake_vk.posts = [make_post(1, 1700000000)]
+    with app.test_request_context():
+        create_feed_generator(feed).generate_feed()
+    subscribe(feed, subscriber.callback)
+    
+    with app.test_request_context():
+        create_feed_generator(feed).generate_feed(force_refresh=True)
+    
+    time.sleep(0.2)
+    assert subscriber.deliveries == []
+
+def test_delivery_retries_with_backoff(subscriber, monkeypatch):
+    delays = []
+    monkeypatch.setattr('websub.time.sleep', delays.append)
+    subscriber.statuses = [503, 500]
+    
+    delivered = hub._deliver(subscriber.callback, 'http://localhost/feeds/1.rss', None,
+                             'http://localhost/websub/hub', b'<rss/>', max_retries=3, timeout=5)
+    
+    assert delivered
+    assert len(subscriber.deliveries) == 3
+    assert delays == [1, 2]
+
+def test_delivery_gives_up_after_retries(subscriber, monkeypatch):
+    delays = []
+    monkeypatch.setattr('websub.time.sleep', delays.append)
+    subscriber.statuses = [503] * 10
+    
+    delivered = hub._deliver(subscriber.callback, 'http://localhost/feeds/1.rss', None,
+                             'http://localhost/websub/hub', b'<rss/>', max_retries=2, timeout=5)
+    
+    assert not delivered
+    assert len(subscriber.deliveries) == 3
+    assert delays == [1, 2]
+
+def test_expired_subscription_gets_no_updates(app, feed, subscriber):
+    subscribe(feed, subscriber.callback, lease_expires_at=datetime.utcnow() - timedelta(seconds=1))
+    
+    with app.test_request_context():
+        assert hub.publish(feed, '<rss/>') == 0
+    assert get_due_push_feed_ids() == []
+    assert WebSubSubscription.query.count() == 0
@@ -1 +1,244 @@
+import hashlib
+import importlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 
+from flask import current_app
+
+from models import Translation, dialect_insert
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# Languages offered in the feed forms (code, label)
+TRANSLATION_LANGUAGES = [
+    ('es', 'Español'),
+    ('en', 'English'),
+    ('de', 'Deutsch'),
+    ('fr', 'Français'),
+    ('it', 'Italiano'),
+    ('pt', 'Português'),
+]
+
+class TranslationError(Exception):
+    """Exception raised when a backend cannot translate a text."""
+    pass
+
+def content_hash(text):
+    """Return the cache key of a source text."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class TranslationBackend(ABC):
+    """
+    Base class of translation backends.
+    
+    Subclasses implement ``translate``; ``translate_batch`` runs it for
+    several texts on the shared, size-limited translation pool.
+    """
+    
+    name = 'base'
+    
+    @abstractmethod
+    def translate(self, text, target_lang):
+        """
+        Translate one text.
+        
+        Args:
+            text: Source text
+            target_lang: Target language code
+        
+        Returns:
+            Translated text
+        
+        Raises:
+            TranslationError: If the text could not be translated
+        """
+    
+    def translate_batch(self, texts, target_lang):
+        """
+        Translate several texts concurrently.
+        
+        Args:
+            texts: List of source texts
+            target_lang: Target language code
+        
+        Returns:
+            List of translated texts, None where translation failed
+        """
+        app = current_app._get_current_object()
+        
+        def translate_one(text):
+            # Pool threads need the app context for configuration
+            with app.app_context():
+                try:
+                    return self.translate(text, target_lang)
+                except Exception as e:
+                    logger.warning(f"{self.name} translation to {target_lang} failed: {e}")
+                    return None
+        
+        return list(get_executor().map(translate_one, texts))
+
+class LocalBackend(TranslationBackend):
+    """Offline stand-in that tags texts with the target language, for tests."""
+    
+    name = 'local'
+    
+    def translate(self, text, target_lang):
+        return f"[{target_lang}] {text}"
+
+class TranslateLibBackend(TranslationBackend):
+    """Backend using the ``translate`` package (MyMemory by default)."""
+    
+    name = 'translate'
+    
+    # MyMemory rejects queries longer than this
+    MAX_QUERY_CHARS = 500
+    
+    def translate(self, text, target_lang):
+        from translate import Translator
+        
+        config = current_app.config
+        translator = Translator(
+            to_lang=target_lang,
+            from_lang=config.get('TRANSLATION_SOURCE_LANG', 'ru'),
+            provider=config.get('TRANSLATION_PROVIDER') or None,
+            secret_access_key=config.get('TRANSLATION_API_KEY') or None,
+            email=config.get('TRANSLATION_EMAIL') or None
+        )
+        parts = []
+        for chunk in split_text(text, self.MAX_QUERY_CHARS):
+            if not chunk.strip():
+                parts.append(chunk)
+                continue
+            translated = translator.translate(chunk)
+            # Quota and error messages come back as the "translation"
+            if not translated or translated.startswith('MYMEMORY WARNING'):
+                raise TranslationError(translated or 'Empty translation')
+            parts.append(translated)
+        return '\n'.join(parts)
+
+def split_text(text, max_chars):
+    """
+    Split text into lines grouped into chunks of at most ``max_chars``.
+    
+    Lines longer than the limit are cut at whitespace where possible.
+    
+    Returns:
+        List of chunks, to be joined again with newlines
+    """
+    chunks = []
+    current = None
+    for line in text.split('\n'):
+        while len(line) > max_chars:
+            cut = line.rfind(' ', 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current is not None:
+                chunks.append(current)
+                current = None
+            chunks.append(line[:cut])
+            line = line[cut:].lstrip(' ')
+        if current is not None and len(current) + 1 + len(line) <= max_chars:
+            current = f"{current}\n{line}"
+        else:
+            if current is not None:
+                chunks.append(current)
+            current = line
+    if current is not None:
+        chunks.append(current)
+    return chunks
+
+BACKENDS = {
+    'local': LocalBackend,
+    'translate': TranslateLibBackend,
+}
+
+_backends = {}
+_executor = None
+_lock = threading.Lock()
+
+def get_backend():
+    """
+    Get the configured translation backend.
+    
+    TRANSLATION_BACKEND is 'translate', 'local' or 'package.module:Class'
+    for a custom TranslationBackend subclass.
+    """
+    name = current_app.config.get('TRANSLATION_BACKEND', 'translate')
+    with _lock:
+        if name not in _backends:
+            if name in BACKENDS:
+                backend_class = BACKENDS[name]
+            else:
+                module_name, _, class_name = name.partition(':')
+                backend_class = getattr(importlib.import_module(module_name), class_name)
+            _backends[name] = backend_class()
+        return _backends[name]
+
+def get_executor():
+    """Get the pool bounding concurrent translation requests across all feeds."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=current_app.config.get('TRANSLATION_MAX_WORKERS', 4),
+                thread_name_prefix='translate'
+            )
+        return _executor
+
+def translate_texts(texts, target_lang):
+    """
+    Translate texts, reusing cached translations.
+    
+    Translations are stored by content hash and target language, so an
+    unchanged text is translated once no matter how often feeds are
+    rebuilt. Texts whose translation fails are returned unchanged and
+    retried on the next call.
+    
+    Args:
+        texts: Iterable of source texts
+        target_lang: Target language code
+    
+    Returns:
+        Dict mapping each source text to its translation
+    """
+    unique = list(dict.fromkeys(text for text in texts if text and text.strip()))
+    if not unique:
+        return {}
+    hashes = {text: content_hash(text) for text in unique}
+    
+    cached = {}
+    hash_list = list(hashes.values())
+    for start in range(0, len(hash_list), 500):
+        cached.update(db.session.query(Translation.content_hash, Translation.text)
+                      .filter(Translation.target_lang == target_lang)
+                      .filter(Translation.content_hash.in_(hash_list[start:start + 500])))
+    
+    missing = [text for text in unique if hashes[text] not in cached]
+    if missing:
+        backend = get_backend()
+        results = backend.translate_batch(missing, target_lang)
+        
+        rows = [{'content_hash': hashes[text], 'target_lang': target_lang, 'text': result, 'backend': backend.name}
+                for text, result in zip(missing, results) if result is not None]
+        if rows:
+            _store(rows)
+            cached.update((row['content_hash'], row['text']) for row in rows)
+        logger.info(f"Translated {len(rows)} of {len(missing)} new texts to {target_lang} "
+                    f"({len(unique) - len(missing)} cached)")
+    
+    return {text: cached[hashes[text]] for text in unique if hashes[text] in cached}
+
+def _store(rows):
+    """Insert translations, ignoring ones stored concurrently."""
+    insert = dialect_insert(Translation)
+    if insert is not None:
+        db.session.execute(insert.values(rows).on_conflict_do_nothing(
+            index_elements=['content_hash', 'target_lang']))
+    else:
+        existing = {row.content_hash for row in Translation.query.filter(
+            Translation.target_lang == rows[0]['target_lang'],
+            Translation.content_hash.in_([row['content_hash'] for row in rows]))}
+        db.session.add_all(Translation(**row) for row in rows if row['content_hash'] not in existing)
+    db.session.commit()
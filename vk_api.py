@@ -1,90 +1,444 @@
+import codecs
+import json
 import logging
-import requests
+import re
+import threading
 import time
 from datetime import datetime
 from flask import current_app
 
+from post_text import render_post_text, escape_html, escape_url
+from media_proxy import media_url
+from vk_scheduler import FairScheduler
+
 logger = logging.getLogger(__name__)
 
+# wall.get returns at most this many posts per call
+WALL_GET_MAX_COUNT = 100
+
+# IDs accepted per users.get / groups.getById / wall.getById call
+USERS_GET_MAX_IDS = 1000
+GROUPS_GET_MAX_IDS = 500
+WALL_GET_BY_ID_MAX_IDS = 100
+
+# Start of the item list in a streamed list response and its total count
+ITEMS_RE = re.compile(r'"items"\s*:\s*\[')
+COUNT_RE = re.compile(r'"count":\s*(\d+)')
+
+# Photo size types from the smallest to the largest proportional variant;
+# o/p/q/r are cropped thumbnails and rank below the full-size x
+PHOTO_SIZE_RANK = {t: rank for rank, t in enumerate(['s', 'm', 'o', 'p', 'q', 'r', 'x', 'y', 'z', 'w'], start=1)}
+
 class VKAPIError(Exception):
     """Exception raised for VK API errors."""
-    pass
+    
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+class RateLimiter:
+    """Thread-safe limiter spacing calls evenly at a fixed rate."""
+    
+    def __init__(self, rate):
+        """
+        Initialize the limiter.
+        
+        Args:
+            rate: Maximum number of calls per second
+        """
+        self.interval = 1.0 / rate if rate else 0
+        self._next_call = 0.0
+        self._lock = threading.Lock()
+        
+    def next_available(self):
+        """Return the monotonic time at which the next call may start."""
+        return self._next_call
+        
+    def wait(self):
+        """Block until the next call is allowed."""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_call - now
+            self._next_call = max(now, self._next_call) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+class TokenState:
+    """Rate budget, health and usage counters of one VK access token."""
+    
+    def __init__(self, token, rate):
+        self.token = token
+        self.limiter = RateLimiter(rate)
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self.cooldown_until = 0.0
+        self.last_error = None
+        
+    def is_available(self, now):
+        """Return True if the token is not cooling down."""
+        return self.cooldown_until <= now
+        
+    def stats(self, now):
+        """
+        Get usage statistics of the token.
+        
+        Args:
+            now: Current monotonic time
+            
+        Returns:
+            Dictionary with a masked token and its counters
+        """
+        return {
+            'token': f"...{self.token[-4:]}" if self.token else '',
+            'rate': round(1.0 / self.limiter.interval, 2) if self.limiter.interval else None,
+            'healthy': self.is_available(now),
+            'cooldown_seconds': max(0, round(self.cooldown_until - now)),
+            'in_flight': self.in_flight,
+            'calls': self.calls,
+            'errors': self.errors,
+            'last_error': self.last_error
+        }
+
+class TokenPool:
+    """
+    Pool of VK access tokens with per-token budgets and failover.
+    
+    Each call is scheduled to the healthy token whose rate budget frees up
+    first. Tokens that fail with an authorization or rate-limit error are
+    put on cool-down and the call is retried with another token.
+    """
+    
+    # VK error codes that take a token out of rotation, with the cool-down
+    # config key and its default in seconds
+    COOLDOWNS = {
+        5: ('VK_TOKEN_AUTH_COOLDOWN', 3600),      # User authorization failed (revoked/expired token)
+        6: ('VK_TOKEN_FLOOD_COOLDOWN', 1),        # Too many requests per second
+        29: ('VK_TOKEN_QUOTA_COOLDOWN', 3600),    # Rate limit reached (daily method quota)
+    }
+    
+    def __init__(self, tokens, default_rate, slots_per_token=2):
+        """
+        Initialize the pool.
+        
+        Args:
+            tokens: List of tokens, each optionally suffixed with '@<rate>'
+            default_rate: Calls per second for tokens without their own rate
+            slots_per_token: Calls admitted at once per token by the fair scheduler
+        """
+        self._lock = threading.Lock()
+        self.tokens = []
+        for entry in tokens:
+            token, _, rate = entry.partition('@')
+            self.tokens.append(TokenState(token, float(rate) if rate else default_rate))
+        # Calls queue here, in fair order across users, rather than on the limiters
+        self.scheduler = FairScheduler(len(self.tokens) * slots_per_token)
+            
+    def __len__(self):
+        return len(self.tokens)
+        
+    def acquire(self, exclude=()):
+        """
+        Pick the least-loaded healthy token and mark it in use.
+        
+        Args:
+            exclude: Tokens already tried for the current call
+            
+        Returns:
+            TokenState instance
+            
+        Raises:
+            VKAPIError: If every token is cooling down or excluded
+        """
+        with self._lock:
+            now = time.monotonic()
+            candidates = [t for t in self.tokens if t.is_available(now) and t.token not in exclude]
+            if not candidates:
+                raise VKAPIError("No healthy VK API token available")
+            state = min(candidates, key=lambda t: (max(t.limiter.next_available(), now), t.in_flight))
+            state.in_flight += 1
+            return state
+        
+    def release(self, state, error_code=None, cooldowns=None):
+        """
+        Return a token after a call and record its outcome.
+        
+        Args:
+            state: TokenState returned by acquire
+            error_code: VK error code of the call, if it failed
+            cooldowns: Mapping of error code to cool-down seconds
+        """
+        with self._lock:
+            state.in_flight -= 1
+            state.calls += 1
+            if error_code is not None:
+                state.errors += 1
+                state.last_error = error_code
+                cooldown = (cooldowns or {}).get(error_code)
+                if cooldown:
+                    state.cooldown_until = time.monotonic() + cooldown
+                    logger.warning(f"VK token ...{state.token[-4:]} cooling down for {cooldown}s after error {error_code}")
+        
+    def stats(self):
+        """Return usage statistics of every token in the pool."""
+        now = time.monotonic()
+        with self._lock:
+            return [state.stats(now) for state in self.tokens]
+
+class ItemStream:
+    """
+    Incrementally decoded VK list response (``{"count": N, "items": [...]}``).
+    
+    The body is read in chunks and each item is decoded as soon as it is
+    complete, so neither the whole body nor the whole JSON tree is held in
+    memory at once. Fields after ``items`` (``profiles``, ``groups``) are
+    available in ``extra`` once the items are exhausted.
+    """
+    
+    CHUNK_SIZE = 64 * 1024
+    
+    def __init__(self, response):
+        """
+        Read the response up to the first item.
+        
+        Args:
+            response: requests response opened with ``stream=True``
+        """
+        self._response = response
+        self._chunks = response.iter_content(self.CHUNK_SIZE)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._items = None
+        self.count = None
+        self.extra = {}
+        self.error = None
+        self._read_header()
+        
+    def _read(self):
+        """Append the next chunk to the buffer; return False at the end of the body."""
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._buffer += self._decoder.decode(b'', final=True)
+            return False
+        self._buffer += self._decoder.decode(chunk)
+        return True
+        
+    def _read_header(self):
+        while True:
+            items = ITEMS_RE.search(self._buffer)
+            if items and not self._buffer.lstrip().startswith('{"error"'):
+                match = COUNT_RE.search(self._buffer, 0, items.start())
+                self.count = int(match.group(1)) if match else None
+                self._pos = items.end()
+                return
+            if not self._read():
+                break
+        
+        # No item list (an error or an unexpected shape): decode it whole
+        data = json.loads(self._buffer)
+        self._buffer = ''
+        self._response.close()
+        if 'error' in data:
+            self.error = data['error']
+            return
+        response = data.get('response')
+        if not isinstance(response, dict):
+            self._items = []
+            return
+        self._items = response.pop('items', [])
+        self.count = response.pop('count', None)
+        self.extra = response
+        
+    def __iter__(self):
+        if self._items is not None:
+            yield from self._items
+            self._items = []
+            return
+        try:
+            while True:
+                # Skip separators
+                while True:
+                    while self._pos < len(self._buffer) and self._buffer[self._pos] in ' \t\r\n,':
+                        self._pos += 1
+                    if self._pos < len(self._buffer) or not self._read():
+                        break
+                if self._pos >= len(self._buffer):
+                    raise VKAPIError("Truncated VK API response")
+                if self._buffer[self._pos] == ']':
+                    self._read_trailer()
+                    return
+                try:
+                    item, end = self._json.raw_decode(self._buffer, self._pos)
+                except ValueError:
+                    if not self._read():
+                        raise VKAPIError("Truncated VK API response")
+                    continue
+                self._pos = end
+                # Drop decoded text once it makes up most of the buffer
+                if self._pos > len(self._buffer) // 2:
+                    self._buffer = self._buffer[self._pos:]
+                    self._pos = 0
+                yield item
+        finally:
+            self._response.close()
+            
+    def _read_trailer(self):
+        """Decode the fields following the items array."""
+        while self._read():
+            pass
+        rest = self._buffer[self._pos + 1:].strip()
+        self._buffer = ''
+        if rest.startswith(','):
+            rest = rest[1:]
+        # rest closes both the response object and the envelope
+        self.extra, _ = self._json.raw_decode('{' + rest)
+
 
 class VKAPIClient:
     """Client for interacting with the VK API."""
     
-    def __init__(self, access_token=None, api_version=None):
+    # One pool per token list, shared by every client in the process
+    _token_pools = {}
+    _token_pools_lock = threading.Lock()
+    
+    def __init__(self, access_token=None, api_version=None, user=None, interactive=False):
         """
         Initialize the VK API client.
         
         Args:
-            access_token: VK API access token, defaults to app config
+            access_token: VK API access token, defaults to the app's token pool
             api_version: VK API version, defaults to app config
+            user: User whose share of the API capacity the calls use (None for system work)
+            interactive: Whether a user waits for the calls (scheduled before background work)
         """
-        self.access_token = access_token or current_app.config.get('VK_API_TOKEN')
+        tokens = [access_token] if access_token else current_app.config.get('VK_API_TOKENS') or [current_app.config.get('VK_API_TOKEN')]
         self.api_version = api_version or current_app.config.get('VK_API_VERSION')
-        self.base_url = "https://api.vk.com/method/"
+        self.base_url = current_app.config.get('VK_API_URL', "https://api.vk.com/method/")
+        self.timeout = current_app.config.get('VK_API_TIMEOUT', 30)
+        self.token_pool = self.get_token_pool(tokens, current_app.config.get('VK_API_RATE_LIMIT', 3),
+                                              current_app.config.get('VK_SCHEDULER_SLOTS_PER_TOKEN', 2))
+        self.user_id = user.id if user is not None else None
+        self.weight = current_app.config.get('VK_QUOTA_WEIGHTS', {}).get(user.username, 1.0) if user is not None else 1.0
+        self.interactive = interactive
+        self.cooldowns = {
+            code: current_app.config.get(key, default)
+            for code, (key, default) in TokenPool.COOLDOWNS.items()
+        }
         
-    def _make_request(self, method, params=None):
+    @classmethod
+    def get_token_pool(cls, tokens, rate, slots_per_token=2):
+        """
+        Get the process-wide pool for a list of access tokens.
+        
+        Args:
+            tokens: List of VK API access tokens
+            rate: Default maximum number of calls per second per token
+            slots_per_token: Calls admitted at once per token by the fair scheduler
+            
+        Returns:
+            TokenPool instance
+        """
+        key = tuple(tokens)
+        with cls._token_pools_lock:
+            pool = cls._token_pools.get(key)
+            if pool is None:
+                pool = cls._token_pools[key] = TokenPool(tokens, rate, slots_per_token)
+            return pool
+        
+    def _make_request(self, method, params=None, stream=False):
         """
         Make a request to the VK API.
         
+        Calls failing with a token error (5, 6 or 29) are retried with the
+        next healthy token of the pool.
+        
         Args:
             method: API method name
             params: Dictionary of parameters to pass to the API
+            stream: Decode a list response incrementally instead of loading it
             
         Returns:
-            JSON response from the API
+            JSON response from the API, or an ItemStream when streaming
             
         Raises:
             VKAPIError: If the API returns an error
         """
+        # Imported on first use to keep worker boot fast
+        import requests
+        
         if params is None:
             params = {}
             
         # Add common parameters
-        params['access_token'] = self.access_token
         params['v'] = self.api_version
         
-        # Make the request
+        # Make the request once it is this caller's turn
         url = f"{self.base_url}{method}"
-        try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Check for API error
-            if 'error' in data:
-                error = data['error']
-                error_msg = f"VK API error {error.get('error_code')}: {error.get('error_msg')}"
-                logger.error(error_msg)
-                raise VKAPIError(error_msg)
-                
-            return data.get('response')
-            
-        except requests.RequestException as e:
-            logger.error(f"Error making request to VK API: {e}")
-            raise VKAPIError(f"Request to VK API failed: {e}")
+        tried = set()
+        with self.token_pool.scheduler.slot(self.user_id, self.weight, self.interactive):
+            while True:
+                token = self.token_pool.acquire(exclude=tried)
+                tried.add(token.token)
+                error_code = None
+                try:
+                    token.limiter.wait()
+                    params['access_token'] = token.token
+                    response = requests.get(url, params=params, stream=stream, timeout=self.timeout)
+                    response.raise_for_status()
+                    data = ItemStream(response) if stream else response.json()
+                    
+                    # Check for API error
+                    error = data.error if stream else data.get('error')
+                    if error:
+                        error_code = error.get('error_code')
+                        error_msg = f"VK API error {error_code}: {error.get('error_msg')}"
+                        logger.error(error_msg)
+                        raise VKAPIError(error_msg, code=error_code)
+                        
+                    return data if stream else data.get('response')
+                    
+                except requests.RequestException as e:
+                    logger.error(f"Error making request to VK API: {e}")
+                    raise VKAPIError(f"Request to VK API failed: {e}")
+                except VKAPIError:
+                    # Fail over to another token on token-specific errors
+                    if error_code in self.cooldowns and len(tried) < len(self.token_pool):
+                        continue
+                    raise
+                finally:
+                    self.token_pool.release(token, error_code, self.cooldowns)
         
-    def get_wall_posts(self, owner_id, count=20, offset=0, own=None, filter_type=None):
+    def get_wall_posts(self, owner_id, count=20, offset=0, own=None, filter_type=None,
+                       extended=False, fields=None, stream=False):
         """
         Get posts from a user or community wall.
         
         Args:
             owner_id: ID of the user or community (negative for communities) or domain
-            count: Number of posts to retrieve
+            count: Number of posts to retrieve (at most WALL_GET_MAX_COUNT)
             offset: Offset for pagination
             own: If True, get only owner's posts (default: None)
             filter_type: Filter for types of posts (all, owner, others)
+            extended: Also return the profiles and groups of the post authors
+            fields: Extra profile/group fields to return with ``extended``
+            stream: Return an ItemStream decoding posts as they arrive
             
         Returns:
-            List of wall posts
+            Response in wall.get format, or an ItemStream when streaming
         """
         params = {
-            'count': count,
-            'offset': offset,
-            'extended': 1  # Get extended information (profiles, groups)
+            'count': min(count, WALL_GET_MAX_COUNT),
+            'offset': offset
         }
+        # profiles/groups arrays are large; only ask for them when used
+        if extended:
+            params['extended'] = 1
+            if fields:
+                params['fields'] = fields
         
         # Parse URL parameters if this is a wall URL with query string
         url_params = {}
@@ -116,7 +470,63 @@ class VKAPIClient:
         else:
             params['domain'] = owner_id
         
-        return self._make_request('wall.get', params)
+        return self._make_request('wall.get', params, stream=stream)
+    
+    def iter_wall_posts(self, owner_id, count=20, offset=0, page_info=None, **kwargs):
+        """
+        Yield posts from a wall one at a time, paging past the wall.get limit.
+        
+        Each page is decoded incrementally as it is read from the network.
+        
+        Args:
+            owner_id: ID of the user or community (negative for communities) or domain
+            count: Total number of posts to retrieve
+            offset: Offset of the first post
+            page_info: Optional dict receiving 'count' (posts on the wall) and
+                the extra fields of the pages (profiles and groups are merged)
+            **kwargs: Extra arguments for get_wall_posts
+            
+        Yields:
+            VK posts
+        """
+        while count > 0:
+            stream = self.get_wall_posts(owner_id, count=count, offset=offset, stream=True, **kwargs)
+            received = 0
+            for post in stream:
+                received += 1
+                yield post
+            
+            if page_info is not None:
+                page_info['count'] = stream.count
+                for key, value in stream.extra.items():
+                    if isinstance(value, list):
+                        page_info.setdefault(key, []).extend(value)
+                    else:
+                        page_info[key] = value
+            
+            count -= received
+            offset += received
+            if not received or offset >= (stream.count or 0):
+                break
+    
+    def get_wall_posts_paged(self, owner_id, count=20, offset=0, **kwargs):
+        """
+        Get posts from a wall, paging past the per-call limit of wall.get.
+        
+        Args:
+            owner_id: ID of the user or community (negative for communities) or domain
+            count: Total number of posts to retrieve
+            offset: Offset of the first post
+            **kwargs: Extra arguments for get_wall_posts
+            
+        Returns:
+            Response in wall.get format with the items of all pages, or None
+        """
+        page_info = {}
+        items = list(self.iter_wall_posts(owner_id, count=count, offset=offset, page_info=page_info, **kwargs))
+        if not items:
+            return None
+        return dict(page_info, items=items)
     
     def get_group_info(self, group_id):
         """
@@ -162,6 +572,46 @@ class VKAPIClient:
         
         return self._make_request('users.get', params)
     
+    def get_users(self, user_ids):
+        """
+        Get the names of several users in one call.
+        
+        Args:
+            user_ids: List of numeric user IDs (at most USERS_GET_MAX_IDS)
+        
+        Returns:
+            List of users in users.get format
+        """
+        return self._make_request('users.get', {'user_ids': ','.join(str(user_id) for user_id in user_ids)}) or []
+    
+    def get_groups(self, group_ids):
+        """
+        Get the names of several communities in one call.
+        
+        Args:
+            group_ids: List of positive community IDs (at most GROUPS_GET_MAX_IDS)
+        
+        Returns:
+            List of communities in groups.getById format
+        """
+        return self._make_request('groups.getById', {'group_ids': ','.join(str(group_id) for group_id in group_ids)}) or []
+    
+    def get_posts_by_id(self, keys):
+        """
+        Get several wall posts in one call.
+        
+        Args:
+            keys: List of (owner_id, post_id) pairs (at most WALL_GET_BY_ID_MAX_IDS)
+            
+        Returns:
+            List of VK posts; deleted or hidden posts are left out by VK
+        """
+        response = self._make_request('wall.getById', {
+            'posts': ','.join(f"{owner_id}_{post_id}" for owner_id, post_id in keys)
+        })
+        # Newer API versions wrap the list in {"items": [...]}
+        return (response.get('items') if isinstance(response, dict) else response) or []
+    
     def resolve_screen_name(self, screen_name):
         """
         Resolve a screen name to get object type and ID.
@@ -264,18 +714,34 @@ def extract_vk_id_from_url(url):
     # If no patterns match, return the original string
     return url
 
-def get_source_info(source_type, source_id):
+def get_source_key(source_id):
+    """
+    Normalize a VK source ID or URL into a cache and lookup key.
+    
+    Args:
+        source_id: ID, screen name or URL of the source
+        
+    Returns:
+        Normalized source key
+    """
+    source_id = str(source_id).strip()
+    if '/' in source_id or 'vk.com' in source_id:
+        source_id = extract_vk_id_from_url(source_id)
+    return source_id.lower()
+
+def get_source_info(source_type, source_id, client=None):
     """
     Get information about a VK source (user, group, or page).
     
     Args:
         source_type: Type of the source ('user', 'group', 'page')
         source_id: ID of the source
+        client: VKAPIClient to make the calls with (scheduled as system work by default)
         
     Returns:
         Dictionary with information about the source
     """
-    client = VKAPIClient()
+    client = client or VKAPIClient()
     
     # Default to 'group' if no source type is provided
     if not source_type:
@@ -354,66 +820,119 @@ def get_source_info(source_type, source_id):
         'image': None
     }
 
-def format_post_content(post, include_attachments=True):
+def select_photo_size(sizes):
+    """
+    Pick the best variant of a photo.
+    
+    Variants are ranked by their VK size type; unknown types fall back to
+    their height. The list is not modified.
+    
+    Args:
+        sizes: List of size dicts from photo.sizes
+        
+    Returns:
+        Size dict of the best variant, or None if there are none
+    """
+    if not sizes:
+        return None
+    return max(sizes, key=lambda size: (PHOTO_SIZE_RANK.get(size.get('type'), 0), size.get('height') or 0))
+
+def compact_post(post):
+    """
+    Drop the photo variants a feed entry doesn't show.
+    
+    Every photo attachment, in the post and in its ``copy_history``, keeps
+    only the size select_photo_size picks. A build holds all the posts it
+    publishes until they are rendered, and the other variants and their
+    signed URLs are most of a photo-heavy post.
+    
+    Args:
+        post: VK post data
+        
+    Returns:
+        Copy of the post; the original is not modified
+    """
+    def compact_attachment(attachment):
+        photo = attachment.get('photo')
+        if attachment.get('type') != 'photo' or not photo or not photo.get('sizes'):
+            return attachment
+        return dict(attachment, photo=dict(photo, sizes=[select_photo_size(photo['sizes'])]))
+    
+    compact = dict(post)
+    if post.get('attachments'):
+        compact['attachments'] = [compact_attachment(attachment) for attachment in post['attachments']]
+    if post.get('copy_history'):
+        compact['copy_history'] = [compact_post(item) for item in post['copy_history']]
+    return compact
+
+def format_post_content(post, include_attachments=True, originals=None):
     """
     Format the content of a VK post for RSS.
     
     Args:
         post: VK post data
         include_attachments: Whether to include attachments
+        originals: Optional dict of reposted originals by (owner_id, post_id),
+            used in place of the ``copy_history`` entries
         
     Returns:
         HTML content for the post
     """
     content = []
     
-    # Add text content
+    # Add text content (escaped, with line breaks, mentions, hashtags and links)
     if post.get('text'):
-        content.append(f"<p>{post['text']}</p>")
+        content.append(f"<p>{render_post_text(post['text'])}</p>")
     
     # Process attachments if requested
     if include_attachments and 'attachments' in post:
         for attachment in post['attachments']:
             attachment_type = attachment.get('type')
             
+            # Titles and URLs come from other VK users: escape them and
+            # only link http(s) URLs
             if attachment_type == 'photo':
                 photo = attachment.get('photo', {})
-                # Find the largest size photo
-                sizes = photo.get('sizes', [])
-                if sizes:
-                    # Sort by height and take the largest
-                    sizes.sort(key=lambda s: s.get('height', 0), reverse=True)
-                    largest = sizes[0]
-                    img_url = largest.get('url')
-                    content.append(f'<p><img src="{img_url}" style="max-width:100%;" /></p>')
+                best = select_photo_size(photo.get('sizes', []))
+                if best and escape_url(best.get('url')):
+                    img_url = escape_html(media_url(best['url']))
+                    content.append(f'<p><img src="{img_url}" style="max-width:100%;" loading="lazy" /></p>')
             
             elif attachment_type == 'link':
                 link = attachment.get('link', {})
-                url = link.get('url')
-                title = link.get('title', url)
-                content.append(f'<p><a href="{url}" target="_blank">{title}</a></p>')
+                url = escape_url(link.get('url'))
+                if url:
+                    title = escape_html(link.get('title') or link['url'])
+                    content.append(f'<p><a href="{url}" target="_blank">{title}</a></p>')
             
             elif attachment_type == 'video':
                 video = attachment.get('video', {})
                 video_id = video.get('id')
                 owner_id = video.get('owner_id')
-                title = video.get('title', 'Video')
+                title = escape_html(video.get('title', 'Video'))
                 if video_id and owner_id:
-                    video_url = f"https://vk.com/video{owner_id}_{video_id}"
+                    video_url = escape_html(f"https://vk.com/video{owner_id}_{video_id}")
                     content.append(f'<p><a href="{video_url}" target="_blank">{title}</a></p>')
             
             elif attachment_type == 'doc':
                 doc = attachment.get('doc', {})
-                url = doc.get('url')
-                title = doc.get('title', 'Document')
-                if url:
+                title = escape_html(doc.get('title', 'Document'))
+                if escape_url(doc.get('url')):
+                    url = escape_html(media_url(doc['url']))
                     content.append(f'<p><a href="{url}" target="_blank">{title}</a></p>')
     
+    # Add the reposted posts, each with its own link; the outer post's
+    # copy_history already lists the whole chain
+    for item in post.get('copy_history') or []:
+        original = (originals or {}).get((item.get('owner_id'), item.get('id')), item)
+        original = dict(original, copy_history=None)
+        content.append(f"<blockquote>{format_post_content(original, include_attachments)}</blockquote>")
+    
     # Add a link to the original post
     owner_id = post.get('owner_id')
     post_id = post.get('id')
     if owner_id and post_id:
-        post_url = f"https://vk.com/wall{owner_id}_{post_id}"
+        post_url = escape_html(f"https://vk.com/wall{owner_id}_{post_id}")
         content.append(f'<p><a href="{post_url}" target="_blank">View original post on VK</a></p>')
     
     return "".join(content)
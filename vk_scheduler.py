@@ -0,0 +1,110 @@
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+# Scheduling classes, served in this order
+INTERACTIVE = 0
+BACKGROUND = 1
+
+class UserUsage:
+    """VK API consumption counters of one user."""
+    
+    def __init__(self):
+        self.calls = 0
+        self.interactive_calls = 0
+        self.wait_seconds = 0.0
+        self.queued = 0
+        self.in_flight = 0
+    
+    def stats(self):
+        return {
+            'calls': self.calls,
+            'interactive_calls': self.interactive_calls,
+            'avg_wait_ms': round(self.wait_seconds * 1000 / self.calls, 1) if self.calls else 0,
+            'queued': self.queued,
+            'in_flight': self.in_flight
+        }
+
+class FairScheduler:
+    """
+    Weighted fair queuing of VK API calls across users.
+    
+    At most ``slots`` calls run at once; the others wait here instead of in
+    the token rate limiters. Interactive calls go before background ones,
+    and within a class calls are ordered by virtual finish time: a user
+    with weight w advances by 1/w per call, so users with calls waiting
+    share the capacity in proportion to their weights however many calls
+    each has queued. Idle users do not build up credit.
+    """
+    
+    def __init__(self, slots):
+        """
+        Initialize the scheduler.
+        
+        Args:
+            slots: Maximum number of concurrent calls
+        """
+        self.slots = max(1, slots)
+        self._cond = threading.Condition()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._in_use = 0
+        self._virtual_time = 0.0
+        self._last_finish = {}
+        self._usage = {}
+    
+    @contextmanager
+    def slot(self, user_id=None, weight=1.0, interactive=False):
+        """
+        Wait for this caller's turn and hold a call slot.
+        
+        Args:
+            user_id: User the call is made for (None for system work)
+            weight: Share of the user relative to the default of 1
+            interactive: Whether a user is waiting for the call
+        """
+        self._acquire(user_id, weight, interactive)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_use -= 1
+                self._usage[user_id].in_flight -= 1
+                self._cond.notify_all()
+    
+    def _acquire(self, user_id, weight, interactive):
+        with self._cond:
+            usage = self._usage.setdefault(user_id, UserUsage())
+            start = max(self._virtual_time, self._last_finish.get(user_id, 0.0))
+            finish = start + 1.0 / max(weight, 0.01)
+            self._last_finish[user_id] = finish
+            entry = (INTERACTIVE if interactive else BACKGROUND, finish, next(self._sequence), start)
+            heapq.heappush(self._queue, entry)
+            usage.queued += 1
+            
+            queued_at = time.monotonic()
+            while self._in_use >= self.slots or self._queue[0] is not entry:
+                self._cond.wait()
+            heapq.heappop(self._queue)
+            self._in_use += 1
+            self._virtual_time = max(self._virtual_time, start)
+            
+            usage.queued -= 1
+            usage.in_flight += 1
+            usage.calls += 1
+            usage.interactive_calls += interactive
+            usage.wait_seconds += time.monotonic() - queued_at
+            # Let the next caller check whether a slot is still free
+            self._cond.notify_all()
+    
+    def stats(self):
+        """
+        Get per-user consumption.
+        
+        Returns:
+            Dict mapping user IDs (None for system work) to counters
+        """
+        with self._cond:
+            return {user_id: usage.stats() for user_id, usage in self._usage.items()}
@@ -0,0 +1,139 @@
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from flask import current_app
+from sqlalchemy import or_
+
+from models import User, VKFeed, FeedCache
+from feed_generator import create_feed_generator
+from leases import claim_lease, release_lease, keep_leases, feed_lease_key
+from vk_api import VKAPIClient, get_source_key
+from app import db
+
+logger = logging.getLogger(__name__)
+
+def select_feeds(built_before, usernames=(), sources=()):
+    """
+    Get the feeds whose cache is missing or was built before a given time.
+    
+    Feeds without a cache come first, then the least recently built.
+    
+    Args:
+        built_before: Naive UTC datetime; feeds cached since are skipped
+        usernames: Only feeds of these users, if given
+        sources: Only feeds reading from these VK sources (IDs, screen names
+            or URLs), if given; merged feeds match on any of their sources
+    
+    Returns:
+        List of feed IDs
+    """
+    query = (db.session.query(VKFeed)
+             .outerjoin(FeedCache, FeedCache.feed_id == VKFeed.id)
+             .filter(or_(FeedCache.cached_at.is_(None), FeedCache.cached_at < built_before))
+             .order_by(FeedCache.cached_at.isnot(None), FeedCache.cached_at, VKFeed.id))
+    if usernames:
+        query = query.join(User, User.id == VKFeed.user_id).filter(User.username.in_(usernames))
+    if not sources:
+        return [feed.id for feed in query]
+    
+    keys = {get_source_key(source) for source in sources}
+    return [feed.id for feed in query if keys.intersection(create_feed_generator(feed).get_source_keys())]
+
+def estimate_calls(feed_ids):
+    """
+    Estimate the VK API calls rebuilding feeds makes.
+    
+    Args:
+        feed_ids: List of feed IDs
+    
+    Returns:
+        Number of calls
+    """
+    return sum(create_feed_generator(feed).estimate_api_calls()
+               for feed in VKFeed.query.filter(VKFeed.id.in_(feed_ids)))
+
+def api_capacity():
+    """
+    Get the VK API calls per second the process' token pool allows.
+    
+    Returns:
+        Calls per second, or None if the tokens are not rate limited
+    """
+    rates = [token['rate'] for token in VKAPIClient().token_pool.stats()]
+    return None if None in rates else sum(rates)
+
+def _api_calls():
+    """Return the number of VK API calls made by this process so far."""
+    return sum(token['calls'] for token in VKAPIClient().token_pool.stats())
+
+def _build(app, feed_id, built_before):
+    """
+    Rebuild one feed in its own application and request context.
+    
+    Returns:
+        'built', 'skipped' (deleted, or rebuilt elsewhere since the feeds
+        were selected), 'leased' (being built elsewhere right now) or 'failed'
+    """
+    with app.test_request_context(base_url=app.config.get('SITE_URL')):
+        feed = db.session.get(VKFeed, feed_id)
+        if feed is None:
+            return 'skipped'
+        cached_at = db.session.query(FeedCache.cached_at).filter_by(feed_id=feed_id).scalar()
+        if cached_at is not None and cached_at >= built_before:
+            return 'skipped'
+        # The lease holder is building the feed; don't wait for it or count
+        # the stale copy a reader would get as built
+        lease_key = feed_lease_key(feed_id)
+        owner = claim_lease(lease_key)
+        if owner is None:
+            return 'leased'
+        try:
+            with keep_leases([lease_key], owner):
+                content = create_feed_generator(feed).generate_feed(force_refresh=True, leased=True)
+        except Exception as e:
+            logger.exception(f"Warm-up of feed_id={feed_id} failed: {e}")
+            db.session.rollback()
+            return 'failed'
+        finally:
+            release_lease(lease_key, owner)
+        # Failed builds return an error comment instead of a document
+        return 'failed' if content.startswith('<!--') else 'built'
+
+def warm_feeds(feed_ids, built_before, jobs, progress=None):
+    """
+    Rebuild feeds with bounded parallelism.
+    
+    Each rebuild takes the feed's refresh lease like any other build, and
+    VK calls go through the token pool, so the run stays within the rate
+    limit however many jobs run. Feeds rebuilt elsewhere since
+    ``built_before`` are skipped, and so are feeds whose lease another
+    worker holds, since that worker is rebuilding them.
+    
+    Args:
+        feed_ids: List of feed IDs, in build order
+        built_before: Naive UTC datetime the feeds were selected with
+        jobs: Maximum number of feeds built at once
+        progress: Optional callable receiving (done, counts, elapsed seconds,
+            VK calls made) after each feed
+    
+    Returns:
+        Counter of the feeds per outcome: 'built', 'skipped', 'leased', 'failed'
+    """
+    app = current_app._get_current_object()
+    start = time.monotonic()
+    calls_before = _api_calls()
+    counts = Counter()
+    with ThreadPoolExecutor(max_workers=max(1, jobs), thread_name_prefix='warmup') as executor:
+        futures = [executor.submit(_build, app, feed_id, built_before) for feed_id in feed_ids]
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                counts[future.result()] += 1
+                if progress is not None:
+                    progress(done, counts, time.monotonic() - start, _api_calls() - calls_before)
+        except BaseException:
+            # Let the builds in progress finish, drop the queued ones
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+    return counts
@@ -0,0 +1,198 @@
+import hashlib
+import hmac
+import logging
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
+
+from flask import current_app, url_for
+from werkzeug.exceptions import HTTPException
+
+from models import VKFeed, WebSubSubscription
+from app import db
+
+logger = logging.getLogger(__name__)
+
+class WebSubError(Exception):
+    """Exception raised for invalid WebSub subscription requests."""
+    pass
+
+def get_hub_url():
+    """Return the external URL of the built-in hub."""
+    return url_for('websub_hub', _external=True)
+
+def get_topic_url(feed):
+    """Return the topic URL of a feed (the URL readers subscribe to)."""
+    return url_for('get_feed', feed_id=feed.id, token=feed.access_token, _external=True)
+
+def resolve_topic(topic):
+    """
+    Find the feed a topic URL refers to and check it may be subscribed to.
+    
+    Args:
+        topic: Topic URL as sent in hub.topic
+        
+    Returns:
+        VKFeed instance
+        
+    Raises:
+        WebSubError: If the topic is not a feed of this site or the token is wrong
+    """
+    parsed = urlparse(topic or '')
+    try:
+        endpoint, args = current_app.url_map.bind('').match(parsed.path)
+    except HTTPException:
+        raise WebSubError('Topic is not a feed of this hub')
+    if endpoint != 'get_feed':
+        raise WebSubError('Topic is not a feed of this hub')
+    
+    feed = db.session.get(VKFeed, args['feed_id'])
+    token = parse_qs(parsed.query).get('token', [None])[0]
+    if feed is None or (not feed.is_public and feed.access_token != token):
+        raise WebSubError('Unknown topic')
+    return feed
+
+class WebSubHub:
+    """Built-in WebSub hub: verifies subscriptions and fans out updates."""
+    
+    def __init__(self):
+        self._executor = None
+        
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=current_app.config.get('WEBSUB_MAX_WORKERS', 8),
+                thread_name_prefix='websub'
+            )
+        return self._executor
+        
+    def subscribe(self, mode, topic, callback, lease_seconds=None, secret=None):
+        """
+        Accept a subscription request and verify the intent asynchronously.
+        
+        Args:
+            mode: 'subscribe' or 'unsubscribe'
+            topic: Topic URL
+            callback: Subscriber callback URL
+            lease_seconds: Requested lease duration
+            secret: Optional secret used to sign deliveries
+            
+        Raises:
+            WebSubError: If the request is invalid
+        """
+        if mode not in ('subscribe', 'unsubscribe'):
+            raise WebSubError('hub.mode must be subscribe or unsubscribe')
+        if urlparse(callback or '').scheme not in ('http', 'https'):
+            raise WebSubError('hub.callback must be an http(s) URL')
+        if secret and len(secret) >= 200:
+            raise WebSubError('hub.secret must be shorter than 200 bytes')
+        
+        feed = resolve_topic(topic)
+        max_lease = current_app.config.get('WEBSUB_MAX_LEASE_SECONDS', 30 * 24 * 3600)
+        try:
+            lease_seconds = int(lease_seconds or current_app.config.get('WEBSUB_LEASE_SECONDS', 10 * 24 * 3600))
+        except ValueError:
+            raise WebSubError('hub.lease_seconds must be an integer')
+        lease_seconds = max(60, min(lease_seconds, max_lease))
+        
+        app = current_app._get_current_object()
+        self._get_executor().submit(self._verify, app, feed.id, mode, topic, callback, lease_seconds, secret)
+        
+    def _verify(self, app, feed_id, mode, topic, callback, lease_seconds, secret):
+        """Verify the subscriber's intent and store or remove the subscription."""
+        import requests
+        
+        challenge = secrets.token_urlsafe(24)
+        params = {
+            'hub.mode': mode,
+            'hub.topic': topic,
+            'hub.challenge': challenge,
+            'hub.lease_seconds': lease_seconds
+        }
+        try:
+            response = requests.get(callback, params=params, timeout=app.config.get('WEBSUB_TIMEOUT', 10))
+            confirmed = 200 <= response.status_code < 300 and response.text.strip() == challenge
+        except requests.RequestException as e:
+            logger.warning(f"WebSub verification of {callback} failed: {e}")
+            confirmed = False
+        
+        if not confirmed:
+            logger.info(f"WebSub {mode} of {callback} for feed_id={feed_id} not confirmed")
+            return
+        
+        with app.app_context():
+            subscription = WebSubSubscription.query.filter_by(feed_id=feed_id, callback=callback).first()
+            if mode == 'unsubscribe':
+                if subscription:
+                    db.session.delete(subscription)
+            else:
+                if subscription is None:
+                    subscription = WebSubSubscription(feed_id=feed_id, callback=callback)
+                    db.session.add(subscription)
+                subscription.topic = topic
+                subscription.secret = secret
+                subscription.verified = True
+                subscription.lease_expires_at = datetime.utcnow() + timedelta(seconds=lease_seconds)
+            db.session.commit()
+            logger.info(f"WebSub {mode} of {callback} for feed_id={feed_id} confirmed")
+        
+    def publish(self, feed, content):
+        """
+        Queue delivery of new feed content to every active subscriber.
+        
+        Args:
+            feed: VKFeed model instance
+            content: Full RSS document to deliver
+            
+        Returns:
+            Number of deliveries queued
+        """
+        now = datetime.utcnow()
+        subscriptions = feed.websub_subscriptions.filter(
+            WebSubSubscription.verified.is_(True),
+            WebSubSubscription.lease_expires_at > now
+        ).all()
+        if not subscriptions:
+            return 0
+        
+        hub_url = get_hub_url()
+        max_retries = current_app.config.get('WEBSUB_MAX_RETRIES', 3)
+        timeout = current_app.config.get('WEBSUB_TIMEOUT', 10)
+        body = content.encode('utf-8')
+        executor = self._get_executor()
+        for subscription in subscriptions:
+            executor.submit(self._deliver, subscription.callback, subscription.topic, subscription.secret,
+                            hub_url, body, max_retries, timeout)
+        
+        logger.debug(f"Queued {len(subscriptions)} WebSub deliveries for feed_id={feed.id}")
+        return len(subscriptions)
+        
+    def _deliver(self, callback, topic, secret, hub_url, body, max_retries, timeout):
+        """POST the content to one subscriber, retrying with exponential backoff."""
+        import requests
+        
+        headers = {
+            'Content-Type': 'application/rss+xml; charset=utf-8',
+            'Link': f'<{hub_url}>; rel="hub", <{topic}>; rel="self"'
+        }
+        if secret:
+            signature = hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+            headers['X-Hub-Signature'] = f'sha256={signature}'
+        
+        for attempt in range(max_retries + 1):
+            try:
+                response = requests.post(callback, data=body, headers=headers, timeout=timeout)
+                if 200 <= response.status_code < 300:
+                    return True
+                logger.warning(f"WebSub delivery to {callback} returned {response.status_code}")
+            except requests.RequestException as e:
+                logger.warning(f"WebSub delivery to {callback} failed: {e}")
+            if attempt < max_retries:
+                time.sleep(2 ** attempt)
+        
+        logger.error(f"Giving up WebSub delivery to {callback} after {max_retries + 1} attempts")
+        return False
+
+hub = WebSubHub()